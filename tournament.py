@@ -1,73 +1,992 @@
 #!/usr/bin/env python
-# 
+#
 # tournament.py -- implementation of a Swiss-system tournament
 #
 
-# dbapi library to connect to PostgreSQL database
-import psycopg2
+# dbapi library to connect to PostgreSQL database. It is imported by
+# _driver() when the first connection is opened, so the in-memory backend,
+# the pairing functions and short-lived command line calls that fail before
+# connecting do not pay for loading it.
+psycopg2 = None
+
+# used for creating the opponents_table dictionary and the opponents cache
+from collections import defaultdict, OrderedDict
+
+# used for buffering rows streamed to the database with COPY
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
 
-# used for creating the opponents_table dictionary
-from collections import defaultdict
+# used for guarding the connection pool shared between threads
+import threading
+import time
 
-# used for gettung sys.maxint
-import sys
+# used for the compact columns of the pairing functions
+import array
+
+# used for naming server-side cursors and for exporting standings
+import csv
+import itertools
+import json
+
+# used for timing the functions and SQL statements when hooks are installed
+import tournament_stats
 
 # Global constanst for points. Tie earns 1 point, Win earns 3
 TIE_POINTS = 1
 WIN_POINTS = 3
 
-def connect():
+# Pairing modes of swissPairings(), and the default number of seconds the
+# optimal mode may search for a pairing without rematches
+GREEDY_PAIRING = 'greedy'
+OPTIMAL_PAIRING = 'optimal'
+PAIRING_TIME_BUDGET = 1.0
+
+# Connection string and pool size used by the module level functions
+DSN = "dbname=tournament"
+POOL_SIZE = 5
+
+# Number of tournaments whose opponents an OpponentsCache keeps. Pools do not
+# cache opponents unless created with an opponents_cache_size.
+OPPONENTS_CACHE_SIZE = 100
+
+# Total number of standings rows a StandingsCache keeps. Pools do not cache
+# standings unless created with standings_cache_rows.
+STANDINGS_CACHE_ROWS = 100000
+
+# Rows fetched per round trip by iterStandings(), and rows per page of
+# standingsPage()
+STANDINGS_FETCH_SIZE = 1000
+STANDINGS_PAGE_SIZE = 50
+
+
+# Numbers the server-side cursors, whose names must be unique per connection
+_cursor_numbers = itertools.count()
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became available in time."""
+
+
+def _copyValue(value):
+    """Formats a value as a field of PostgreSQL's COPY text format."""
+    if value is None:
+        return '\\N'
+    if not isinstance(value, str):
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        value = u'%s' % value
+        if str is bytes:
+            value = value.encode('utf-8')
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _pageOffset(page, page_size):
+    """Returns the number of rows before a page of standings."""
+    if page < 1:
+        raise ValueError("page numbers start at 1, got %r" % (page, ))
+    if page_size < 1:
+        raise ValueError("page_size must be positive, got %r" % (page_size, ))
+    return (page - 1) * page_size
+
+
+def tallyResults(results):
+    """Returns the matches and register updates for a list of match results.
+
+    Arg:
+      results: iterable of (winner, loser, tied) tuples as passed to
+               reportMatch(). A result where winner == loser is a Bye Game.
+
+    Returns:
+      A tuple (matches, deltas):
+        matches: list of (winner, loser, tied) rows for the matches table,
+                 bye games do not appear in the matches table
+        deltas: dictionary where key is player_id and value is the list
+                [points, wins, byes] to add to the player's register row
+    """
+    matches = []
+    deltas = {}
+    for winner, loser, tied in results:
+        tied = bool(tied)
+        if winner != loser:
+            matches.append((winner, loser, tied))
+        else:
+            # A bye game only counts in the register table
+            deltas.setdefault(winner, [0, 0, 0])[2] += 1
+        if tied:
+            # For a tied match, both players get an additional TIE_POINTS points
+            deltas.setdefault(winner, [0, 0, 0])[0] += TIE_POINTS
+            deltas.setdefault(loser, [0, 0, 0])[0] += TIE_POINTS
+        else:
+            # If not a tied game, the winner gets WIN_POINTS points and a win
+            delta = deltas.setdefault(winner, [0, 0, 0])
+            delta[0] += WIN_POINTS
+            delta[1] += 1
+    return matches, deltas
+
+
+def _driver():
+    """Returns the psycopg2 module, importing it on first use."""
+    global psycopg2
+    if psycopg2 is None:
+        import psycopg2.extensions
+    return psycopg2
+
+
+def connect(dsn = DSN):
     """Connect to the PostgreSQL database.  Returns a database connection."""
-    return psycopg2.connect("dbname=tournament")
+    driver = _driver()
+    if not tournament_stats.enabled():
+        return driver.connect(dsn)
+    start = time.time()
+    db = driver.connect(dsn)
+    tournament_stats.emit(tournament_stats.CONNECT, dsn, time.time() - start)
+    return db
+
+
+# Cursor class of sessions with tournament_stats hooks, see
+# _instrumentedCursor()
+_instrumented_cursor = None
+
+
+def _instrumentedCursor():
+    """Returns the InstrumentedCursor class. It derives from the cursor of
+    psycopg2, so it is defined on first use."""
+    global _instrumented_cursor
+    if _instrumented_cursor is not None:
+        return _instrumented_cursor
+
+    class InstrumentedCursor(_driver().extensions.cursor):
+        """Cursor passing the time and rows of its statements to the hooks of
+        tournament_stats. Sessions only use it while hooks are installed.
+
+        Rows read from a server-side cursor are timed per fetch instead.
+        """
+
+        def execute(self, query, vars = None):
+            self.statement = tournament_stats.statementName(query)
+            start = time.time()
+            try:
+                return super(InstrumentedCursor, self).execute(query, vars)
+            finally:
+                tournament_stats.emit(tournament_stats.QUERY, self.statement,
+                    time.time() - start, max(self.rowcount, 0))
+
+        def copy_from(self, file, table, *args, **kwargs):
+            start = time.time()
+            try:
+                return super(InstrumentedCursor, self).copy_from(file, table,
+                    *args, **kwargs)
+            finally:
+                tournament_stats.emit(tournament_stats.QUERY,
+                    'COPY %s' % table, time.time() - start,
+                    max(self.rowcount, 0))
+
+        def __iter__(self):
+            if self.name is None:
+                return super(InstrumentedCursor, self).__iter__()
+            return self._fetchBatches()
+
+        def _fetchBatches(self):
+            while True:
+                start = time.time()
+                rows = self.fetchmany(self.itersize)
+                tournament_stats.emit(tournament_stats.FETCH, self.statement,
+                    time.time() - start, len(rows))
+                if not rows:
+                    return
+                for row in rows:
+                    yield row
+
+    _instrumented_cursor = InstrumentedCursor
+    return InstrumentedCursor
+
+
+class OpponentsCache(object):
+    """Least recently used cache of the opponents of players per tournament.
+
+    Each entry maps player_id to the frozenset of the player's opponents in
+    one tournament. get() returns a copy of the entry, so it can be used while
+    writers report new matches with addMatches(), or call invalidate() when
+    matches are deleted.
+    Every write bumps the tournament's version, and put() only stores an
+    entry loaded at the current version, so a load that raced with a write
+    is never cached. Only writes made through the same cache are seen.
+    """
+
+    def __init__(self, size = OPPONENTS_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._versions = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def version(self, tournament_id):
+        """Returns the version to pass to put() for a load started now."""
+        with self._lock:
+            return self._versions[tournament_id]
+
+    def get(self, tournament_id):
+        """Returns the cached opponents of a tournament, or None."""
+        if self.size < 1:
+            return None
+        with self._lock:
+            opponents = self._entries.pop(tournament_id, None)
+            if opponents is None:
+                return None
+            # Move the entry to the most recently used end
+            self._entries[tournament_id] = opponents
+            return dict(opponents)
+
+    def put(self, tournament_id, opponents, version):
+        """Caches opponents loaded at the given version of the tournament."""
+        if self.size < 1:
+            return
+        with self._lock:
+            if self._versions[tournament_id] != version:
+                return
+            self._entries.pop(tournament_id, None)
+            self._entries[tournament_id] = dict(opponents)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last = False)
+
+    def addMatches(self, tournament_id, matches):
+        """Adds the players of newly recorded (winner, loser, tied) matches."""
+        with self._lock:
+            self._versions[tournament_id] += 1
+            opponents = self._entries.get(tournament_id)
+            if opponents is None:
+                return
+            for (winner, loser, tied) in matches:
+                opponents[winner] = opponents.get(winner, frozenset()) | \
+                    frozenset([loser])
+                opponents[loser] = opponents.get(loser, frozenset()) | \
+                    frozenset([winner])
+
+    def invalidate(self, tournament_id = None):
+        """Drops a tournament from the cache, or every tournament if None."""
+        with self._lock:
+            if tournament_id is None:
+                for cached_id in list(self._versions):
+                    self._versions[cached_id] += 1
+                self._entries.clear()
+            else:
+                self._versions[tournament_id] += 1
+                self._entries.pop(tournament_id, None)
+
+
+class StandingsCache(object):
+    """Least recently used cache of the standings of tournaments.
+
+    Entries are keyed by tournament and includeBye, and hold the rows
+    returned by playerStandings(). Like OpponentsCache, every write to a
+    tournament bumps its version with invalidate(), and put() only stores
+    standings read at the current version. The cache holds at most max_rows
+    rows in total; hits and misses are counted for stats().
+    """
+
+    def __init__(self, max_rows = STANDINGS_CACHE_ROWS):
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._rows = 0
+        self._entries = OrderedDict()
+        self._versions = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def version(self, tournament_id):
+        """Returns the version to pass to put() for a read started now."""
+        with self._lock:
+            return self._versions[tournament_id]
+
+    def get(self, tournament_id, includeBye):
+        """Returns the cached standings of a tournament, or None."""
+        if self.max_rows < 1:
+            # Disabled, as by default: no lock to take nor misses to count
+            return None
+        key = (tournament_id, bool(includeBye))
+        with self._lock:
+            standings = self._entries.pop(key, None)
+            if standings is None:
+                self.misses += 1
+                return None
+            # Move the entry to the most recently used end
+            self._entries[key] = standings
+            self.hits += 1
+            return list(standings)
+
+    def put(self, tournament_id, includeBye, standings, version):
+        """Caches standings read at the given version of the tournament."""
+        if self.max_rows < 1 or len(standings) > self.max_rows:
+            return
+        key = (tournament_id, bool(includeBye))
+        with self._lock:
+            if self._versions[tournament_id] != version:
+                return
+            self._rows -= len(self._entries.pop(key, ()))
+            self._entries[key] = tuple(standings)
+            self._rows += len(standings)
+            while self._rows > self.max_rows:
+                self._rows -= len(self._entries.popitem(last = False)[1])
+
+    def invalidate(self, tournament_id = None):
+        """Drops a tournament from the cache, or every tournament if None."""
+        with self._lock:
+            if tournament_id is None:
+                for cached_id in list(self._versions):
+                    self._versions[cached_id] += 1
+                self._entries.clear()
+                self._rows = 0
+                return
+            self._versions[tournament_id] += 1
+            for includeBye in (False, True):
+                self._rows -= len(self._entries.pop(
+                    (tournament_id, includeBye), ()))
+
+    def stats(self):
+        """Returns a dictionary of the hits, misses, entries and rows."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._entries), 'rows': self._rows}
+
+
+class TournamentPool(object):
+    """Thread-safe, bounded pool of connections to the tournament database.
+
+    At most maxconn connections are open at any time. acquire() hands out an
+    idle connection, opening a new one while the pool is below its bound, and
+    blocks when every connection is in use. release() returns it to the pool.
+
+    The pool also keeps the opponents of up to opponents_cache_size recently
+    paired tournaments in an OpponentsCache, and up to standings_cache_rows
+    rows of recently read standings in a StandingsCache, which its sessions
+    keep up to date. Both caches are off by default, as they do not see
+    writes made by other processes; only enable them, e.g. with
+    OPPONENTS_CACHE_SIZE and STANDINGS_CACHE_ROWS, when this pool is the only
+    writer of its tournaments.
+    """
+
+    def __init__(self, dsn = DSN, maxconn = POOL_SIZE,
+                 opponents_cache_size = 0, standings_cache_rows = 0):
+        if maxconn < 1:
+            raise ValueError("maxconn must be at least 1")
+        self.dsn = dsn
+        self.maxconn = maxconn
+        self.opponents_cache = OpponentsCache(opponents_cache_size)
+        self.standings_cache = StandingsCache(standings_cache_rows)
+        self._idle = []
+        self._opened = 0
+        self._closed = False
+        self._lock = threading.Condition()
+
+    def acquire(self, timeout = None):
+        """Returns a connection from the pool.
+
+        Arg:
+          timeout: seconds to wait for a connection when all of them are in
+                   use. None waits forever. PoolTimeout is raised on expiry.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("connection pool is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._opened < self.maxconn:
+                    # Reserve a slot, the connection is opened outside the lock
+                    self._opened += 1
+                    break
+                if deadline is None:
+                    self._lock.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            "no connection available after %s seconds" % timeout)
+                    self._lock.wait(remaining)
+        try:
+            return connect(self.dsn)
+        except Exception:
+            self._discard(None)
+            raise
+
+    def release(self, db):
+        """Returns a connection obtained from acquire() back to the pool.
+
+        Any transaction left open on the connection is rolled back. Connections
+        that are broken, or released after closeall(), are closed instead.
+        """
+        if not db.closed:
+            try:
+                db.rollback()
+            except _driver().Error:
+                db.close()
+        with self._lock:
+            if not db.closed and not self._closed:
+                self._idle.append(db)
+                self._lock.notify()
+                return
+        self._discard(db)
+
+    def _discard(self, db):
+        """Frees the slot held by db, closing the connection if still open."""
+        if db is not None and not db.closed:
+            db.close()
+        with self._lock:
+            self._opened -= 1
+            self._lock.notify()
+
+    def warmup(self, connections = 1):
+        """Opens connections ahead of their first use.
+
+        Up to connections connections, at most maxconn, are opened and left
+        idle in the pool, so the first calls do not wait for them. Can be
+        called from a thread while the caller prepares its first call.
+        """
+        opened = []
+        try:
+            for _ in range(min(connections, self.maxconn)):
+                opened.append(self.acquire())
+        finally:
+            for db in opened:
+                self.release(db)
+
+    def closeall(self):
+        """Closes idle connections, connections in use are closed on release."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+            self._lock.notify_all()
+        for db in idle:
+            db.close()
+
+    def session(self, timeout = None):
+        """Returns a TournamentSession running on a connection of this pool."""
+        return TournamentSession(self, timeout)
+
+
+class TournamentSession(object):
+    """Runs the tournament operations on a single pooled connection.
+
+    A session holds its connection until close() is called, so a sequence of
+    calls such as swissPairings() shares one connection. Sessions can be used
+    as context managers:
+
+        with pool.session() as session:
+            session.reportMatch(winner, loser)
+
+    The methods take the same arguments as the module level functions of the
+    same name, refer to those for documentation.
+    """
+
+    def __init__(self, pool, timeout = None):
+        self.pool = pool
+        self.db = pool.acquire(timeout)
+
+    def close(self):
+        """Releases the connection of this session back to its pool."""
+        if self.db is not None:
+            self.pool.release(self.db)
+            self.db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def cursor(self, name = None):
+        """Returns a cursor on the session's connection, timing its
+        statements if tournament_stats hooks are installed."""
+        if tournament_stats.enabled():
+            return self.db.cursor(name = name,
+                cursor_factory = _instrumentedCursor())
+        return self.db.cursor(name = name)
+
+    def createTournament(self, name):
+        c = self.cursor()
+        c.execute( "INSERT INTO tournaments ( name ) VALUES ( (%s) ) RETURNING id",
+            (name, ))
+        tournament_id = c.fetchall()[0][0]
+        self.db.commit()
+        return tournament_id
+
+    def deleteMatches(self, tournament_id = 1):
+        c = self.cursor()
+        c.execute( "DELETE FROM matches WHERE tournament_id = (%s)",
+            (tournament_id, )
+        )
+        # Reset the results of the players, only writing the rows of players
+        # who have any, so a reset tournament leaves no dead rows behind
+        sql = '''
+        UPDATE register
+            SET wins = 0, points = 0, byes = 0, matches = 0,
+                opponents_points = NULL
+            WHERE tournament_id = (%s) AND
+                  ( wins <> 0 OR points <> 0 OR byes <> 0 OR matches <> 0 OR
+                    opponents_points IS NOT NULL )
+        '''
+        c.execute(sql, (tournament_id, ))
+        self.db.commit()
+        self.pool.opponents_cache.invalidate(tournament_id)
+        self.pool.standings_cache.invalidate(tournament_id)
 
+    def deletePlayers(self):
+        c = self.cursor()
+        # Empty the matches, register, and players tables at once. TRUNCATE
+        # frees their storage right away instead of leaving dead rows to
+        # vacuum. The archive tables are kept.
+        c.execute( "TRUNCATE matches, register, players" )
+        self.db.commit()
+        self.pool.opponents_cache.invalidate()
+        self.pool.standings_cache.invalidate()
 
+    def archiveTournament(self, tournament_id):
+        if tournament_id == 1:
+            raise ValueError("the default tournament cannot be archived")
+        c = self.cursor()
+        # Move the matches, the final standings with the names of the players
+        # and the tournament itself to the archive tables in one transaction
+        c.execute('''
+        WITH moved AS (
+            DELETE FROM matches WHERE tournament_id = (%s)
+            RETURNING tournament_id, winner_id, loser_id, tied )
+        INSERT INTO archived_matches SELECT * FROM moved
+        ''', (tournament_id, ))
+        c.execute('''
+        WITH moved AS (
+            DELETE FROM register WHERE tournament_id = (%s) RETURNING * )
+        INSERT INTO archived_register
+            SELECT moved.tournament_id, moved.player_id, players.name,
+                   moved.wins, moved.points, moved.byes, moved.matches,
+                   moved.opponents_points
+            FROM moved LEFT JOIN players ON moved.player_id = players.id
+        ''', (tournament_id, ))
+        c.execute('''
+        WITH moved AS (
+            DELETE FROM tournaments WHERE id = (%s) RETURNING id, name )
+        INSERT INTO archived_tournaments ( id, name ) SELECT * FROM moved
+        ''', (tournament_id, ))
+        if c.rowcount != 1:
+            self.db.rollback()
+            raise ValueError("unknown tournament %r" % (tournament_id, ))
+        self.db.commit()
+        self.pool.opponents_cache.invalidate(tournament_id)
+        self.pool.standings_cache.invalidate(tournament_id)
+
+    def archivedStandings(self, tournament_id, includeBye = False):
+        columns = "player_id, name, wins, matches"
+        if includeBye == True:
+            columns += ", byes"
+        c = self.cursor()
+        c.execute('''
+        SELECT %s FROM archived_register
+            WHERE tournament_id = (%%s)
+            ORDER BY points DESC, opponents_points DESC, player_id
+        ''' % columns, (tournament_id, ))
+        return c.fetchall()
+
+    def countPlayers(self, tournament_id = 1):
+        c = self.cursor()
+        sql = '''
+        SELECT COUNT( player_id ) AS player_count
+            FROM register
+            WHERE tournament_id = (%s)
+        '''
+        c.execute(sql, (tournament_id, ))
+        result = c.fetchall()
+        return result[0][0]
+
+    def registerPlayer(self, name, tournament_id = 1):
+        c = self.cursor()
+        # Insert player into the players table
+        c.execute( "INSERT INTO players ( name ) VALUES ( (%s) ) RETURNING id",
+            (name, ))
+        # Using retuned id, insert player_id and tournament_id into register
+        player_id = c.fetchall()[0][0]
+        c.execute(
+            "INSERT INTO register ( tournament_id, player_id ) VALUES ( %s, %s )",
+            (tournament_id, player_id)
+        )
+        self.db.commit()
+        self.pool.standings_cache.invalidate(tournament_id)
+        return player_id
+
+    def registerPlayers(self, names, tournament_id = 1):
+        names = list(names)
+        if not names:
+            return []
+        c = self.cursor()
+        # Reserve the ids up front so they can be returned in input order
+        c.execute(
+            "SELECT nextval('players_id_seq') FROM generate_series(1, %s)",
+            (len(names), )
+        )
+        player_ids = sorted(row[0] for row in c.fetchall())
+        # Stream players and their registrations through COPY
+        players = StringIO()
+        register = StringIO()
+        for player_id, name in zip(player_ids, names):
+            players.write('%d\t%s\n' % (player_id, _copyValue(name)))
+            register.write('%d\t%d\n' % (tournament_id, player_id))
+        players.seek(0)
+        register.seek(0)
+        c.copy_from(players, 'players', columns = ('id', 'name'))
+        c.copy_from(register, 'register',
+            columns = ('tournament_id', 'player_id'))
+        self.db.commit()
+        self.pool.standings_cache.invalidate(tournament_id)
+        return player_ids
+
+    def playerStandings(self, tournament_id = 1, includeBye = False):
+        cache = self.pool.standings_cache
+        standings = cache.get(tournament_id, includeBye == True)
+        if standings is not None:
+            return standings
+        # Take the version before reading, a write committed meanwhile
+        # keeps the standings read here out of the cache
+        version = cache.version(tournament_id)
+        columns = "id, name, wins, matches"
+        if includeBye == True:
+            columns += ", byes"
+        standings = self._standings(tournament_id, columns)
+        cache.put(tournament_id, includeBye == True, standings, version)
+        return standings
+
+    def _standings(self, tournament_id, columns):
+        c = self.cursor()
+        # Return the player standings from the standings view. See tournament.sql.
+        sql = '''
+        SELECT %s FROM standings
+            WHERE tournament_id = (%%s)
+            ORDER BY points DESC, opponents_points DESC, id
+        ''' % columns
+        c.execute(sql, (tournament_id, ))
+        return c.fetchall()
+
+    def iterStandings(self, tournament_id = 1, includeBye = False,
+                      fetch_size = STANDINGS_FETCH_SIZE):
+        columns = "id, name, wins, matches"
+        if includeBye == True:
+            columns += ", byes"
+        # A named cursor keeps the result on the server, which sends it
+        # fetch_size rows at a time. It lives until the end of the current
+        # transaction, so the session must not commit while iterating.
+        c = self.cursor(name = 'standings_%d' % next(_cursor_numbers))
+        c.itersize = fetch_size
+        try:
+            c.execute('''
+            SELECT %s FROM standings
+                WHERE tournament_id = (%%s)
+                ORDER BY points DESC, opponents_points DESC, id
+            ''' % columns, (tournament_id, ))
+            for row in c:
+                yield row
+        finally:
+            c.close()
+
+    def standingsPage(self, tournament_id = 1, page = 1,
+                      page_size = STANDINGS_PAGE_SIZE, includeBye = False):
+        offset = _pageOffset(page, page_size)
+        columns = "id, name, wins, matches"
+        if includeBye == True:
+            columns += ", byes"
+        c = self.cursor()
+        # The order matches register_standings_idx, so only the rows up to
+        # the end of the page are read
+        c.execute('''
+        SELECT %s FROM standings
+            WHERE tournament_id = (%%s)
+            ORDER BY points DESC, opponents_points DESC, id
+            LIMIT (%%s) OFFSET (%%s)
+        ''' % columns, (tournament_id, page_size, offset))
+        return c.fetchall()
+
+    def reportMatch(self, winner, loser, tied = False, tournament_id = 1):
+        self.reportMatches([(winner, loser, tied)], tournament_id)
+
+    def reportMatches(self, results, tournament_id = 1):
+        matches, deltas = tallyResults(results)
+        c = self.cursor()
+        # Lock the register rows of the players and their opponents in
+        # player_id order before writing any, so that concurrent reports of
+        # the same tournament cannot deadlock. See lock_register().
+        players = set(deltas).union(m[1] for m in matches)
+        c.execute("SELECT lock_register( %s, %s )",
+            (tournament_id, sorted(players)))
+        if matches:
+            # Insert win/lose/tie info of all the matches into the matches table.
+            sql_insert_matches = '''
+            INSERT INTO matches ( tournament_id, winner_id, loser_id, tied )
+                SELECT %s, * FROM
+                unnest( %s::integer[], %s::integer[], %s::boolean[] )
+            '''
+            c.execute(sql_insert_matches, (tournament_id,
+                [m[0] for m in matches], [m[1] for m in matches],
+                [m[2] for m in matches])
+            )
+        if deltas:
+            # Apply points, wins and byes of every player in one statement
+            player_ids = sorted(deltas)
+            sql_update_register = '''
+            UPDATE register
+                SET points = register.points + delta.points,
+                    wins = register.wins + delta.wins,
+                    byes = register.byes + delta.byes
+                FROM unnest( %s::integer[], %s::integer[], %s::integer[],
+                             %s::integer[] ) AS delta ( player_id, points, wins, byes )
+                WHERE register.tournament_id = (%s) AND
+                      register.player_id = delta.player_id
+            '''
+            c.execute(sql_update_register, (player_ids,
+                [deltas[p][0] for p in player_ids],
+                [deltas[p][1] for p in player_ids],
+                [deltas[p][2] for p in player_ids], tournament_id)
+            )
+        self.db.commit()
+        self.pool.standings_cache.invalidate(tournament_id)
+        if matches:
+            self.pool.opponents_cache.addMatches(tournament_id, matches)
+
+    def getOpponents(self, tournament_id = 1):
+        # Create dictionary where key is player_id, value is list of opponents
+        opponents_table = defaultdict(list)
+        for player_id, opponents in self._opponentSets(tournament_id).items():
+            opponents_table[player_id].extend(opponents)
+        return opponents_table
+
+    def getMatches(self, tournament_id = 1):
+        c = self.cursor()
+        sql = '''
+        SELECT winner_id, loser_id, tied FROM matches
+            WHERE tournament_id = (%s)
+            ORDER BY id
+        '''
+        c.execute(sql, (tournament_id, ))
+        return c.fetchall()
+
+    def getRegister(self, tournament_id = 1):
+        c = self.cursor()
+        sql = '''
+        SELECT player_id, points, wins, byes FROM register
+            WHERE tournament_id = (%s)
+            ORDER BY player_id
+        '''
+        c.execute(sql, (tournament_id, ))
+        return c.fetchall()
+
+    def _opponentSets(self, tournament_id):
+        cache = self.pool.opponents_cache
+        opponents = cache.get(tournament_id)
+        if opponents is not None:
+            return opponents
+        version = cache.version(tournament_id)
+        c = self.cursor()
+        # Fetch opponents from opponents view in tournament.sql.
+        sql = '''
+            SELECT player_id, opponent_id FROM opponents
+            WHERE tournament_id = (%s)
+        '''
+        c.execute(sql, (tournament_id,))
+        opponents = defaultdict(set)
+        for row in c.fetchall():
+            opponents[row[0]].add(row[1])
+        opponents = dict((player_id, frozenset(opponent_ids))
+            for (player_id, opponent_ids) in opponents.items())
+        cache.put(tournament_id, opponents, version)
+        return opponents
+
+    def pairAllTournaments(self, tournament_ids, workers = 1,
+                           mode = GREEDY_PAIRING,
+                           time_budget = PAIRING_TIME_BUDGET):
+        tournament_ids = list(tournament_ids)
+        standings = dict((tournament_id, StandingsColumns.fromRows([]))
+            for tournament_id in tournament_ids)
+        c = self.cursor()
+        # Read the standings of all the tournaments in one query
+        sql = '''
+        SELECT tournament_id, id, name, wins, matches, byes, points
+            FROM standings
+            WHERE tournament_id = ANY (%s)
+            ORDER BY tournament_id, points DESC, opponents_points DESC, id
+        '''
+        c.execute(sql, (tournament_ids, ))
+        for row in c:
+            standings[row[0]].append(row[1:])
+        # Then the opponents of the tournaments that are not cached
+        cache = self.pool.opponents_cache
+        opponents = {}
+        missing = []
+        for tournament_id in tournament_ids:
+            opponents[tournament_id] = cache.get(tournament_id)
+            if opponents[tournament_id] is None:
+                missing.append(tournament_id)
+        if missing:
+            versions = dict((tournament_id, cache.version(tournament_id))
+                for tournament_id in missing)
+            sql = '''
+                SELECT tournament_id, player_id, opponent_id FROM opponents
+                WHERE tournament_id = ANY (%s)
+            '''
+            c.execute(sql, (missing, ))
+            loaded = dict((tournament_id, defaultdict(set))
+                for tournament_id in missing)
+            for row in c.fetchall():
+                loaded[row[0]][row[1]].add(row[2])
+            for tournament_id in missing:
+                opponents[tournament_id] = dict(
+                    (player_id, frozenset(opponent_ids))
+                    for (player_id, opponent_ids)
+                    in loaded[tournament_id].items())
+                cache.put(tournament_id, opponents[tournament_id],
+                    versions[tournament_id])
+        return pairTournaments(dict((tournament_id,
+            (standings[tournament_id], opponents[tournament_id]))
+            for tournament_id in tournament_ids), workers, mode, time_budget)
+
+    def swissPairings(self, tournament_id = 1, mode = GREEDY_PAIRING,
+                      time_budget = PAIRING_TIME_BUDGET, byes = None):
+        # Standings sorted by standing including tie breakers, with bye games
+        # and points as pairStandings() expects them. The rows are read into
+        # StandingsColumns one at a time.
+        c = self.cursor()
+        c.execute('''
+        SELECT id, name, wins, matches, byes, points FROM standings
+            WHERE tournament_id = (%s)
+            ORDER BY points DESC, opponents_points DESC, id
+        ''', (tournament_id, ))
+        standings = StandingsColumns.fromRows(c)
+        # opponents_table is a dictionary of players and their opponents
+        opponents_table = self._opponentSets(tournament_id)
+        return pairStandings(standings, opponents_table, mode, time_budget,
+            byes)
+
+
+# Pool of the default PostgreSQL backend, created on first use
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def getDefaultPool():
+    """Returns the connection pool of the default PostgreSQL backend."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = TournamentPool(DSN, POOL_SIZE)
+        return _default_pool
+
+
+# Backend used by the module level functions, None means getDefaultPool()
+_backend = None
+
+
+def setBackend(backend):
+    """Configures the storage backend used by the module level functions.
+
+    A backend is any object with a session() method returning a context
+    manager that has the tournament operations as methods, such as a
+    TournamentPool (PostgreSQL) or a tournament_memory.MemoryBackend.
+
+    Arg:
+      backend: the backend to use, None restores the default PostgreSQL pool
+    """
+    global _backend
+    _backend = backend
+
+
+def getBackend():
+    """Returns the storage backend used by the module level functions."""
+    if _backend is not None:
+        return _backend
+    return getDefaultPool()
+
+
+@tournament_stats.timed
+def createTournament(name):
+    """Adds a new tournament to the database.
+
+    Arg:
+      name: the name of the tournament
+
+    Returns:
+      The id of the tournament, to be passed as tournament_id to the other
+      functions.
+    """
+    with getBackend().session() as session:
+        return session.createTournament(name)
+
+
+@tournament_stats.timed
 def deleteMatches(tournament_id = 1):
     """Remove all the match records from the database for the given tournament.
+
+    The players stay registered, with their wins, points, byes and matches
+    played reset to 0.
     Arg:
       tournament_id: denotes the tournament to delete matches from
     """
-    db = connect()
-    c = db.cursor()
-    c.execute( "DELETE FROM matches WHERE tournament_id = (%s)", 
-        (tournament_id, )
-    )
-    db.commit()
-    db.close()
+    with getBackend().session() as session:
+        session.deleteMatches(tournament_id)
 
 
+@tournament_stats.timed
 def deletePlayers():
-    """Remove all the player records from the database."""
-    db = connect()
-    c = db.cursor()
-    # Delete player information from matches, register, and players tables
-    c.execute( "DELETE FROM matches" )
-    c.execute( "DELETE FROM register" )
-    c.execute( "DELETE FROM players" )
-    db.commit()
-    db.close()    
+    """Remove all the player records from the database.
+
+    Archived tournaments are kept, see archiveTournament().
+    """
+    with getBackend().session() as session:
+        session.deletePlayers()
+
 
+@tournament_stats.timed
+def archiveTournament(tournament_id):
+    """Moves a finished tournament out of the live tables.
 
+    The final standings, with the names of the players, and the matches of
+    the tournament are moved to archive tables, keeping the tables read by
+    the standings and pairings of running tournaments small. The players
+    themselves stay, they may be registered in other tournaments.
+    Arg:
+      tournament_id: the tournament to archive, not the default tournament 1
+    """
+    with getBackend().session() as session:
+        session.archiveTournament(tournament_id)
+
+
+@tournament_stats.timed
+def archivedStandings(tournament_id, includeBye = False):
+    """Returns the final standings of an archived tournament.
+
+    Args:
+      tournament_id: a tournament archived with archiveTournament()
+      includeBye: also return the number of byes, as playerStandings() does
+
+    Returns:
+      The rows playerStandings() returned when the tournament was archived,
+      or an empty list if the tournament was not archived.
+    """
+    with getBackend().session() as session:
+        return session.archivedStandings(tournament_id, includeBye)
+
+
+@tournament_stats.timed
 def countPlayers(tournament_id = 1):
     """Returns the number of players currently registered in a tournament.
     Arg:
         tournament_id: denotes the tournament (default is 'Tournament 1')
     """
-    db = connect()
-    c = db.cursor()
-    sql = '''
-    SELECT COUNT( player_id ) AS player_count 
-        FROM register 
-        WHERE tournament_id = (%s)
-    '''
-    c.execute(sql, (tournament_id, ))
-    result = c.fetchall()
-    db.close()
-    return result[0][0]  
+    with getBackend().session() as session:
+        return session.countPlayers(tournament_id)
 
 
+@tournament_stats.timed
 def registerPlayer(name, tournament_id = 1):
     """Adds a player to the tournament database in specified tournament_id.
-   
+
     Args:
       name: the player's full name (need not be unique).
       tournament_id: the tournament default is 'Tournament 1'
@@ -75,33 +994,39 @@ def registerPlayer(name, tournament_id = 1):
     Returns:
       For testing purposes, the id of player is returned.
     """
-    db = connect()
-    c = db.cursor()
-    # Insert player into the players table
-    c.execute( "INSERT INTO players ( name ) VALUES ( (%s) ) RETURNING id", 
-        (name, ))
-    db.commit()
-    # Using retuned id, insert player_id and tournament_id into register
-    player_id = c.fetchall()[0][0]
-    c.execute( 
-        "INSERT INTO register ( tournament_id, player_id ) VALUES ( %s, %s )", 
-        (tournament_id, player_id) 
-    )
-    db.commit()
-    db.close() 
-    return player_id   
+    with getBackend().session() as session:
+        return session.registerPlayer(name, tournament_id)
 
 
+@tournament_stats.timed
+def registerPlayers(names, tournament_id = 1):
+    """Adds many players to the tournament database in a single transaction.
+
+    Players and their registrations are streamed with COPY, which is much
+    faster than calling registerPlayer() for every entrant of a large event.
+
+    Args:
+      names: iterable of the players' full names.
+      tournament_id: the tournament default is 'Tournament 1'
+
+    Returns:
+      The list of ids assigned to the players, in the same order as names.
+    """
+    with getBackend().session() as session:
+        return session.registerPlayers(names, tournament_id)
+
+
+@tournament_stats.timed
 def playerStandings(tournament_id = 1, includeBye = False):
     """Returns list of players and win records, sorted by overall standings.
 
     The first entry in the list should be the player in first place, or player
     tied for first place if there is currently a tie.
-    
+
     Arg:
       tournament_id: denotes the tournament (default is 'Tournament 1')
       includeBye: if True will also show bye games in standings
-    
+
     Returns:
       A list of tuples, each of which contains (id, name, wins, matches):
         id: the player's unique id (assigned by the database)
@@ -110,18 +1035,101 @@ def playerStandings(tournament_id = 1, includeBye = False):
         matches: the number of matches the player has played
         byes: number of bye games the player has had
     """
-    db = connect()
-    c = db.cursor()
-    # Return the player standings from the standings view. See tournament.sql.
-    if includeBye == False:
-        c.execute( "SELECT id, name, wins, matches FROM standings" )
-    else:
-        c.execute( "SELECT id, name, wins, matches, byes FROM standings" )
-    result = c.fetchall()
-    db.close()    
-    return result
+    with getBackend().session() as session:
+        return session.playerStandings(tournament_id, includeBye)
 
 
+def iterStandings(tournament_id = 1, includeBye = False,
+                  fetch_size = STANDINGS_FETCH_SIZE):
+    """Yields the rows of playerStandings() one at a time.
+
+    The rows are read through a server-side cursor, fetch_size rows per round
+    trip, so the whole standings of a large tournament are never held in
+    memory. The generator holds a pooled connection until it is exhausted or
+    closed.
+
+    Arg:
+      tournament_id: denotes the tournament (default is 'Tournament 1')
+      includeBye: if True will also show bye games in standings
+      fetch_size: number of rows fetched from the database at a time
+    """
+    with getBackend().session() as session:
+        rows = session.iterStandings(tournament_id, includeBye, fetch_size)
+        try:
+            for row in rows:
+                yield row
+        finally:
+            # Close the cursor before the connection goes back to the pool
+            rows.close()
+
+
+@tournament_stats.timed
+def standingsPage(tournament_id = 1, page = 1, page_size = STANDINGS_PAGE_SIZE,
+                  includeBye = False):
+    """Returns one page of the standings, e.g. the top page_size players.
+
+    Arg:
+      tournament_id: denotes the tournament (default is 'Tournament 1')
+      page: number of the page, the first page is 1
+      page_size: number of players on a page
+      includeBye: if True will also show bye games in standings
+
+    Returns:
+      The rows of playerStandings() from position (page - 1) * page_size,
+      at most page_size of them.
+    """
+    with getBackend().session() as session:
+        return session.standingsPage(tournament_id, page, page_size,
+            includeBye)
+
+
+def _rowWriter(output, columns, format):
+    """Returns a function writing a row to output in an export format.
+
+    Args:
+      output: file object to write to
+      columns: names of the columns of the rows
+      format: 'csv' for comma separated values, the header line is written
+              right away, or 'json' for one JSON object per line
+    """
+    if format == 'csv':
+        writer = csv.writer(output)
+        writer.writerow(columns)
+        return writer.writerow
+    if format == 'json':
+        return lambda row: output.write(
+            json.dumps(dict(zip(columns, row))) + '\n')
+    raise ValueError("unknown export format %r" % (format, ))
+
+
+@tournament_stats.timed
+def exportStandings(output, tournament_id = 1, format = 'csv',
+                    includeBye = False, fetch_size = STANDINGS_FETCH_SIZE):
+    """Writes the standings of a tournament to a file, one player at a time.
+
+    Args:
+      output: file object to write to
+      tournament_id: denotes the tournament (default is 'Tournament 1')
+      format: 'csv' for comma separated values with a header line, 'json'
+              for one JSON object per line
+      includeBye: if True will also export bye games
+      fetch_size: number of rows fetched from the database at a time
+
+    Returns:
+      The number of players written.
+    """
+    columns = ['id', 'name', 'wins', 'matches']
+    if includeBye == True:
+        columns.append('byes')
+    write = _rowWriter(output, columns, format)
+    count = 0
+    for row in iterStandings(tournament_id, includeBye, fetch_size):
+        write(row)
+        count += 1
+    return count
+
+
+@tournament_stats.timed
 def reportMatch(winner, loser, tied = False, tournament_id = 1):
     """Records the outcome of a single match between two players.
 
@@ -133,194 +1141,550 @@ def reportMatch(winner, loser, tied = False, tournament_id = 1):
     Note:
       if winner and loser are the same player, it signifies a Bye Game.
     """
-    db = connect()
-    c = db.cursor()
-    tied_match = ('true' if tied else 'false') 
-    if (winner != loser):
-        # Insert win/lose/tie info into the matches table.
-        sql = '''
-        INSERT INTO matches ( tournament_id, winner_id, loser_id, tied  ) 
-            VALUES ( %s, %s, %s, %s )
-        '''
-        c.execute( sql, (tournament_id, winner, loser, tied_match) )
-    else:
-        # For a bye game (winner == loser) update byes in register table.
-        # Points/win for player will be updated but bye game won't 
-        # appear in matches table.
-        sql_update_bye = '''
-        UPDATE register 
-            SET byes = byes + 1 
-            WHERE tournament_id = (%s) AND player_id = (%s)  
-        '''
-        c.execute(sql_update_bye, (str(tournament_id), str(winner)))
-    # Update points in the register table for win or tie
-    sql_update_points = '''
-    UPDATE register 
-        SET points = points + (%s) WHERE 
-        tournament_id = (%s) AND player_id = (%s)  
-    '''
-    if (tied == True):
-        # For a tied match, both players get an additional TIE_POINTS points
-        c.execute(sql_update_points, 
-            (str(TIE_POINTS), str(tournament_id), str(winner))
-        )
-        c.execute(sql_update_points, 
-            (str(TIE_POINTS), str(tournament_id), str(loser))
-        )
-    else:
-        # If not a tied game, the winner gets WIN_POINTS points
-        c.execute(sql_update_points, 
-            (str(WIN_POINTS), str(tournament_id), str(winner))
-        )
-        sql_update_wins = '''
-        UPDATE register 
-            SET wins = wins + 1 
-            WHERE tournament_id = (%s) AND player_id = (%s)  
-        '''
-        c.execute(sql_update_wins, (str(tournament_id), str(winner)))
-    db.commit()
-    db.close()    
+    with getBackend().session() as session:
+        session.reportMatch(winner, loser, tied, tournament_id)
+
+
+@tournament_stats.timed
+def reportMatches(results, tournament_id = 1):
+    """Records the outcome of a whole round of matches in one transaction.
+
+    The result is the same as calling reportMatch() for each result, but the
+    matches and the points, wins and byes of all players are written with a
+    single statement each.
+
+    Args:
+      results: iterable of (winner, loser, tied) tuples, see reportMatch()
+      tournament_id: id of the tournament for these matches
+    Note:
+      if winner and loser are the same player, it signifies a Bye Game.
+    """
+    with getBackend().session() as session:
+        session.reportMatches(results, tournament_id)
 
 
+@tournament_stats.timed
 def getOpponents(tournament_id = 1):
     """Returns dictionary of players and opponents they have played against.
 
     Arg:
       tournament_id: denotes the tournament (default is 'Tournament 1')
-    
+
     Returns:
       A list of tuples, each of which contains (player_id, opponent_id):
         player_id: the player's unique id (assigned by the database)
         opponent_id: the id of player who has been an opponent of player_id
     """
-    db = connect()
-    c = db.cursor()
-    # Fetch opponents from opponents view in tournament.sql.
-    sql = '''
-        SELECT player_id, opponent_id FROM opponents 
-        WHERE tournament_id = (%s)
-    '''
-    c.execute(sql, (tournament_id,))
-    results = c.fetchall()
-    db.close()
-    # Create dictionary where key is player_id, value is list of opponents
-    opponents_table = defaultdict(list)
-    for row in results:
-        opponents_table[row[0]].append(row[1])
-    return opponents_table
+    with getBackend().session() as session:
+        return session.getOpponents(tournament_id)
+
+
+class StandingsColumns(object):
+    """Standings held column by column, as used by the pairing functions.
+
+    Pairing only looks at the ids, byes and points of the players, which are
+    kept in compact arrays instead of one tuple per player. Names are only
+    looked up to build the pairings returned.
+
+    Attributes:
+      ids, byes, points: array of the player ids, bye games and points, in
+                         standings order
+      names: list of the player names, in standings order
+    """
+
+    def __init__(self, ids, names, byes, points):
+        self.ids = ids
+        self.names = names
+        self.byes = byes
+        self.points = points
+
+    @classmethod
+    def fromRows(cls, rows):
+        """Returns the columns of standings rows.
+
+        Arg:
+          rows: iterable of (id, name, wins, matches, byes) rows, as returned
+                by playerStandings() including byes, optionally followed by
+                the player's points. Rows without points count as 0 points.
+                A cursor can be passed to avoid building a list of its rows.
+        """
+        columns = cls(array.array('l'), [], array.array('l'),
+            array.array('l'))
+        for row in rows:
+            columns.append(row)
+        return columns
+
+    def append(self, row):
+        """Adds a standings row below the others, see fromRows()."""
+        self.ids.append(row[0])
+        self.names.append(row[1])
+        self.byes.append(row[4])
+        self.points.append(row[5] if len(row) > 5 else 0)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def pairing(self, index_1, index_2):
+        """Returns the (id1, name1, id2, name2) tuple pairing two indices."""
+        return (self.ids[index_1], self.names[index_1],
+                self.ids[index_2], self.names[index_2])
+
+
+class PairingTable(object):
+    """Tracks which players in the standings have already been paired.
+
+    It is used like the list of booleans it replaces: table[index] is True once
+    the player in standings[index] has been picked. The unpicked indices are
+    also kept in a doubly linked list, so finding the next available player
+    does not rescan everybody who has already been paired. Flags and links
+    are kept in arrays, which take a few bytes per player.
+    """
+
+    def __init__(self, size):
+        self._picked = bytearray(size)
+        # _next and _prev link the unpicked indices in standings order. The
+        # list is circular through a sentinel stored at index size.
+        self._sentinel = size
+        self._next = array.array('l', range(1, size + 1))
+        self._next.append(0)
+        self._prev = array.array('l', [size])
+        self._prev.extend(range(0, size))
+
+    def __len__(self):
+        return len(self._picked)
+
+    def __getitem__(self, index):
+        return self._picked[index] == 1
+
+    def __setitem__(self, index, picked):
+        if picked and not self._picked[index]:
+            # Unlink index from the unpicked list
+            self._next[self._prev[index]] = self._next[index]
+            self._prev[self._next[index]] = self._prev[index]
+        elif not picked and self._picked[index]:
+            # Link index back in after the closest unpicked index before it
+            before = index - 1
+            while before >= 0 and self._picked[before]:
+                before = before - 1
+            if before < 0:
+                before = self._sentinel
+            self._next[index] = self._next[before]
+            self._prev[index] = before
+            self._prev[self._next[before]] = index
+            self._next[before] = index
+        self._picked[index] = 1 if picked else 0
+
+    def first(self):
+        """Returns the first unpicked index, or -1 if all have been picked."""
+        index = self._next[self._sentinel]
+        return -1 if index == self._sentinel else index
+
+    def following(self, index):
+        """Returns the unpicked index after index, or -1 if there is none.
+
+        index itself need not be unpicked any more, as long as no index picked
+        after it has been restored since.
+        """
+        index = self._next[index]
+        return -1 if index == self._sentinel else index
+
+    def pickFirst(self, ids, excluded = ()):
+        """Picks the first unpicked index whose id is not excluded.
+
+        This is pickNextPlayer() walking the links directly. If every
+        unpicked id is excluded, the first unpicked index is picked anyway.
+
+        Arg:
+          ids: sequence of the player ids in standings order
+          excluded: set of ids that should not be picked
+
+        Returns:
+          The index picked, or -1 if all have been picked.
+        """
+        sentinel = self._sentinel
+        links = self._next
+        first = links[sentinel]
+        index = first
+        while index != sentinel and ids[index] in excluded:
+            index = links[index]
+        if index == sentinel:
+            index = first
+            if index == sentinel:
+                return -1
+        self[index] = True
+        return index
+
+    def restore(self, index):
+        """Marks index as unpicked again, undoing the latest pick of index.
+
+        Picks must be undone in the reverse order they were made, which is
+        how the optimal pairing search backtracks. Unlike table[index] = False
+        this takes constant time.
+        """
+        self._next[self._prev[index]] = index
+        self._prev[self._next[index]] = index
+        self._picked[index] = 0
+
+    def unpicked(self, reverse = False):
+        """Yields the unpicked indices from the top (or bottom) of standings."""
+        links = self._prev if reverse else self._next
+        index = links[self._sentinel]
+        while index != self._sentinel:
+            yield index
+            index = links[index]
+
+
+def unpickedIndices(picked_already, reverse = False):
+    """Yields the indices of picked_already that are still False.
+
+    Arg:
+      picked_already: list of booleans or a PairingTable
+      reverse: if True indices are yielded from the bottom of standings
+    """
+    if isinstance(picked_already, PairingTable):
+        return picked_already.unpicked(reverse)
+    indices = range(len(picked_already) - 1, -1, -1) if reverse else \
+        range(0, len(picked_already))
+    return (index for index in indices if picked_already[index] == False)
+
+
+@tournament_stats.timed
+def getMatches(tournament_id = 1):
+    """Returns all the matches recorded in a tournament.
+
+    Arg:
+      tournament_id: denotes the tournament (default is 'Tournament 1')
+
+    Returns:
+      A list of tuples (winner_id, loser_id, tied) in the order the matches
+      were reported. Bye games are not included.
+    """
+    with getBackend().session() as session:
+        return session.getMatches(tournament_id)
+
+
+@tournament_stats.timed
+def getRegister(tournament_id = 1):
+    """Returns the points, wins and byes of the players in a tournament.
+
+    Arg:
+      tournament_id: denotes the tournament (default is 'Tournament 1')
+
+    Returns:
+      A list of tuples (player_id, points, wins, byes) sorted by player_id.
+    """
+    with getBackend().session() as session:
+        return session.getRegister(tournament_id)
+
+
+class _RowsColumn(object):
+    """Read-only view of one column of a list of standings rows."""
+
+    def __init__(self, rows, column):
+        self.rows = rows
+        self.column = column
+
+    def __getitem__(self, index):
+        return self.rows[index][self.column]
+
+
+def _column(standings, name, column):
+    """Returns a column of standings, given as StandingsColumns or rows."""
+    if isinstance(standings, StandingsColumns):
+        return getattr(standings, name)
+    return _RowsColumn(standings, column)
+
+
+class ByeQueue(object):
+    """Hands out bye games to the players of a round in order.
+
+    The next bye goes to the player with the fewest byes so far and, among
+    those, the lowest in the standings. Players are grouped by their number
+    of byes, and each group is found by scanning up from the bottom of the
+    standings with its own cursor, so every player is looked at once per
+    group however many byes are handed out. When the bottom player has not
+    had a bye yet, as in most rounds, a bye is found right away.
+    """
+
+    def __init__(self, byes):
+        """Arg:
+          byes: sequence of the number of byes of each player in standings
+                order, such as StandingsColumns.byes
+        """
+        self._byes = byes
+        # Number of byes of the group handed out now, the lowest count seen
+        # above it so far, and the index the scan of the group continues at
+        self._level = 0
+        self._next_level = None
+        self._cursor = None
+
+    def pop(self, picked_already):
+        """Returns the index of the player getting the next bye game.
+
+        Arg:
+          picked_already: list of booleans or PairingTable of the players
+                          already paired. The player returned is marked
+                          picked in it.
+
+        Returns:
+          The index into standings, or -1 if every player has been picked.
+        """
+        byes = self._byes
+        if self._cursor is None:
+            self._cursor = len(picked_already) - 1
+        while self._level is not None:
+            level = self._level
+            next_level = self._next_level
+            index = self._cursor
+            while index >= 0:
+                if not picked_already[index]:
+                    count = byes[index]
+                    if count == level:
+                        picked_already[index] = True
+                        self._cursor = index - 1
+                        self._next_level = next_level
+                        return index
+                    if count > level and (next_level is None or
+                                          count < next_level):
+                        next_level = count
+                index -= 1
+            # Nobody unpicked is left with this number of byes
+            self._level = next_level
+            self._next_level = None
+            self._cursor = len(picked_already) - 1
+        return -1
+
+
+def findByePlayers(standings, picked_already, count):
+    """Returns the indices of the players who get the bye games of a round.
+
+    Arg:
+      standings: list returned from playerStandings() function, or the
+                 StandingsColumns of it.
+      picked_already: list of booleans or PairingTable of the players
+                      already paired.
+      count: number of bye games to hand out
+
+    Returns:
+      A list of count indices into standings, in the order of ByeQueue. The
+      players are marked in picked_already. The list is shorter if fewer
+      players are left.
+    """
+    queue = ByeQueue(_column(standings, 'byes', 4))
+    indices = []
+    for _ in range(count):
+        index = queue.pop(picked_already)
+        if index == -1:
+            break
+        indices.append(index)
+    return indices
 
 
 def findByePlayer(standings, picked_already):
     """Returns the index of lowest standing player with lowest byes
-   
+
     Arg:
-      standings: list returned from playerStandings() function.
-      picked_already: list of booleans that denote whether the index in 
-                       standings has already been picked. 
+      standings: list returned from playerStandings() function, or the
+                 StandingsColumns of it.
+      picked_already: list of booleans that denote whether the index in
+                       standings has already been picked.
 
     Returns:
       Function sets the picked_already[index] to True, when player is picked
-      returns the index into standings of player suitable for a bye game
+      returns the index into standings of player suitable for a bye game,
+      or -1 if every player has been picked
      """
-    minimum_byes = sys.maxint
-    index = len(standings) - 1
-    lowest_bye_index = index
-    while index >= 0:
-        if picked_already[index] == False:
-            # standings[index][4] denotes number of bye games for player
-            num_of_byes = standings[index][4]
-            if num_of_byes == 0:
-                # Return the index for this player who will get a Bye Game
-                picked_already[index] = True
-                return index
-            elif num_of_byes < minimum_byes:
-                # Remember the player with lowest number of byes
-                minimum_byes = num_of_byes
-                lowest_bye_index = index
-        index = index - 1
-    # Return index of players with least number of byes
-    return lowest_bye_index
+    return ByeQueue(_column(standings, 'byes', 4)).pop(picked_already)
 
 
 def pickNextPlayer(standings, picked_already, opponents_list=[]):
     """Returns the index of next available player for pairing
-   
+
     Arg:
-      standings: list returned from playerStandings() function.
-      picked_already: list of booleans that denote whether the index in 
-                       standings has already been picked. 
-      opponents_list: list of opponents that should not play against.
+      standings: list returned from playerStandings() function, or the
+                 StandingsColumns of it.
+      picked_already: list of booleans that denote whether the index in
+                       standings has already been picked, or a PairingTable.
+      opponents_list: list or set of opponents that should not play against.
 
     Returns:
       Function sets the picked_already[index] to True, when player is picked
       returns the index into standings of player that is picked
       -1 is returned if there is no more player left to select
     """
-    for index in range(0, len(standings)):
-        if picked_already[index] == False:
-            # Skip player if this player is in the opponents_list
-            if standings[index][0] in opponents_list:
-                continue
-            # Return the index for this player, we're done
-            picked_already[index] = True
-            return index
+    ids = _column(standings, 'ids', 0)
+    if isinstance(picked_already, PairingTable):
+        return picked_already.pickFirst(ids, opponents_list)
+    for index in unpickedIndices(picked_already):
+        # Skip player if this player is in the opponents_list
+        if ids[index] in opponents_list:
+            continue
+        # Return the index for this player, we're done
+        picked_already[index] = True
+        return index
     # If there are any unpicked players left, return the first one before giving up
-    for index in range(0, len(picked_already)):
-        if picked_already[index] == False:
-            picked_already[index] = True
-            return index
-    # No one else left, giving up     
+    for index in unpickedIndices(picked_already):
+        picked_already[index] = True
+        return index
+    # No one else left, giving up
     return -1
 
 
 def addToPairings(swiss_pairings, standings, player_1, player_2):
     """Helper function that appends players to swiss_pairings
-   
+
     Arg:
       swiss_pairings: list of tuples that denote matched players
-      standings: list returned from playerStandings() function.
-      player_1, player_2: index of players who will be appended 
+      standings: list returned from playerStandings() function, or the
+                 StandingsColumns of it.
+      player_1, player_2: index of players who will be appended
     """
+    if isinstance(standings, StandingsColumns):
+        swiss_pairings.append(standings.pairing(player_1, player_2))
+        return
     swiss_pairings.append(
         (standings[player_1][0], standings[player_1][1],
         standings[player_2][0], standings[player_2][1])
         )
 
 
-def swissPairings(tournament_id = 1):
-    """Returns a list of pairs of players for the next round of a match.
-  
-    Assuming that there are an even number of players registered, each player
-    appears exactly once in the pairings.  Each player is paired with another
-    player with an equal or nearly-equal win record, that is, a player adjacent
-    to him or her in the standings.
-    For an odd number of players, the last ranking player with lowest number of
-    byes will be paired with itself to denote a bye game. reportMatch() detects 
-    bye games when winner and loser is the same player.
-  
+def optimalPairs(standings, opponents_sets, paired_table, time_budget):
+    """Returns pairs of unpicked players without rematches, if there are any.
+
+    Depth first search that pairs the top unpicked player with each unpicked
+    player below it in turn, skipping previous opponents. The first pairing
+    found is the greedy one with the least backtracking; the search then
+    keeps looking for pairings with a lower sum of point differences between
+    paired players, until the whole tree is searched or time_budget runs out.
+    Since standings are sorted by points, candidates further down never have
+    a smaller point difference, so a branch is cut as soon as its difference
+    would reach the best sum found so far. Pairing neighbours in the standings
+    gives the smallest sum possible, so the search also stops as soon as it
+    finds a pairing with that sum.
+
     Arg:
-      tournament_id: id of the tournament to perform swiss pairing for
+      standings: StandingsColumns, or list of standings rows with the
+                 player's points in row[5].
+      opponents_sets: dictionary of player_id and set of opponents.
+      paired_table: PairingTable of the players already paired. It is left
+                    unchanged when the function returns.
+      time_budget: seconds after which the search stops.
 
     Returns:
-      A list of tuples, each of which contains (id1, name1, id2, name2)
-        id1: the first player's unique id
-        name1: the first player's name
-        id2: the second player's unique id
-        name2: the second player's name
+      A list of (index1, index2) tuples into standings pairing every unpicked
+      player, or None if no pairing without rematches was found.
+    """
+    deadline = time.time() + time_budget
+    no_opponents = frozenset()
+    ids = _column(standings, 'ids', 0)
+    points = _column(standings, 'points', 5)
+    unpicked = list(paired_table.unpicked())
+    lowest_cost = sum(
+        abs(points[unpicked[index]] - points[unpicked[index + 1]])
+        for index in range(0, len(unpicked) - 1, 2))
+    best_pairs = None
+    best_cost = None
+    pairs = []
+    cost = 0
+    # stack holds [player, candidate] for each player paired so far
+    stack = []
+    steps = 0
+    while True:
+        steps += 1
+        if steps % 1024 == 0 and time.time() > deadline:
+            break
+        player = paired_table.first()
+        if player == -1:
+            # Everyone is paired, remember the pairing if it is the best so far
+            if best_cost is None or cost < best_cost:
+                best_pairs = list(pairs)
+                best_cost = cost
+                if cost == lowest_cost:
+                    break
+        else:
+            paired_table[player] = True
+            stack.append([player, player])
+        # Try the next candidate of the latest player, backtrack if none left
+        while stack:
+            frame = stack[-1]
+            player, candidate = frame
+            if candidate != player:
+                paired_table.restore(candidate)
+                cost -= abs(points[player] - points[candidate])
+                pairs.pop()
+            opponents = opponents_sets.get(ids[player], no_opponents)
+            candidate = paired_table.following(candidate)
+            while candidate != -1 and ids[candidate] in opponents:
+                candidate = paired_table.following(candidate)
+            if candidate != -1:
+                difference = abs(points[player] - points[candidate])
+                if best_cost is None or cost + difference < best_cost:
+                    frame[1] = candidate
+                    paired_table[candidate] = True
+                    cost += difference
+                    pairs.append((player, candidate))
+                    break
+            stack.pop()
+            paired_table.restore(player)
+        if not stack:
+            # The whole search tree has been explored
+            break
+    # Undo the picks of an interrupted search
+    while stack:
+        player, candidate = stack.pop()
+        if candidate != player:
+            paired_table.restore(candidate)
+        paired_table.restore(player)
+    return best_pairs
+
+
+@tournament_stats.timed
+def pairStandings(standings, opponents_table, mode = GREEDY_PAIRING,
+                  time_budget = PAIRING_TIME_BUDGET, byes = None):
+    """Returns the Swiss pairings for players in the given standings.
+
+    The pairing rules are described in swissPairings(). The standings are
+    turned into StandingsColumns and unpaired players are tracked in a
+    PairingTable, so a round takes time linear in the number of players plus
+    previous opponents and a few bytes of memory per player.
+
+    Arg:
+      standings: list returned from playerStandings() including byes, or the
+                 StandingsColumns of it. For the optimal mode each row also
+                 needs the player's points in row[5].
+      opponents_table: dictionary returned from getOpponents(). The lists or
+                       sets of opponents are used as given.
+      mode: GREEDY_PAIRING or OPTIMAL_PAIRING, see swissPairings().
+      time_budget: seconds the optimal mode may search for.
+      byes: number of bye games, see swissPairings().
+
+    Returns:
+      A list of tuples (id1, name1, id2, name2), see swissPairings().
     """
+    if mode not in (GREEDY_PAIRING, OPTIMAL_PAIRING):
+        raise ValueError("unknown pairing mode %r" % (mode, ))
+    if not isinstance(standings, StandingsColumns):
+        standings = StandingsColumns.fromRows(standings)
+    byes = _byeCount(len(standings), byes)
     swiss_pairings = []
-    # playerStandings() returns list sorted by standing including tie breakers
-    # here the second parameter is True so Bye Games will be included also
-    standings = playerStandings(tournament_id, True)
     # paired_table[index] == True, means player in standings[index] is paired
-    paired_table = [False] * len(standings)
-    # opponents_table is a dictionary of players and their opponents
-    opponents_table = getOpponents(tournament_id)
-    # first see if a bye game is in order
-    if len(standings) % 2 != 0:
-        # Find who gets a bye and add it to the pairings
-        player_1 = findByePlayer(standings, paired_table)
+    paired_table = PairingTable(len(standings))
+    no_opponents = frozenset()
+    # first hand out the bye games, if any are in order
+    for player_1 in findByePlayers(standings, paired_table, byes):
         addToPairings(swiss_pairings, standings, player_1, player_1)
+    if mode == OPTIMAL_PAIRING:
+        # The search looks up opponents many times, use sets
+        opponents_sets = dict((player_id, opponents
+            if isinstance(opponents, (set, frozenset)) else set(opponents))
+            for (player_id, opponents) in opponents_table.items())
+        pairs = optimalPairs(standings, opponents_sets, paired_table,
+            time_budget)
+        if pairs is not None:
+            for (player_1, player_2) in pairs:
+                addToPairings(swiss_pairings, standings, player_1, player_2)
+            return swiss_pairings
+        # Rematches cannot be avoided, fall back to the greedy pairing
     # do the Swiss Pairing
     while True:
         # Starting from the top of standings pick the first unpaired player
@@ -328,18 +1692,146 @@ def swissPairings(tournament_id = 1):
         if player_1 == -1:
             # No more players to match, we are done
             break
-        # Get the player_id from standings 
-        player1_id = standings[player_1][0]
-        # Get the list of opponents for this player
-        opponents_list = opponents_table[player1_id]
+        # Get the player_id from standings
+        player1_id = standings.ids[player_1]
+        # Get the opponents of this player
+        opponents_list = opponents_table.get(player1_id, no_opponents)
         # Pick the next player in standings, avoid rematch using opponent_list
-        player_2 = pickNextPlayer(standings, paired_table, opponents_list) 
+        player_2 = pickNextPlayer(standings, paired_table, opponents_list)
         if player_2 == -1:
             # No one to pair with. Player gets a bye game (paired with itself)
-            player_2 = player_1 
+            player_2 = player_1
         # Append to swiss_parings results
         addToPairings(swiss_pairings, standings, player_1, player_2)
     # We are done!
     return swiss_pairings
 
 
+def _byeCount(players, byes):
+    """Returns the number of bye games of a round, checking byes.
+
+    Arg:
+      players: number of players to pair
+      byes: requested number of byes, None for one bye if players is odd
+    """
+    if byes is None:
+        return players % 2
+    if byes < 0 or byes > players or (players - byes) % 2 != 0:
+        raise ValueError("%r byes cannot be handed out to %d players, the "
+                         "other players must pair up" % (byes, players))
+    return byes
+
+
+def _pairTournament(job):
+    """Pairs one tournament of pairTournaments() in a worker process."""
+    tournament_id, standings, opponents_table, mode, time_budget = job
+    return tournament_id, pairStandings(standings, opponents_table, mode,
+        time_budget)
+
+
+@tournament_stats.timed
+def pairTournaments(tournaments, workers = 1, mode = GREEDY_PAIRING,
+                    time_budget = PAIRING_TIME_BUDGET):
+    """Returns the Swiss pairings of many tournaments, using several processes.
+
+    Every tournament is paired by pairStandings() on its own, so the result
+    does not depend on the number of workers. In OPTIMAL_PAIRING mode the
+    search of each tournament has its own time_budget.
+
+    Arg:
+      tournaments: dictionary of tournament_id and (standings, opponents_table)
+                   as taken by pairStandings()
+      workers: number of processes, None uses one per CPU. With one worker,
+               the default, or a single tournament, pairing runs in the
+               calling process. Starting worker processes costs more than
+               pairing typical fields, so only use several workers for many
+               large tournaments.
+      mode, time_budget: see swissPairings()
+
+    Returns:
+      A dictionary of tournament_id and the list returned by swissPairings().
+    """
+    # Imported here, pairing a single tournament does not need it
+    import multiprocessing
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    jobs = [(tournament_id, standings, opponents_table, mode, time_budget)
+        for (tournament_id, (standings, opponents_table))
+        in sorted(tournaments.items())]
+    if workers <= 1 or len(jobs) <= 1:
+        return dict(_pairTournament(job) for job in jobs)
+    processes = multiprocessing.Pool(min(workers, len(jobs)))
+    try:
+        return dict(processes.map(_pairTournament, jobs,
+            chunksize = max(1, len(jobs) // (4 * workers))))
+    finally:
+        processes.close()
+        processes.join()
+
+
+@tournament_stats.timed
+def pairAllTournaments(tournament_ids, workers = 1, mode = GREEDY_PAIRING,
+                       time_budget = PAIRING_TIME_BUDGET):
+    """Returns the pairings of the next round of many tournaments at once.
+
+    The standings and opponents of all the tournaments are read with one
+    query each, then the tournaments are paired by pairTournaments(), in
+    parallel if workers is more than 1. Each tournament gets the same
+    pairings swissPairings() returns for it.
+
+    Arg:
+      tournament_ids: ids of the tournaments to pair
+      workers: number of processes, by default 1, None uses one per CPU
+      mode, time_budget: see swissPairings()
+
+    Returns:
+      A dictionary of tournament_id and the list returned by swissPairings().
+    """
+    with getBackend().session() as session:
+        return session.pairAllTournaments(tournament_ids, workers, mode,
+            time_budget)
+
+
+@tournament_stats.timed
+def swissPairings(tournament_id = 1, mode = GREEDY_PAIRING,
+                  time_budget = PAIRING_TIME_BUDGET, byes = None):
+    """Returns a list of pairs of players for the next round of a match.
+
+    Assuming that there are an even number of players registered, each player
+    appears exactly once in the pairings.  Each player is paired with another
+    player with an equal or nearly-equal win record, that is, a player adjacent
+    to him or her in the standings.
+    For an odd number of players, the last ranking player with lowest number of
+    byes will be paired with itself to denote a bye game. reportMatch() detects
+    bye games when winner and loser is the same player. More bye games can be
+    handed out, e.g. when players withdrew late, with byes; they go to the
+    players with the fewest byes from the bottom of the standings up.
+    Standings and opponents are read on a single pooled connection.
+
+    In the default GREEDY_PAIRING mode each player, from the top of the
+    standings down, is paired with the next player he or she has not played
+    yet. If there is none, a rematch is paired. In OPTIMAL_PAIRING mode a
+    search finds a pairing without rematches whenever one exists for the bye
+    player chosen, with the smallest sum of point differences between paired
+    players that is found within time_budget seconds. If no pairing without
+    rematches is found, the greedy pairing is returned.
+
+    Arg:
+      tournament_id: id of the tournament to perform swiss pairing for
+      mode: GREEDY_PAIRING (default) or OPTIMAL_PAIRING
+      time_budget: seconds the OPTIMAL_PAIRING search may take
+      byes: number of bye games, by default one for an odd number of players
+            and none otherwise. The remaining number of players must be
+            even, otherwise ValueError is raised.
+
+    Returns:
+      A list of tuples, each of which contains (id1, name1, id2, name2)
+        id1: the first player's unique id
+        name1: the first player's name
+        id2: the second player's unique id
+        name2: the second player's name
+    """
+    with getBackend().session() as session:
+        return session.swissPairings(tournament_id, mode, time_budget, byes)
+
+
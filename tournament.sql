@@ -17,62 +17,300 @@ CREATE TABLE players (  id SERIAL PRIMARY KEY,
                         name TEXT );
 
 
--- tournaments table
+-- tournaments table. The default tournament 'Tournament 1' is inserted below,
+-- once the tables partitioned by tournament exist.
 CREATE TABLE tournaments (  id SERIAL PRIMARY KEY,
                             name TEXT );
 
--- Initialize tournaments table by inserting a default tournament
-INSERT INTO tournaments ( name ) VALUES ( 'Tournament 1' );
-
 
 -- register table holds players and tournaments they are registed in
 -- it also tracks each registered player's points and number of byes 
-CREATE TABLE register ( tournament_id INTEGER REFERENCES tournaments(id),
-                        player_id     INTEGER REFERENCES players(id),
-                        wins          INTEGER DEFAULT 0,
-                        points        INTEGER DEFAULT 0,
-                        byes          INTEGER DEFAULT 0,
+-- as well as the number of matches played and the opponents points tie
+-- breaker, which are kept up to date by the triggers below.
+-- opponents_points is NULL until the player has played a match.
+-- Like matches, the table is partitioned by tournament, see below.
+CREATE TABLE register ( tournament_id    INTEGER REFERENCES tournaments(id),
+                        player_id        INTEGER REFERENCES players(id),
+                        wins             INTEGER DEFAULT 0,
+                        points           INTEGER DEFAULT 0,
+                        byes             INTEGER DEFAULT 0,
+                        matches          INTEGER DEFAULT 0,
+                        opponents_points INTEGER,
                         PRIMARY KEY(tournament_id, player_id) 
-                     );
+                     ) PARTITION BY HASH ( tournament_id );
+
+-- Index to read the standings of a tournament in ranking order, players
+-- with equal points and opponents points are ordered by player_id
+CREATE INDEX register_standings_idx ON register
+    ( tournament_id, points DESC, opponents_points DESC, player_id );
 
 
--- matches table
-CREATE TABLE matches (  id            SERIAL PRIMARY KEY,
+-- matches table, partitioned by tournament. The primary key of a partitioned
+-- table has to include the partition key, match ids are unique on their own.
+CREATE TABLE matches (  id            SERIAL,
                         tournament_id INTEGER REFERENCES tournaments(id),
                         winner_id     INTEGER REFERENCES players(id),
                         loser_id      INTEGER REFERENCES players(id),
-                        tied          BOOLEAN DEFAULT false
-                     );
+                        tied          BOOLEAN DEFAULT false,
+                        PRIMARY KEY(tournament_id, id)
+                     ) PARTITION BY HASH ( tournament_id );
+
+-- Indexes to find the matches of a player in a tournament
+CREATE INDEX matches_winner_idx ON matches ( tournament_id, winner_id );
+CREATE INDEX matches_loser_idx ON matches ( tournament_id, loser_id );
+
+
+-- register and matches are split into a fixed number of partitions by a
+-- hash of tournament_id, all created here up front. The queries of a
+-- tournament, which all name its tournament_id, only read the one partition
+-- holding its rows, however many other tournaments the database holds.
+-- Creating or dropping a partition locks the whole parent table, so no
+-- partitions are created or dropped while tournaments are running: new
+-- tournaments share the existing partitions and archived tournaments leave
+-- them by deleting their rows.
+DO $$
+DECLARE
+    partitions CONSTANT INTEGER := 16;
+BEGIN
+    FOR remainder IN 0 .. partitions - 1 LOOP
+        EXECUTE format( 'CREATE TABLE %I PARTITION OF register '
+                        'FOR VALUES WITH ( MODULUS %s, REMAINDER %s )',
+                        'register_' || remainder, partitions, remainder );
+        EXECUTE format( 'CREATE TABLE %I PARTITION OF matches '
+                        'FOR VALUES WITH ( MODULUS %s, REMAINDER %s )',
+                        'matches_' || remainder, partitions, remainder );
+    END LOOP;
+END;
+$$;
+
+-- Initialize tournaments table by inserting a default tournament
+INSERT INTO tournaments ( name ) VALUES ( 'Tournament 1' );
+
+
+-- When matches are recorded, count them for both players and add each
+-- player's points to the other's opponents points. A rematch does not add the
+-- points of the same opponent twice. The trigger runs once per statement on
+-- all the new matches, so every register row is updated at most once however
+-- many matches a batch records for it.
+CREATE FUNCTION matches_recorded() RETURNS trigger AS $$
+DECLARE
+    recorded_id INTEGER;
+BEGIN
+    -- Each tournament is updated on its own, naming its tournament_id, so
+    -- only the partitions of that tournament are read
+    FOR recorded_id IN SELECT DISTINCT tournament_id FROM new_matches LOOP
+        WITH pairs AS (
+            -- Each pair of players once, with the first of its new matches
+            SELECT LEAST( winner_id, loser_id )    AS player_1,
+                   GREATEST( winner_id, loser_id ) AS player_2,
+                   MIN( id )                       AS first_id,
+                   COUNT(*)                        AS played
+            FROM new_matches
+            WHERE tournament_id = recorded_id
+            GROUP BY 1, 2
+        ), first_meetings AS (
+            -- One lookup per direction, an OR of both would be matched
+            -- against every match of the tournament
+            SELECT pairs.* FROM pairs
+            WHERE NOT EXISTS (
+                SELECT 1 FROM matches
+                WHERE matches.tournament_id = recorded_id AND
+                      winner_id = player_1 AND loser_id = player_2 AND
+                      matches.id < pairs.first_id ) AND
+                  NOT EXISTS (
+                SELECT 1 FROM matches
+                WHERE matches.tournament_id = recorded_id AND
+                      winner_id = player_2 AND loser_id = player_1 AND
+                      matches.id < pairs.first_id )
+        ), sides AS (
+            -- A bye is a match of a player against itself, counted once
+            SELECT player_1 AS player_id, player_2 AS opponent_id, played
+            FROM pairs
+            UNION ALL
+            SELECT player_2, player_1, played
+            FROM pairs WHERE player_1 <> player_2
+        ), delta AS (
+            SELECT sides.player_id,
+                   SUM( sides.played ) AS matches,
+                   SUM( opponent.points ) FILTER ( WHERE EXISTS (
+                       SELECT 1 FROM first_meetings
+                       WHERE first_meetings.player_1 =
+                                 LEAST( sides.player_id, sides.opponent_id ) AND
+                             first_meetings.player_2 =
+                                 GREATEST( sides.player_id, sides.opponent_id ) )
+                   ) AS opponents_points
+            FROM sides
+            LEFT JOIN register AS opponent ON
+                opponent.tournament_id = recorded_id AND
+                opponent.player_id = sides.opponent_id
+            GROUP BY sides.player_id
+        )
+        UPDATE register
+            SET matches = register.matches + delta.matches,
+                opponents_points = CASE
+                    WHEN delta.opponents_points IS NULL
+                        THEN register.opponents_points
+                    ELSE COALESCE( register.opponents_points, 0 ) +
+                         delta.opponents_points
+                END
+            FROM delta
+            WHERE register.tournament_id = recorded_id AND
+                  register.player_id = delta.player_id;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER matches_recorded AFTER INSERT ON matches
+    REFERENCING NEW TABLE AS new_matches
+    FOR EACH STATEMENT EXECUTE PROCEDURE matches_recorded();
 
 
--- View to query number of matches
+-- When the points of players change, pass the differences on to the
+-- opponents points of everyone they have played against, once per statement.
+-- A statement trigger also fires for the updates that change no points, such
+-- as its own, which find no tournament to update.
+CREATE FUNCTION points_changed() RETURNS trigger AS $$
+DECLARE
+    changed_id INTEGER;
+BEGIN
+    FOR changed_id IN
+        SELECT DISTINCT new_register.tournament_id
+        FROM new_register
+        JOIN old_register ON
+            old_register.tournament_id = new_register.tournament_id AND
+            old_register.player_id = new_register.player_id
+        WHERE new_register.points <> old_register.points
+    LOOP
+        WITH changed AS (
+            SELECT new_register.player_id,
+                   new_register.points - old_register.points AS points
+            FROM new_register
+            JOIN old_register ON
+                old_register.tournament_id = new_register.tournament_id AND
+                old_register.player_id = new_register.player_id
+            WHERE new_register.tournament_id = changed_id AND
+                  new_register.points <> old_register.points
+        ), opponents AS (
+            -- Each opponent of a changed player once, however often they met
+            SELECT changed.player_id, changed.points,
+                   matches.loser_id AS opponent_id
+            FROM changed JOIN matches ON
+                matches.tournament_id = changed_id AND
+                matches.winner_id = changed.player_id
+            UNION
+            SELECT changed.player_id, changed.points, matches.winner_id
+            FROM changed JOIN matches ON
+                matches.tournament_id = changed_id AND
+                matches.loser_id = changed.player_id
+        ), delta AS (
+            SELECT opponent_id AS player_id, SUM( points ) AS points
+            FROM opponents
+            GROUP BY opponent_id
+        )
+        UPDATE register
+            SET opponents_points = register.opponents_points + delta.points
+            FROM delta
+            WHERE register.tournament_id = changed_id AND
+                  register.player_id = delta.player_id;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER register_points_changed AFTER UPDATE ON register
+    REFERENCING OLD TABLE AS old_register NEW TABLE AS new_register
+    FOR EACH STATEMENT EXECUTE PROCEDURE points_changed();
+
+
+-- Reporting results writes the register rows of the players and, through the
+-- triggers above, of all their opponents. Two reports of the same tournament
+-- would lock overlapping rows in different orders and deadlock, so
+-- reportMatches() first calls lock_register() with the players it reports,
+-- which locks their rows and their opponents' rows in player_id order.
+-- A report committed while waiting for the locks may have given the players
+-- new opponents. Then the locks are rolled back with the block and taken
+-- again, in order, on the larger set.
+CREATE FUNCTION lock_register( locked_id INTEGER, player_ids INTEGER[] )
+    RETURNS void AS $$
+DECLARE
+    affected_ids INTEGER[];
+BEGIN
+    LOOP
+        SELECT array_agg( affected.player_id ) INTO affected_ids FROM (
+            SELECT unnest( player_ids ) AS player_id
+            UNION
+            SELECT opponent_id FROM opponents
+            WHERE tournament_id = locked_id AND player_id = ANY ( player_ids )
+        ) AS affected;
+        BEGIN
+            PERFORM 1 FROM register
+                WHERE tournament_id = locked_id AND
+                      player_id = ANY ( affected_ids )
+                ORDER BY player_id
+                FOR UPDATE;
+            IF NOT EXISTS (
+                SELECT 1 FROM opponents
+                WHERE tournament_id = locked_id AND
+                      player_id = ANY ( player_ids ) AND
+                      opponent_id <> ALL ( affected_ids ) ) THEN
+                RETURN;
+            END IF;
+            RAISE EXCEPTION 'opponents changed while locking';
+        EXCEPTION WHEN raise_exception THEN
+            -- Try again with the new opponents
+            NULL;
+        END;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Archive of finished tournaments, see archiveTournament() in tournament.py.
+-- The archive tables have no foreign keys and keep the names of the players,
+-- so archived tournaments outlive deletePlayers(). Only the final standings
+-- and the results are kept, with no indexes beyond the tournament_id lookup.
+CREATE TABLE archived_tournaments ( id          INTEGER PRIMARY KEY,
+                                    name        TEXT,
+                                    archived_at TIMESTAMP DEFAULT now()
+                                  );
+
+CREATE TABLE archived_register ( tournament_id    INTEGER,
+                                 player_id        INTEGER,
+                                 name             TEXT,
+                                 wins             INTEGER,
+                                 points           INTEGER,
+                                 byes             INTEGER,
+                                 matches          INTEGER,
+                                 opponents_points INTEGER,
+                                 PRIMARY KEY(tournament_id, player_id)
+                               );
+
+CREATE TABLE archived_matches ( tournament_id INTEGER,
+                                winner_id     INTEGER,
+                                loser_id      INTEGER,
+                                tied          BOOLEAN
+                              );
+
+CREATE INDEX archived_matches_tournament_idx ON archived_matches ( tournament_id );
+
+
+-- View to query number of matches, maintained in the register table
 CREATE VIEW matches_count AS
-    SELECT register.tournament_id, register.player_id, COUNT( matches ) as matches_count
+    SELECT register.tournament_id, register.player_id, register.matches AS matches_count
     FROM   register
-    LEFT JOIN matches ON
-        (register.tournament_id = matches.tournament_id) AND
-        (
-            (register.player_id = matches.winner_id) OR
-            (register.player_id = matches.loser_id)
-        )
-    GROUP BY
-        register.tournament_id, register.player_id
     ORDER BY matches_count DESC;
 
 
--- View on opponents of each player
+-- View on opponents of each player. A condition on tournament_id is pushed down
+-- into both sides of the UNION, so querying one tournament only reads that
+-- tournament's matches through matches_winner_idx and matches_loser_idx.
 CREATE VIEW opponents AS
-    SELECT  register.tournament_id, register.player_id, matches.loser_id AS opponent_id
-    FROM    register
-    JOIN    matches ON
-        (register.tournament_id = matches.tournament_id) AND
-        (register.player_id = matches.winner_id)
+    SELECT  matches.tournament_id, matches.winner_id AS player_id, matches.loser_id AS opponent_id
+    FROM    matches
     UNION
-    SELECT  register.tournament_id, register.player_id, matches.winner_id AS opponent_id
-    FROM    register
-    JOIN    matches ON
-        (register.tournament_id = matches.tournament_id) AND
-        (register.player_id = matches.loser_id);
+    SELECT  matches.tournament_id, matches.loser_id AS player_id, matches.winner_id AS opponent_id
+    FROM    matches;
 
 
 -- View on OMW (Opponent Match Wins) which shows total points for the opponents
@@ -85,28 +323,23 @@ CREATE VIEW opponents_points AS
     GROUP BY opponents.tournament_id, opponents.player_id;
 
 
--- View to query player standings, ordered by number of points and opponents points
+-- View to query player standings, ordered by number of points and opponents points.
+-- Matches played and opponents points are maintained in the register table, so
+-- reading the standings of a tournament is an ordered scan of register_standings_idx.
+-- Names are looked up by player id, as a join with players would be planned as a scan
+-- of every player of every tournament.
 CREATE VIEW standings AS
-    SELECT  register.player_id  AS id,
-            players.name        AS name,
-            register.wins       AS wins,
-            COUNT( matches )    AS matches,
-            register.byes       AS byes
+    SELECT  register.tournament_id       AS tournament_id,
+            register.player_id           AS id,
+            ( SELECT players.name FROM players
+              WHERE players.id = register.player_id ) AS name,
+            register.wins                AS wins,
+            register.matches             AS matches,
+            register.byes                AS byes,
+            register.points              AS points,
+            register.opponents_points    AS opponents_points
     FROM   register
-    LEFT JOIN players ON
-        (register.player_id = players.id)
-    LEFT JOIN matches ON
-        (register.tournament_id = matches.tournament_id) AND
-        (
-            (register.player_id = matches.winner_id) OR
-            (register.player_id = matches.loser_id)
-        )
-    LEFT JOIN opponents_points ON
-        (register.tournament_id = opponents_points.tournament_id) AND
-        (register.player_id = opponents_points.player_id)
-    GROUP BY
-        register.tournament_id, register.player_id, players.name, opponents_points.opponents_points
-
     ORDER BY
         register.points DESC, 
-        opponents_points.opponents_points DESC;
+        register.opponents_points DESC,
+        register.player_id;
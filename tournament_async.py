@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+#
+# tournament_async.py -- asyncio version of the tournament.py functions
+#
+# The functions mirror those in tournament.py but are coroutines running on an
+# asyncpg connection pool, so the calls of many tournaments can overlap on one
+# event loop instead of each blocking a thread:
+#
+#   standings = await tournament_async.playerStandings(tournament_id)
+#
+# Requires Python 3.7 or later and asyncpg.
+#
+
+import asyncio
+from collections import defaultdict
+
+import asyncpg
+
+import tournament
+
+# asyncpg takes connection URIs rather than libpq keyword strings
+ASYNC_DSN = "postgresql:///tournament"
+
+
+class AsyncTournamentPool(object):
+    """Runs the tournament operations on an asyncpg connection pool.
+
+    Every operation acquires a connection for its own duration, so concurrent
+    operations share at most the pool's max_size connections. The methods take
+    the same arguments as the functions in tournament.py of the same name,
+    refer to those for documentation. Like TournamentPool, the pool keeps an
+    OpponentsCache of recently paired tournaments and a StandingsCache of
+    recently read standings only if created with an opponents_cache_size and
+    standings_cache_rows.
+    """
+
+    def __init__(self, pool, opponents_cache_size = 0,
+                 standings_cache_rows = 0):
+        self.pool = pool
+        self.opponents_cache = tournament.OpponentsCache(opponents_cache_size)
+        self.standings_cache = tournament.StandingsCache(standings_cache_rows)
+
+    @classmethod
+    async def create(cls, dsn = ASYNC_DSN, min_size = 1,
+                     max_size = tournament.POOL_SIZE,
+                     opponents_cache_size = 0, standings_cache_rows = 0):
+        """Returns an AsyncTournamentPool on a new asyncpg pool."""
+        pool = await asyncpg.create_pool(dsn, min_size = min_size,
+            max_size = max_size)
+        return cls(pool, opponents_cache_size, standings_cache_rows)
+
+    async def close(self):
+        """Closes all the connections of the pool."""
+        await self.pool.close()
+
+    async def createTournament(self, name):
+        return await self.pool.fetchval(
+            "INSERT INTO tournaments ( name ) VALUES ( $1 ) RETURNING id", name)
+
+    async def deleteMatches(self, tournament_id = 1):
+        async with self.pool.acquire() as db:
+            async with db.transaction():
+                await db.execute(
+                    "DELETE FROM matches WHERE tournament_id = $1",
+                    tournament_id)
+                # Reset the results of the players who have any, see
+                # tournament.py
+                await db.execute('''
+                UPDATE register
+                    SET wins = 0, points = 0, byes = 0, matches = 0,
+                        opponents_points = NULL
+                    WHERE tournament_id = $1 AND
+                          ( wins <> 0 OR points <> 0 OR byes <> 0 OR
+                            matches <> 0 OR opponents_points IS NOT NULL )
+                ''', tournament_id)
+        self.opponents_cache.invalidate(tournament_id)
+        self.standings_cache.invalidate(tournament_id)
+
+    async def deletePlayers(self):
+        async with self.pool.acquire() as db:
+            await db.execute("TRUNCATE matches, register, players")
+        self.opponents_cache.invalidate()
+        self.standings_cache.invalidate()
+
+    async def countPlayers(self, tournament_id = 1):
+        return await self.pool.fetchval('''
+        SELECT COUNT( player_id ) AS player_count
+            FROM register
+            WHERE tournament_id = $1
+        ''', tournament_id)
+
+    async def registerPlayer(self, name, tournament_id = 1):
+        async with self.pool.acquire() as db:
+            async with db.transaction():
+                player_id = await db.fetchval(
+                    "INSERT INTO players ( name ) VALUES ( $1 ) RETURNING id",
+                    name)
+                await db.execute('''
+                INSERT INTO register ( tournament_id, player_id )
+                    VALUES ( $1, $2 )
+                ''', tournament_id, player_id)
+        self.standings_cache.invalidate(tournament_id)
+        return player_id
+
+    async def registerPlayers(self, names, tournament_id = 1):
+        names = list(names)
+        if not names:
+            return []
+        async with self.pool.acquire() as db:
+            async with db.transaction():
+                # Reserve the ids up front so they are returned in input order
+                rows = await db.fetch(
+                    "SELECT nextval('players_id_seq') FROM generate_series(1, $1)",
+                    len(names))
+                player_ids = sorted(row[0] for row in rows)
+                await db.copy_records_to_table('players',
+                    records = list(zip(player_ids, names)),
+                    columns = ('id', 'name'))
+                await db.copy_records_to_table('register',
+                    records = [(tournament_id, player_id)
+                        for player_id in player_ids],
+                    columns = ('tournament_id', 'player_id'))
+        self.standings_cache.invalidate(tournament_id)
+        return player_ids
+
+    async def playerStandings(self, tournament_id = 1, includeBye = False):
+        standings = self.standings_cache.get(tournament_id, includeBye == True)
+        if standings is not None:
+            return standings
+        version = self.standings_cache.version(tournament_id)
+        columns = "id, name, wins, matches"
+        if includeBye == True:
+            columns += ", byes"
+        async with self.pool.acquire() as db:
+            standings = await self._standings(db, tournament_id, columns)
+        self.standings_cache.put(tournament_id, includeBye == True, standings,
+            version)
+        return standings
+
+    async def _standings(self, db, tournament_id, columns):
+        rows = await db.fetch('''
+        SELECT %s FROM standings
+            WHERE tournament_id = $1
+            ORDER BY points DESC, opponents_points DESC, id
+        ''' % columns, tournament_id)
+        return [tuple(row) for row in rows]
+
+    async def reportMatch(self, winner, loser, tied = False, tournament_id = 1):
+        await self.reportMatches([(winner, loser, tied)], tournament_id)
+
+    async def reportMatches(self, results, tournament_id = 1):
+        matches, deltas = tournament.tallyResults(results)
+        player_ids = sorted(deltas)
+        async with self.pool.acquire() as db:
+            async with db.transaction():
+                # Lock the rows written below in order, see tournament.py
+                await db.execute("SELECT lock_register( $1, $2 )",
+                    tournament_id, sorted(set(player_ids).union(
+                        m[1] for m in matches)))
+                if matches:
+                    await db.execute('''
+                    INSERT INTO matches ( tournament_id, winner_id, loser_id, tied )
+                        SELECT $1, * FROM
+                        unnest( $2::integer[], $3::integer[], $4::boolean[] )
+                    ''', tournament_id, [m[0] for m in matches],
+                        [m[1] for m in matches], [m[2] for m in matches])
+                if deltas:
+                    await db.execute('''
+                    UPDATE register
+                        SET points = register.points + delta.points,
+                            wins = register.wins + delta.wins,
+                            byes = register.byes + delta.byes
+                        FROM unnest( $1::integer[], $2::integer[],
+                                     $3::integer[], $4::integer[] )
+                            AS delta ( player_id, points, wins, byes )
+                        WHERE register.tournament_id = $5 AND
+                              register.player_id = delta.player_id
+                    ''', player_ids, [deltas[p][0] for p in player_ids],
+                        [deltas[p][1] for p in player_ids],
+                        [deltas[p][2] for p in player_ids], tournament_id)
+        self.standings_cache.invalidate(tournament_id)
+        if matches:
+            self.opponents_cache.addMatches(tournament_id, matches)
+
+    async def getOpponents(self, tournament_id = 1):
+        async with self.pool.acquire() as db:
+            opponents = await self._opponentSets(db, tournament_id)
+        opponents_table = defaultdict(list)
+        for player_id, opponent_ids in opponents.items():
+            opponents_table[player_id].extend(opponent_ids)
+        return opponents_table
+
+    async def _opponentSets(self, db, tournament_id):
+        opponents = self.opponents_cache.get(tournament_id)
+        if opponents is not None:
+            return opponents
+        version = self.opponents_cache.version(tournament_id)
+        rows = await db.fetch('''
+            SELECT player_id, opponent_id FROM opponents
+            WHERE tournament_id = $1
+        ''', tournament_id)
+        opponents = defaultdict(set)
+        for row in rows:
+            opponents[row[0]].add(row[1])
+        opponents = dict((player_id, frozenset(opponent_ids))
+            for (player_id, opponent_ids) in opponents.items())
+        self.opponents_cache.put(tournament_id, opponents, version)
+        return opponents
+
+    async def swissPairings(self, tournament_id = 1,
+                            mode = tournament.GREEDY_PAIRING,
+                            time_budget = tournament.PAIRING_TIME_BUDGET,
+                            byes = None):
+        async with self.pool.acquire() as db:
+            standings = await self._standings(db, tournament_id,
+                "id, name, wins, matches, byes, points")
+            opponents = await self._opponentSets(db, tournament_id)
+        # The pairing itself is plain Python and may search for up to
+        # time_budget seconds, so it runs in the loop's default executor
+        # instead of holding up the coroutines of other tournaments
+        return await asyncio.get_running_loop().run_in_executor(None,
+            tournament.pairStandings, standings, opponents, mode, time_budget,
+            byes)
+
+
+# Pool used by the module level coroutines, created on first use
+_default_pool = None
+_default_pool_lock = None
+
+
+async def getDefaultPool():
+    """Returns the AsyncTournamentPool shared by the module level coroutines."""
+    global _default_pool, _default_pool_lock
+    if _default_pool_lock is None:
+        _default_pool_lock = asyncio.Lock()
+    async with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = await AsyncTournamentPool.create()
+        return _default_pool
+
+
+async def closeDefaultPool():
+    """Closes the pool of the module level coroutines, if it was created."""
+    global _default_pool
+    if _default_pool is not None:
+        pool, _default_pool = _default_pool, None
+        await pool.close()
+
+
+async def createTournament(name):
+    """See tournament.createTournament()."""
+    return await (await getDefaultPool()).createTournament(name)
+
+
+async def deleteMatches(tournament_id = 1):
+    """See tournament.deleteMatches()."""
+    await (await getDefaultPool()).deleteMatches(tournament_id)
+
+
+async def deletePlayers():
+    """See tournament.deletePlayers()."""
+    await (await getDefaultPool()).deletePlayers()
+
+
+async def countPlayers(tournament_id = 1):
+    """See tournament.countPlayers()."""
+    return await (await getDefaultPool()).countPlayers(tournament_id)
+
+
+async def registerPlayer(name, tournament_id = 1):
+    """See tournament.registerPlayer()."""
+    return await (await getDefaultPool()).registerPlayer(name, tournament_id)
+
+
+async def registerPlayers(names, tournament_id = 1):
+    """See tournament.registerPlayers()."""
+    return await (await getDefaultPool()).registerPlayers(names, tournament_id)
+
+
+async def playerStandings(tournament_id = 1, includeBye = False):
+    """See tournament.playerStandings()."""
+    return await (await getDefaultPool()).playerStandings(tournament_id,
+        includeBye)
+
+
+async def reportMatch(winner, loser, tied = False, tournament_id = 1):
+    """See tournament.reportMatch()."""
+    await (await getDefaultPool()).reportMatch(winner, loser, tied,
+        tournament_id)
+
+
+async def reportMatches(results, tournament_id = 1):
+    """See tournament.reportMatches()."""
+    await (await getDefaultPool()).reportMatches(results, tournament_id)
+
+
+async def getOpponents(tournament_id = 1):
+    """See tournament.getOpponents()."""
+    return await (await getDefaultPool()).getOpponents(tournament_id)
+
+
+async def swissPairings(tournament_id = 1, mode = tournament.GREEDY_PAIRING,
+                        time_budget = tournament.PAIRING_TIME_BUDGET,
+                        byes = None):
+    """See tournament.swissPairings()."""
+    return await (await getDefaultPool()).swissPairings(tournament_id, mode,
+        time_budget, byes)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+#
+# Test cases for tournament_async.py, run against the same database as
+# tournament_test.py. Needs Python 3.7 or later and asyncpg.
+
+import asyncio
+
+import tournament
+import tournament_async
+
+NAMES = ["Player %d" % number for number in range(9)]
+
+
+def byName(rows):
+    """Returns standings rows keyed by name, without the player ids."""
+    return dict((row[1], row[2:]) for row in rows)
+
+
+def pairedNames(pairings):
+    """Returns the pairings as sets of the names of the paired players."""
+    return set(frozenset([name1, name2])
+               for (id1, name1, id2, name2) in pairings)
+
+
+def playRounds(pairings, report, rounds):
+    """Reports rounds of results for the pairings of each round, the lower
+    name winning and every third table tied."""
+    for round_number in range(rounds):
+        results = []
+        for table, (id1, name1, id2, name2) in enumerate(pairings()):
+            if name2 < name1:
+                id1, id2 = id2, id1
+            results.append((id1, id2, table % 3 == 2))
+        report(results)
+
+
+async def testRegisterCount(pool):
+    await pool.deleteMatches()
+    await pool.deletePlayers()
+    if await pool.countPlayers() != 0:
+        raise ValueError("After deleting, countPlayers() should return zero.")
+    player_id = await pool.registerPlayer("Chandra Nalaar")
+    ids = await pool.registerPlayers(["Markov Chaney", "Joe Malik"])
+    if await pool.countPlayers() != tournament.countPlayers() or \
+            tournament.countPlayers() != 3:
+        raise ValueError("Players registered by the coroutines should be "
+                         "counted by both APIs.")
+    if ids != sorted(ids) or player_id in ids:
+        raise ValueError("registerPlayers should return new ids in input "
+                         "order.")
+    print("1. Players registered by the coroutines are seen by tournament.py.")
+
+
+async def testParity(pool):
+    loop = asyncio.get_running_loop()
+    # The same rounds are played through tournament.py and through the
+    # coroutines, in two tournaments of the same database
+    await pool.deletePlayers()
+    blocking = tournament.createTournament("Blocking")
+    coroutines = await pool.createTournament("Coroutines")
+    tournament.registerPlayers(NAMES, blocking)
+    await pool.registerPlayers(NAMES, coroutines)
+
+    def syncRounds():
+        playRounds(lambda: tournament.swissPairings(blocking),
+                   lambda results: tournament.reportMatches(results,
+                                                            blocking), 3)
+    await loop.run_in_executor(None, syncRounds)
+    for round_number in range(3):
+        results = []
+        pairings = await pool.swissPairings(coroutines)
+        playRounds(lambda: pairings, results.extend, 1)
+        # Every table reports on its own, concurrently
+        await asyncio.gather(*[pool.reportMatch(winner, loser, tied,
+                                                coroutines)
+                               for (winner, loser, tied) in results])
+    standings = await pool.playerStandings(coroutines, True)
+    if byName(standings) != byName(tournament.playerStandings(blocking,
+                                                              True)):
+        raise ValueError("The coroutines should give the standings of "
+                         "tournament.py.")
+    if [row[1] for row in standings] != \
+            [row[1] for row in tournament.playerStandings(blocking)]:
+        raise ValueError("The coroutines should rank players like "
+                         "tournament.py.")
+    if pairedNames(await pool.swissPairings(coroutines)) != \
+            pairedNames(tournament.swissPairings(blocking)):
+        raise ValueError("The coroutines should pair like tournament.py.")
+    opponents = await pool.getOpponents(coroutines)
+    if sorted(len(ids) for ids in opponents.values()) != sorted(
+            len(ids) for ids in tournament.getOpponents(blocking).values()):
+        raise ValueError("The coroutines should read the opponents of "
+                         "tournament.py.")
+    await pool.deleteMatches(coroutines)
+    if any(row[2:] != (0, 0) for row in await pool.playerStandings(
+            coroutines)):
+        raise ValueError("Deleting matches should reset the standings.")
+    print("2. Coroutines give the standings and pairings of tournament.py.")
+
+
+async def testCaches():
+    pool = await tournament_async.AsyncTournamentPool.create(
+        tournament_async.ASYNC_DSN, opponents_cache_size=10,
+        standings_cache_rows=100)
+    try:
+        if pool.opponents_cache.size != 10 or \
+                pool.standings_cache.max_rows != 100:
+            raise ValueError("create() should pass the cache sizes on.")
+        await pool.deletePlayers()
+        await pool.registerPlayers(NAMES[:2])
+        await pool.playerStandings()
+        await pool.playerStandings()
+        if pool.standings_cache.stats()['hits'] != 1:
+            raise ValueError("Enabled caches should be used.")
+    finally:
+        await pool.close()
+    print("3. Caches can be enabled through create().")
+
+
+async def main():
+    pool = await tournament_async.AsyncTournamentPool.create()
+    try:
+        await testRegisterCount(pool)
+        await testParity(pool)
+    finally:
+        await pool.close()
+    await testCaches()
+    print("Success!  All tests pass!")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
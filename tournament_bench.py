@@ -0,0 +1,855 @@
+#!/usr/bin/env python
+#
+# tournament_bench.py -- benchmarks for the Swiss tournament implementation
+#
+# The database benchmarks delete all players and matches before they run, so
+# point them at a scratch database, e.g.:
+#
+#   python tournament_bench.py --dsn "dbname=tournament_bench" standings
+#
+# Every measurement is printed as one JSON object per line.
+#
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import random
+import time
+from collections import defaultdict
+
+import tournament
+import tournament_stats
+
+
+def report(benchmark, **fields):
+    """Prints one measurement as a line of JSON."""
+    fields['benchmark'] = benchmark
+    print(json.dumps(fields, sort_keys = True))
+
+
+def timeCall(repeat, function, *args):
+    """Returns the average number of seconds a call of function(*args) takes."""
+    start = time.time()
+    for _ in range(repeat):
+        function(*args)
+    return (time.time() - start) / repeat
+
+
+def randomRound(player_ids, rng, tie_rate = 0.1):
+    """Returns the results of a round between randomly paired players.
+
+    Arg:
+      player_ids: ids of the players taking part in the round
+      rng: random.Random instance used to pair players and pick results
+      tie_rate: probability of a match ending in a tie
+
+    Returns:
+      A list of (winner, loser, tied) tuples as taken by reportMatches(). For
+      an odd number of players the last player gets a bye game.
+    """
+    ids = list(player_ids)
+    rng.shuffle(ids)
+    results = []
+    for index in range(0, len(ids) - 1, 2):
+        results.append((ids[index], ids[index + 1], rng.random() < tie_rate))
+    if len(ids) % 2 != 0:
+        results.append((ids[-1], ids[-1], False))
+    return results
+
+
+def syntheticStandings(players, rounds, rng, tie_rate = 0.1):
+    """Returns the standings and opponents of a randomly played tournament.
+
+    Arg:
+      players: number of players in the tournament
+      rounds: number of random rounds played
+      rng: random.Random instance used to generate the results
+      tie_rate: probability of a match ending in a tie
+
+    Returns:
+      A tuple (standings, opponents_table) as taken by pairStandings(). The
+      rows of standings are (id, name, wins, matches, byes, points).
+    """
+    player_ids = list(range(1, players + 1))
+    register = dict((player_id, [0, 0, 0]) for player_id in player_ids)
+    matches = defaultdict(int)
+    opponents_table = defaultdict(list)
+    for _ in range(rounds):
+        round_matches, deltas = tournament.tallyResults(
+            randomRound(player_ids, rng, tie_rate))
+        for (winner, loser, tied) in round_matches:
+            matches[winner] += 1
+            matches[loser] += 1
+            if loser not in opponents_table[winner]:
+                opponents_table[winner].append(loser)
+                opponents_table[loser].append(winner)
+        for player_id, delta in deltas.items():
+            for column in range(3):
+                register[player_id][column] += delta[column]
+    # register[player_id] holds [points, wins, byes]
+    player_ids.sort(key = lambda player_id: -register[player_id][0])
+    standings = [(player_id, 'Player %d' % player_id, register[player_id][1],
+        matches[player_id], register[player_id][2], register[player_id][0])
+        for player_id in player_ids]
+    return standings, opponents_table
+
+
+def fieldSizes(players, fields):
+    """Returns the number of players of each field to benchmark.
+
+    Arg:
+      players: approximate field sizes
+      fields: 'even', 'odd' or both, for each size the even or odd field
+              nearest to it is benchmarked
+    """
+    sizes = []
+    for count in players:
+        even = count - count % 2
+        if 'even' in fields:
+            sizes.append(even)
+        if 'odd' in fields:
+            sizes.append(even + 1)
+    return sizes
+
+
+def pairedResults(pairings, rng, tie_rate = 0.1):
+    """Returns random results for the pairings of swissPairings().
+
+    Pairings of a player with itself are bye games.
+    """
+    results = []
+    for (id1, name1, id2, name2) in pairings:
+        if id1 == id2:
+            results.append((id1, id1, False))
+        elif rng.random() < 0.5:
+            results.append((id1, id2, rng.random() < tie_rate))
+        else:
+            results.append((id2, id1, rng.random() < tie_rate))
+    return results
+
+
+def timeEach(calls):
+    """Times each call of a list of (function, args) pairs.
+
+    Returns:
+      A tuple (average, highest) of the milliseconds the calls took.
+    """
+    times = []
+    for function, args in calls:
+        start = time.time()
+        function(*args)
+        times.append(time.time() - start)
+    if not times:
+        return 0.0, 0.0
+    return (round(1000 * sum(times) / len(times), 3),
+            round(1000 * max(times), 3))
+
+
+def benchRounds(session, backend, players, rounds, tie_rate, sample, seed):
+    """Plays a synthetic tournament and times the hot paths of every round.
+
+    A new tournament is created and registered, with the first sample players
+    registered one at a time by registerPlayer(). Every round is paired with
+    swissPairings(), after reading playerStandings() and getOpponents(), and
+    its results are drawn at random with a tie_rate share of ties. sample of
+    them are reported one at a time by reportMatch(), the remaining ones with
+    reportMatches().
+    """
+    rng = random.Random(seed)
+    tournament_id = session.createTournament('Benchmark %d' % players)
+    names = ['Player %d' % number for number in range(players)]
+    single = min(sample, players)
+    register_ms, register_max_ms = timeEach(
+        [(session.registerPlayer, (name, tournament_id))
+         for name in names[:single]])
+    start = time.time()
+    session.registerPlayers(names[single:], tournament_id)
+    report('rounds', backend = backend, players = players, round = 0,
+        register_player_ms = register_ms,
+        register_player_max_ms = register_max_ms,
+        register_players_ms = round(1000 * (time.time() - start), 3))
+    for round_number in range(1, rounds + 1):
+        fields = {}
+        start = time.time()
+        session.playerStandings(tournament_id)
+        fields['standings_ms'] = round(1000 * (time.time() - start), 3)
+        start = time.time()
+        session.getOpponents(tournament_id)
+        fields['opponents_ms'] = round(1000 * (time.time() - start), 3)
+        start = time.time()
+        pairings = session.swissPairings(tournament_id)
+        fields['pairings_ms'] = round(1000 * (time.time() - start), 3)
+        results = pairedResults(pairings, rng, tie_rate)
+        single = min(sample, len(results))
+        fields['report_match_ms'], fields['report_match_max_ms'] = timeEach(
+            [(session.reportMatch, result + (tournament_id, ))
+             for result in results[:single]])
+        start = time.time()
+        session.reportMatches(results[single:], tournament_id)
+        fields['report_matches_ms'] = round(1000 * (time.time() - start), 3)
+        report('rounds', backend = backend, players = players,
+            round = round_number, tie_rate = tie_rate, **fields)
+
+
+def reportStats(stats):
+    """Prints the totals collected by a tournament_stats.Stats hook."""
+    for kind, entries in sorted(stats.snapshot().items()):
+        for name, entry in sorted(entries.items()):
+            report('instrumentation', kind = kind, name = name,
+                count = entry['count'], rows = entry['rows'],
+                ms = round(1000 * entry['seconds'], 3),
+                max_ms = round(1000 * entry['max_seconds'], 3))
+
+
+def peakMemory(function, *args):
+    """Returns the peak memory in KiB allocated by function(*args).
+
+    Returns None if tracemalloc is not available (Python 2).
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+def benchPairing(players, rounds, repeat, mode, time_budget):
+    """Times pairStandings() for a growing number of players, and measures
+    the peak memory of a call."""
+    for count in players:
+        standings, opponents_table = syntheticStandings(count, rounds,
+            random.Random(count))
+        seconds = timeCall(repeat, tournament.pairStandings, standings,
+            opponents_table, mode, time_budget)
+        pairings = tournament.pairStandings(standings, opponents_table, mode,
+            time_budget)
+        rematches = sum(1 for (id1, name1, id2, name2) in pairings
+            if id2 in opponents_table[id1])
+        report('pairing', players = count, rounds = rounds, mode = mode,
+            rematches = rematches, ms = round(seconds * 1000, 3),
+            peak_kib = peakMemory(tournament.pairStandings, standings,
+                opponents_table, mode, time_budget))
+
+
+def uncachedStandings(pool, session):
+    """Returns a function reading the standings of a tournament from the
+    database, dropping them from the pool's standings cache first."""
+    def standings(tournament_id = 1):
+        pool.standings_cache.invalidate(tournament_id)
+        return session.playerStandings(tournament_id)
+    return standings
+
+
+def benchStandings(pool, players, rounds, step, repeat):
+    """Times playerStandings() while the number of recorded matches grows.
+
+    ms is the time of a read from the database, with the standings cache
+    dropped before every call, and cached_ms the time of a cache hit.
+    """
+    rng = random.Random(players)
+    cache = pool.standings_cache
+    with pool.session() as session:
+        session.deletePlayers()
+        player_ids = session.registerPlayers(
+            ['Player %d' % number for number in range(players)])
+        for round_number in range(rounds + 1):
+            if round_number % step == 0:
+                seconds = timeCall(repeat, uncachedStandings(pool, session))
+                cached = timeCall(repeat, session.playerStandings)
+                report('standings', players = players,
+                    matches = round_number * (players // 2),
+                    ms = round(seconds * 1000, 3),
+                    cached_ms = round(cached * 1000, 3),
+                    cache = cache.stats())
+            session.reportMatches(randomRound(player_ids, rng))
+
+
+def populateTournament(session, tournament_id, players, rounds, rng):
+    """Registers players in a tournament and reports random rounds for them."""
+    player_ids = session.registerPlayers(
+        ['Player %d' % number for number in range(players)], tournament_id)
+    for _ in range(rounds):
+        session.reportMatches(randomRound(player_ids, rng), tournament_id)
+    return player_ids
+
+
+def benchTournaments(pool, players, rounds, events, repeat):
+    """Times pairing one tournament while the number of other events grows."""
+    rng = random.Random(players)
+    with pool.session() as session:
+        session.deletePlayers()
+        target = session.createTournament('Benchmark event')
+        populateTournament(session, target, players, rounds, rng)
+        populated = 0
+        for count in sorted(events):
+            while populated < count:
+                other = session.createTournament('Event %d' % populated)
+                populateTournament(session, other, players, rounds, rng)
+                populated += 1
+            report('tournaments', players = players, rounds = rounds,
+                events = count,
+                pairings_ms = round(1000 * timeCall(repeat,
+                    session.swissPairings, target), 3),
+                standings_ms = round(1000 * timeCall(repeat,
+                    uncachedStandings(pool, session), target), 3))
+
+
+def loadHistoricEvent(session, players, rounds):
+    """Adds a finished event straight to the database and returns its number
+    of matches.
+
+    The players are registered with registerPlayers(), the matches of all
+    rounds are generated by one INSERT, which is much faster than reporting
+    them and as fast to query.
+    """
+    tournament_id = session.createTournament('Historic event')
+    player_ids = session.registerPlayers(
+        ['Player %d' % number for number in range(players)], tournament_id)
+    c = session.cursor()
+    c.execute('''
+    INSERT INTO matches ( tournament_id, winner_id, loser_id, tied )
+        SELECT %s, ids[1 + ( 2 * pair + round ) %% %s],
+               ids[1 + ( 2 * pair + 1 + round ) %% %s], false
+        FROM ( SELECT %s::integer[] AS ids ) AS players,
+             generate_series( 0, %s - 1 ) AS round,
+             generate_series( 0, %s - 1 ) AS pair
+    ''', (tournament_id, players, players, player_ids, rounds, players // 2))
+    session.db.commit()
+    return c.rowcount
+
+
+def benchHistory(pool, players, rounds, history, repeat):
+    """Times pairing a new event while the number of historic matches grows.
+
+    The new event is played before the history is loaded, so every
+    measurement pairs the same standings.
+    """
+    rng = random.Random(players)
+    with pool.session() as session:
+        session.deletePlayers()
+        target = session.createTournament('New event')
+        populateTournament(session, target, players, rounds, rng)
+        loaded = 0
+        for count in sorted(history):
+            start = time.time()
+            while loaded < count:
+                loaded += loadHistoricEvent(session, players, rounds)
+            load_seconds = time.time() - start
+
+            def uncachedPairings():
+                pool.opponents_cache.invalidate(target)
+                return session.swissPairings(target)
+
+            report('history', players = players, rounds = rounds,
+                historic_matches = loaded,
+                load_s = round(load_seconds, 3),
+                pairings_ms = round(1000 * timeCall(repeat,
+                    uncachedPairings), 3),
+                standings_ms = round(1000 * timeCall(repeat,
+                    uncachedStandings(pool, session), target), 3))
+
+
+def liveRows(session):
+    """Returns the number of rows in the live matches and register tables."""
+    c = session.cursor()
+    c.execute("SELECT (SELECT COUNT(*) FROM matches), "
+              "(SELECT COUNT(*) FROM register)")
+    return c.fetchone()
+
+
+def benchArchive(pool, players, rounds, events, repeat):
+    """Times reporting, resetting and archiving tournaments, and pairing a
+    running tournament before and after the finished ones are archived."""
+    rng = random.Random(players)
+    with pool.session() as session:
+        session.deletePlayers()
+        target = session.createTournament('Running event')
+        populateTournament(session, target, players, rounds, rng)
+        finished = []
+        start = time.time()
+        for number in range(events):
+            finished.append(session.createTournament('Event %d' % number))
+            populateTournament(session, finished[-1], players, rounds, rng)
+        report_seconds = time.time() - start
+
+        def measure(stage):
+            matches, register = liveRows(session)
+            report('archive', stage = stage, players = players,
+                rounds = rounds, events = events, live_matches = matches,
+                live_register = register,
+                pairings_ms = round(1000 * timeCall(repeat,
+                    session.swissPairings, target), 3),
+                standings_ms = round(1000 * timeCall(repeat,
+                    uncachedStandings(pool, session), target), 3))
+
+        measure('before')
+        start = time.time()
+        session.deleteMatches(finished[0])
+        reset_seconds = time.time() - start
+        start = time.time()
+        for tournament_id in finished:
+            session.archiveTournament(tournament_id)
+        archive_seconds = time.time() - start
+        measure('after')
+        report('archive', stage = 'writes', players = players,
+            rounds = rounds, events = events,
+            report_matches_per_second = int(events * rounds * (players // 2)
+                / report_seconds),
+            reset_ms = round(1000 * reset_seconds, 3),
+            archive_ms = round(1000 * archive_seconds / max(events, 1), 3))
+
+
+def benchParallel(events, players, rounds, workers):
+    """Times pairTournaments() for many events with a growing number of
+    worker processes."""
+    tournaments = dict((number, syntheticStandings(players, rounds,
+        random.Random(number))) for number in range(events))
+    baseline = None
+    expected = None
+    for count in workers:
+        start = time.time()
+        pairings = tournament.pairTournaments(tournaments, count)
+        seconds = time.time() - start
+        if baseline is None:
+            baseline = seconds
+            expected = pairings
+        report('parallel', events = events, players = players,
+            rounds = rounds, workers = count, seconds = round(seconds, 3),
+            speedup = round(baseline / seconds, 2),
+            same_pairings = pairings == expected)
+
+
+def benchSimulate(runs, players, rounds, result_model, workers):
+    """Times simulateMany() and prints the statistics of the simulations."""
+    import tournament_sim
+    for count in workers:
+        start = time.time()
+        summary = tournament_sim.simulateMany(runs, players, rounds,
+            result_model, workers = count)
+        seconds = time.time() - start
+        report('simulate', runs = runs, players = players, rounds = rounds,
+            result_model = result_model, workers = count,
+            seconds = round(seconds, 3),
+            runs_per_second = round(runs / seconds, 1),
+            rematches = summary['rematches'],
+            byes = dict((str(byes), players_with_byes) for
+                (byes, players_with_byes) in summary['byes'].items()),
+            stability = [round(value, 3) for value in summary['stability']],
+            strength_correlation = round(summary['strength_correlation'], 3))
+
+
+def benchTiebreaks(players, rounds, repeat):
+    """Times loading results into arrays and computing all tie breakers."""
+    import tournament_memory
+    import tournament_tiebreaks
+    for count in players:
+        rng = random.Random(count)
+        state = tournament_memory.TournamentState()
+        player_ids = state.registerPlayers(
+            ['Player %d' % number for number in range(count)])
+        for _ in range(rounds):
+            state.reportMatches(randomRound(player_ids, rng))
+        register = state.getRegister()
+        matches = state.getMatches()
+        load_seconds = timeCall(repeat, tournament_tiebreaks.TournamentResults,
+            register, matches)
+        results = tournament_tiebreaks.TournamentResults(register, matches)
+        seconds = timeCall(repeat, tournament_tiebreaks.computeTiebreaks,
+            results)
+        report('tiebreaks', players = count, rounds = rounds,
+            load_ms = round(load_seconds * 1000, 3),
+            ms = round(seconds * 1000, 3))
+
+
+def benchReplay(backend, events, players, rounds, seed):
+    """Times recovering a large event log in memory, its snapshots and its
+    replay into a backend."""
+    import shutil
+    import tempfile
+    import tournament_log
+    import tournament_memory
+    directory = tempfile.mkdtemp()
+    try:
+        log = tournament_log.EventLog(os.path.join(directory, 'events.log'))
+        logged = tournament_log.LoggedBackend(
+            tournament_memory.MemoryBackend(), log)
+        rng = random.Random(seed)
+        matches = 0
+        start = time.time()
+        with logged.session() as session:
+            for number in range(events):
+                tournament_id = session.createTournament('Event %d' % number)
+                player_ids = session.registerPlayers(
+                    ['Player %d' % index for index in range(players)],
+                    tournament_id)
+                for _ in range(rounds):
+                    results = randomRound(player_ids, rng)
+                    session.reportMatches(results, tournament_id)
+                    matches += len(results)
+        log_seconds = time.time() - start
+        start = time.time()
+        state, position = tournament_log.recover(log)
+        recover_seconds = time.time() - start
+        snapshot = os.path.join(directory, 'register.snapshot')
+        start = time.time()
+        tournament_log.writeSnapshot(state, snapshot, position)
+        write_seconds = time.time() - start
+        start = time.time()
+        tournament_log.readSnapshot(snapshot)
+        read_seconds = time.time() - start
+        start = time.time()
+        with backend.session() as session:
+            session.deletePlayers()
+            tournament_log.replay(log.events(), session)
+        replay_seconds = time.time() - start
+        report('replay', events = len(log), tournaments = events,
+            players = players, rounds = rounds, matches = matches,
+            log_bytes = os.path.getsize(log.path),
+            snapshot_bytes = os.path.getsize(snapshot),
+            log_ms = round(1000 * log_seconds, 3),
+            recover_ms = round(1000 * recover_seconds, 3),
+            recover_matches_per_second = int(matches / recover_seconds),
+            snapshot_write_ms = round(1000 * write_seconds, 3),
+            snapshot_read_ms = round(1000 * read_seconds, 3),
+            replay_ms = round(1000 * replay_seconds, 3),
+            replay_matches_per_second = int(matches / replay_seconds))
+        log.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+def _syncReport(arguments):
+    """Reports one match through a session of a TournamentPool."""
+    pool, winner, loser, tied, tournament_id = arguments
+    with pool.session() as session:
+        session.reportMatch(winner, loser, tied, tournament_id)
+
+
+def _syncStandings(arguments):
+    """Reads the standings of a tournament through a TournamentPool."""
+    pool, tournament_id = arguments
+    with pool.session() as session:
+        return session.playerStandings(tournament_id)
+
+
+def setUpEvents(pool, events, players, rounds, seed):
+    """Registers players in new events and draws the results of their rounds.
+
+    Returns:
+      A list of rounds, each a list of (winner, loser, tied, tournament_id).
+    """
+    rng = random.Random(seed)
+    schedule = [[] for _ in range(rounds)]
+    with pool.session() as session:
+        session.deletePlayers()
+        for number in range(events):
+            tournament_id = session.createTournament('Event %d' % number)
+            player_ids = session.registerPlayers(
+                ['Player %d' % index for index in range(players)],
+                tournament_id)
+            for round_number in range(rounds):
+                schedule[round_number].extend(
+                    (winner, loser, tied, tournament_id) for (winner, loser, tied)
+                    in randomRound(player_ids, rng) if winner != loser)
+    return schedule
+
+
+def medianSeconds(repeat, command):
+    """Returns the median wall time of running command in a new process."""
+    import subprocess
+    timings = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(repeat):
+            start = time.time()
+            subprocess.check_call(command, stdout = devnull)
+            timings.append(time.time() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def benchStartup(dsn, repeat):
+    """Times the cold start of new processes: the interpreter alone, importing
+    tournament.py with and without the database driver, and the command line
+    interface reading a page of standings with and without warm-up. Then times
+    connecting, the first call of a process including the connection, and the
+    second call."""
+    import sys
+    directory = os.path.dirname(os.path.abspath(__file__))
+    cli = os.path.join(directory, 'tournament_cli.py')
+    python = [sys.executable, '-c']
+    setup = 'import sys; sys.path.insert(0, %r); ' % directory
+    fields = {
+        'python_ms': medianSeconds(repeat, python + ['pass']),
+        'import_ms': medianSeconds(repeat, python + [setup +
+            'import tournament']),
+        'import_driver_ms': medianSeconds(repeat, python + [setup +
+            'import tournament, psycopg2.extensions']),
+        'cli_ms': medianSeconds(repeat, [sys.executable, cli, '--dsn', dsn,
+            'standings', '--page', '1']),
+        'cli_warmup_ms': medianSeconds(repeat, [sys.executable, cli, '--dsn',
+            dsn, '--warmup', 'standings', '--page', '1']),
+    }
+    pool = tournament.TournamentPool(dsn, 1)
+    try:
+        start = time.time()
+        with pool.session() as session:
+            fields['connect_ms'] = time.time() - start
+            session.standingsPage()
+            fields['first_call_ms'] = time.time() - start
+            start = time.time()
+            session.standingsPage()
+            fields['next_call_ms'] = time.time() - start
+    finally:
+        pool.closeall()
+    report('startup', repeat = repeat, **dict((name, round(1000 * seconds, 3))
+        for (name, seconds) in fields.items()))
+
+
+def benchAsync(dsn, async_dsn, events, players, rounds, connections):
+    """Compares the blocking functions on threads with tournament_async.
+
+    Each event reports every match of a round with reportMatch(), then reads
+    its standings, with the calls of all events running concurrently. The
+    blocking path runs them on a pool of threads, as an async front end has
+    to, and the asyncio path on a single event loop. Needs Python 3 and
+    asyncpg.
+    """
+    import asyncio
+    from multiprocessing.pool import ThreadPool
+    import tournament_async
+    pool = tournament.TournamentPool(dsn, connections)
+    threads = ThreadPool(connections)
+    try:
+        schedule = setUpEvents(pool, events, players, rounds, events)
+        tournament_ids = sorted(set(match[3] for match in schedule[0]))
+        start = time.time()
+        for matches in schedule:
+            threads.map(_syncReport, [(pool,) + match for match in matches])
+            threads.map(_syncStandings, [(pool, tournament_id)
+                for tournament_id in tournament_ids])
+        report('async', path = 'threads', events = events, players = players,
+            rounds = rounds, connections = connections,
+            seconds = round(time.time() - start, 3))
+    finally:
+        threads.close()
+        pool.closeall()
+
+    pool = tournament.TournamentPool(dsn, 1)
+    try:
+        schedule = setUpEvents(pool, events, players, rounds, events)
+    finally:
+        pool.closeall()
+    tournament_ids = sorted(set(match[3] for match in schedule[0]))
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    async_pool = loop.run_until_complete(tournament_async.AsyncTournamentPool
+        .create(async_dsn, max_size = connections))
+    try:
+        start = time.time()
+        for matches in schedule:
+            loop.run_until_complete(asyncio.gather(*[
+                async_pool.reportMatch(*match) for match in matches]))
+            loop.run_until_complete(asyncio.gather(*[
+                async_pool.playerStandings(tournament_id)
+                for tournament_id in tournament_ids]))
+        report('async', path = 'asyncio', events = events, players = players,
+            rounds = rounds, connections = connections,
+            seconds = round(time.time() - start, 3))
+    finally:
+        loop.run_until_complete(async_pool.close())
+        loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = 'Benchmarks for the Swiss tournament implementation.')
+    parser.add_argument('--dsn', default = tournament.DSN,
+        help = 'database to run the benchmarks against (default: %(default)s)')
+    subparsers = parser.add_subparsers(dest = 'benchmark')
+    standings = subparsers.add_parser('standings',
+        help = 'playerStandings() latency as the number of matches grows')
+    standings.add_argument('--players', type = int, default = 1000)
+    standings.add_argument('--rounds', type = int, default = 50)
+    standings.add_argument('--step', type = int, default = 10)
+    standings.add_argument('--repeat', type = int, default = 20)
+    tournaments = subparsers.add_parser('tournaments',
+        help = 'swissPairings() latency as the number of other events grows')
+    tournaments.add_argument('--players', type = int, default = 200)
+    tournaments.add_argument('--rounds', type = int, default = 5)
+    tournaments.add_argument('--events', type = int, nargs = '+',
+        default = [0, 10, 100])
+    tournaments.add_argument('--repeat', type = int, default = 20)
+    history = subparsers.add_parser('history',
+        help = 'swissPairings() latency of a new event as the number of '
+               'historic matches grows')
+    history.add_argument('--players', type = int, default = 1000)
+    history.add_argument('--rounds', type = int, default = 9)
+    history.add_argument('--history', type = int, nargs = '+',
+        default = [0, 100000, 1000000])
+    history.add_argument('--repeat', type = int, default = 20)
+    startup = subparsers.add_parser('startup',
+        help = 'cold start time of new processes and of the first call')
+    startup.add_argument('--repeat', type = int, default = 10)
+    load = subparsers.add_parser('async',
+        help = 'concurrent reportMatch()/playerStandings() load, threads '
+               'versus tournament_async (needs Python 3 and asyncpg)')
+    load.add_argument('--async-dsn', default = 'postgresql:///tournament',
+        help = 'asyncpg connection URI of the same database')
+    load.add_argument('--events', type = int, default = 50)
+    load.add_argument('--players', type = int, default = 32)
+    load.add_argument('--rounds', type = int, default = 5)
+    load.add_argument('--connections', type = int, default = 10)
+    pairing = subparsers.add_parser('pairing',
+        help = 'pairStandings() time as the number of players grows (no database)')
+    pairing.add_argument('--players', type = int, nargs = '+',
+        default = [1000, 5000, 20000, 50000])
+    pairing.add_argument('--rounds', type = int, default = 5)
+    pairing.add_argument('--repeat', type = int, default = 3)
+    pairing.add_argument('--mode', default = tournament.GREEDY_PAIRING,
+        choices = [tournament.GREEDY_PAIRING, tournament.OPTIMAL_PAIRING])
+    pairing.add_argument('--time-budget', type = float,
+        default = tournament.PAIRING_TIME_BUDGET)
+    parallel = subparsers.add_parser('parallel',
+        help = 'pairTournaments() time by number of worker processes '
+               '(no database)')
+    parallel.add_argument('--events', type = int, default = 200)
+    parallel.add_argument('--players', type = int, default = 2000)
+    parallel.add_argument('--rounds', type = int, default = 5)
+    parallel.add_argument('--workers', type = int, nargs = '+',
+        default = [1, 2, 4, 8])
+    tiebreaks = subparsers.add_parser('tiebreaks',
+        help = 'computeTiebreaks() time as the number of players grows '
+               '(no database, needs NumPy)')
+    tiebreaks.add_argument('--players', type = int, nargs = '+',
+        default = [1000, 10000, 100000])
+    tiebreaks.add_argument('--rounds', type = int, default = 9)
+    tiebreaks.add_argument('--repeat', type = int, default = 3)
+    simulation = subparsers.add_parser('simulate',
+        help = 'simulateMany() throughput and statistics (no database)')
+    simulation.add_argument('--runs', type = int, default = 1000)
+    simulation.add_argument('--players', type = int, default = 64)
+    simulation.add_argument('--rounds', type = int, default = 6)
+    simulation.add_argument('--result-model', default = 'rated',
+        choices = ['random', 'rated'])
+    simulation.add_argument('--workers', type = int, nargs = '+',
+        default = [1, 4])
+    suite = subparsers.add_parser('rounds',
+        help = 'registerPlayer(), reportMatch(), playerStandings(), '
+               'getOpponents() and swissPairings() latency in every round '
+               'of synthetic tournaments')
+    suite.add_argument('--backend', default = 'postgres',
+        choices = ['postgres', 'memory'],
+        help = 'memory runs on tournament_memory without a database')
+    suite.add_argument('--players', type = int, nargs = '+',
+        default = [1000, 10000, 100000])
+    suite.add_argument('--fields', nargs = '+', default = ['even', 'odd'],
+        choices = ['even', 'odd'])
+    suite.add_argument('--rounds', type = int, default = 9)
+    suite.add_argument('--tie-rate', type = float, default = 0.1)
+    suite.add_argument('--sample', type = int, default = 100,
+        help = 'registrations and results per round timed one call at a '
+               'time, the others are written in bulk')
+    suite.add_argument('--instrument', action = 'store_true',
+        help = 'also print the time spent per function and SQL statement')
+    replay = subparsers.add_parser('replay',
+        help = 'recovery, snapshot and replay time of a large event log')
+    replay.add_argument('--backend', default = 'postgres',
+        choices = ['postgres', 'memory'],
+        help = 'backend the log is replayed into')
+    replay.add_argument('--events', type = int, default = 20)
+    replay.add_argument('--players', type = int, default = 5000)
+    replay.add_argument('--rounds', type = int, default = 9)
+    archive = subparsers.add_parser('archive',
+        help = 'reset and archive time of finished events, and pairing '
+               'latency of a running event before and after archiving them')
+    archive.add_argument('--players', type = int, default = 1000)
+    archive.add_argument('--rounds', type = int, default = 9)
+    archive.add_argument('--events', type = int, default = 20)
+    archive.add_argument('--repeat', type = int, default = 10)
+    args = parser.parse_args()
+    if args.benchmark == 'replay':
+        if args.backend == 'memory':
+            import tournament_memory
+            backend = tournament_memory.MemoryBackend()
+        else:
+            backend = tournament.TournamentPool(args.dsn, 1)
+        try:
+            benchReplay(backend, args.events, args.players, args.rounds,
+                args.events)
+        finally:
+            backend.closeall()
+        return
+    if args.benchmark == 'rounds':
+        if args.backend == 'memory':
+            import tournament_memory
+            backend = tournament_memory.MemoryBackend()
+        else:
+            backend = tournament.TournamentPool(args.dsn, 1)
+        stats = None
+        if args.instrument:
+            stats = tournament_stats.Stats()
+            tournament_stats.addHook(stats)
+        try:
+            with backend.session() as session:
+                if args.backend == 'postgres':
+                    session.deletePlayers()
+                for count in fieldSizes(args.players, args.fields):
+                    benchRounds(session, args.backend, count, args.rounds,
+                        args.tie_rate, args.sample, count)
+        finally:
+            backend.closeall()
+        if stats is not None:
+            tournament_stats.removeHook(stats)
+            reportStats(stats)
+        return
+    if args.benchmark == 'startup':
+        benchStartup(args.dsn, args.repeat)
+        return
+    if args.benchmark == 'pairing':
+        benchPairing(args.players, args.rounds, args.repeat, args.mode,
+            args.time_budget)
+        return
+    if args.benchmark == 'parallel':
+        benchParallel(args.events, args.players, args.rounds, args.workers)
+        return
+    if args.benchmark == 'simulate':
+        benchSimulate(args.runs, args.players, args.rounds,
+            args.result_model, args.workers)
+        return
+    if args.benchmark == 'tiebreaks':
+        benchTiebreaks(args.players, args.rounds, args.repeat)
+        return
+    # Only the standings benchmark times hits of the standings cache
+    pool = tournament.TournamentPool(args.dsn, 1, standings_cache_rows =
+        tournament.STANDINGS_CACHE_ROWS if args.benchmark == 'standings'
+        else 0)
+    try:
+        if args.benchmark == 'standings':
+            benchStandings(pool, args.players, args.rounds, args.step,
+                args.repeat)
+        elif args.benchmark == 'async':
+            benchAsync(args.dsn, args.async_dsn, args.events, args.players,
+                args.rounds, args.connections)
+        elif args.benchmark == 'tournaments':
+            benchTournaments(pool, args.players, args.rounds, args.events,
+                args.repeat)
+        elif args.benchmark == 'history':
+            benchHistory(pool, args.players, args.rounds, args.history,
+                args.repeat)
+        elif args.benchmark == 'archive':
+            benchArchive(pool, args.players, args.rounds, args.events,
+                args.repeat)
+        else:
+            parser.error('choose a benchmark to run')
+    finally:
+        pool.closeall()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+#
+# tournament_cli.py -- command line interface to the tournament functions
+#
+# Runs one tournament operation per call, for scripts and short-lived
+# workers:
+#
+#   python tournament_cli.py register Alice Bob Carol Dave
+#   python tournament_cli.py report 1 2
+#   python tournament_cli.py standings --page 1
+#   python tournament_cli.py pair --tournament 2 --format json
+#
+# Only the modules an operation needs are loaded: the database driver is
+# imported when the first connection is opened. With --warmup, that connection
+# is opened in the background while the command reads its input.
+#
+
+from __future__ import print_function
+
+import argparse
+import sys
+import threading
+
+import tournament
+
+
+def readNames(args):
+    """Returns the names given as arguments, or read one per line from the
+    standard input."""
+    if args.names and args.names != ['-']:
+        return args.names
+    return [line.rstrip('\r\n') for line in sys.stdin if line.strip()]
+
+
+def parseResult(line):
+    """Returns the (winner, loser, tied) tuple of a "winner loser [tied]"
+    line. The match is a tie if the third field is 1, true or tied."""
+    fields = line.split()
+    if len(fields) not in (2, 3):
+        raise ValueError("expected 'winner loser [tied]', got %r" % (line, ))
+    tied = len(fields) == 3 and fields[2].lower() in ('1', 'true', 'tied')
+    return (int(fields[0]), int(fields[1]), tied)
+
+
+def register(args):
+    """Registers players and prints their ids, one per line."""
+    for player_id in tournament.registerPlayers(readNames(args),
+            args.tournament):
+        print(player_id)
+
+
+def report(args):
+    """Reports a match, or a whole round read from the standard input."""
+    if args.winner is not None:
+        if args.loser is None:
+            raise ValueError("a loser is needed with a winner")
+        tournament.reportMatch(args.winner, args.loser, args.tied,
+            args.tournament)
+        return
+    tournament.reportMatches([parseResult(line) for line in sys.stdin
+        if line.strip()], args.tournament)
+
+
+def standings(args):
+    """Prints the standings, or a single page of them."""
+    if args.page is None:
+        tournament.exportStandings(sys.stdout, args.tournament, args.format,
+            args.byes)
+        return
+    rows = tournament.standingsPage(args.tournament, args.page,
+        args.page_size, args.byes)
+    columns = ['id', 'name', 'wins', 'matches']
+    if args.byes:
+        columns.append('byes')
+    write = tournament._rowWriter(sys.stdout, columns, args.format)
+    for row in rows:
+        write(row)
+
+
+def pair(args):
+    """Prints the pairings of the next round."""
+    pairings = tournament.swissPairings(args.tournament, args.mode,
+        args.time_budget, args.byes)
+    write = tournament._rowWriter(sys.stdout, ['id1', 'name1', 'id2', 'name2'],
+        args.format)
+    for pairing in pairings:
+        write(pairing)
+
+
+def warmup(pool):
+    """Opens the connection of pool, errors are left to the command."""
+    try:
+        pool.warmup()
+    except Exception:
+        pass
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+        description = 'Runs a Swiss tournament operation.')
+    parser.add_argument('--dsn', default = tournament.DSN,
+        help = 'database to connect to (default: %(default)s)')
+    parser.add_argument('--warmup', action = 'store_true',
+        help = 'connect in the background while the input is read')
+    subparsers = parser.add_subparsers(dest = 'operation')
+    # Every operation takes the tournament
+    common = argparse.ArgumentParser(add_help = False)
+    common.add_argument('--tournament', type = int, default = 1,
+        help = 'tournament id (default: %(default)s)')
+
+    names = subparsers.add_parser('register', parents = [common],
+        help = 'register players and print their ids')
+    names.add_argument('names', nargs = '*',
+        help = 'player names, read one per line from the standard input if '
+               'none or - is given')
+    names.set_defaults(run = register)
+
+    results = subparsers.add_parser('report', parents = [common],
+        help = 'report a match, or "winner loser [tied]" lines from the '
+               'standard input')
+    results.add_argument('winner', type = int, nargs = '?')
+    results.add_argument('loser', type = int, nargs = '?')
+    results.add_argument('--tied', action = 'store_true')
+    results.set_defaults(run = report)
+
+    ranking = subparsers.add_parser('standings', parents = [common],
+        help = 'print the standings')
+    ranking.add_argument('--byes', action = 'store_true',
+        help = 'include the number of byes')
+    ranking.add_argument('--page', type = int,
+        help = 'only print this page of the standings')
+    ranking.add_argument('--page-size', type = int,
+        default = tournament.STANDINGS_PAGE_SIZE)
+    ranking.add_argument('--format', default = 'csv', choices = ['csv', 'json'])
+    ranking.set_defaults(run = standings)
+
+    pairing = subparsers.add_parser('pair', parents = [common],
+        help = 'print the pairings of the next round')
+    pairing.add_argument('--mode', default = tournament.GREEDY_PAIRING,
+        choices = [tournament.GREEDY_PAIRING, tournament.OPTIMAL_PAIRING])
+    pairing.add_argument('--time-budget', type = float,
+        default = tournament.PAIRING_TIME_BUDGET)
+    pairing.add_argument('--byes', type = int,
+        help = 'number of bye games to hand out (default: one for an odd '
+               'number of players)')
+    pairing.add_argument('--format', default = 'csv', choices = ['csv', 'json'])
+    pairing.set_defaults(run = pair)
+
+    args = parser.parse_args(argv)
+    if getattr(args, 'run', None) is None:
+        parser.error('choose an operation to run')
+    # A single connection, the warm-up hands it over to the operation
+    pool = tournament.TournamentPool(args.dsn, 1)
+    tournament.setBackend(pool)
+    if args.warmup:
+        thread = threading.Thread(target = warmup, args = (pool, ))
+        thread.daemon = True
+        thread.start()
+    try:
+        args.run(args)
+    except ValueError as error:
+        parser.exit(1, '%s: error: %s\n' % (parser.prog, error))
+    finally:
+        pool.closeall()
+
+
+if __name__ == '__main__':
+    main()
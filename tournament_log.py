@@ -0,0 +1,706 @@
+#!/usr/bin/env python
+#
+# tournament_log.py -- write-ahead log and snapshots of tournament events
+#
+# A LoggedBackend appends every tournament, registration and round of results
+# to a local log before (or, for registrations, right after) writing them to
+# its backend, and keeps a compact binary snapshot of the register state up
+# to date. When the database is slow or down, no reported result is lost:
+#
+#   log = tournament_log.EventLog('events.log')
+#   backend = tournament_log.LoggedBackend(tournament.getDefaultPool(), log,
+#       'register.snapshot')
+#   tournament.setBackend(backend)
+#
+# The backend records which logged events the database confirmed, and
+# replayPending() writes the others to it once it is back. recover() rebuilds
+# the tournaments in memory from the snapshot and the events logged after it,
+# and replay() writes logged events to any backend, e.g. to a new database.
+#
+
+# used for the log records and the binary snapshots
+import array
+import json
+import os
+import struct
+import sys
+
+# used for guarding the log shared between threads
+import threading
+
+import tournament_memory
+
+# Event kinds of the log
+TOURNAMENT = 'tournament'
+PLAYERS = 'players'
+MATCHES = 'matches'
+DELETE_MATCHES = 'delete_matches'
+DELETE_PLAYERS = 'delete_players'
+ARCHIVE_TOURNAMENT = 'archive_tournament'
+
+# Number of events between two snapshots of a LoggedBackend
+SNAPSHOT_INTERVAL = 1000
+
+# Snapshot file layout: header, then for every tournament, live ones first and
+# archived ones after them, a tournament header followed by arrays of 32-bit
+# little-endian integers and UTF-8 names.
+SNAPSHOT_MAGIC = b'TSNAP002'
+_HEADER = struct.Struct('<8sQIiiI')
+_TOURNAMENT = struct.Struct('<iIII')
+
+
+class EventLog(object):
+    """Append-only log of tournament events, one JSON list per line.
+
+    Events are numbered from 0 in the order they were appended, their
+    position. A last line that was cut short by a crash is ignored, and cut
+    off when the log is opened again so that new events start on a line of
+    their own.
+    """
+
+    def __init__(self, path, sync = True):
+        """Opens the log at path, creating it if needed.
+
+        Arg:
+          path: file name of the log
+          sync: if True, the default, every event is flushed to disk with
+                fsync() before append() returns. Otherwise it is only handed
+                to the operating system, and a crash of the machine can lose
+                events whose writes were already acknowledged.
+        """
+        self.path = path
+        self.sync = sync
+        self._lock = threading.Lock()
+        self._length = 0
+        end = 0
+        for line in self._records():
+            self._length += 1
+            end += len(line)
+        if os.path.exists(path) and os.path.getsize(path) > end:
+            # Drop the torn write of the last event
+            with open(path, 'r+b') as log:
+                log.truncate(end)
+        self._file = open(path, 'ab')
+
+    def __len__(self):
+        return self._length
+
+    def append(self, event):
+        """Appends an event and returns its position."""
+        line = (json.dumps(event, separators = (',', ':')) + '\n')
+        if not isinstance(line, bytes):
+            line = line.encode('utf-8')
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+            self._length += 1
+            return self._length - 1
+
+    def _records(self):
+        """Yields the complete lines of the log."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as log:
+            for line in log:
+                if not line.endswith(b'\n'):
+                    # Torn write of the last event
+                    break
+                yield line
+
+    def events(self, start = 0):
+        """Yields (position, event) for the events from position start on."""
+        for position, line in enumerate(self._records()):
+            if position >= start:
+                yield position, json.loads(line.decode('utf-8'))
+
+    def close(self):
+        self._file.close()
+
+
+class Confirmations(object):
+    """Positions of the logged events a backend has applied, kept in a file.
+
+    The file holds position, the number of events from the start of the log
+    that were all confirmed, and the positions confirmed after the first one
+    that was not, as sessions running at the same time confirm their events
+    out of order. It is replaced atomically on every confirmation.
+    """
+
+    def __init__(self, path, sync = True):
+        """Reads the confirmations at path, if the file exists.
+
+        Arg:
+          path: file name of the confirmations
+          sync: if True, the file is flushed to disk with fsync() before
+                confirm() returns
+        """
+        self.path = path
+        self.sync = sync
+        self.position = 0
+        self._after = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'rb') as confirmations:
+                saved = json.loads(confirmations.read().decode('utf-8'))
+            self.position = saved['position']
+            self._after = set(saved['after'])
+
+    def __contains__(self, position):
+        return position < self.position or position in self._after
+
+    def confirm(self, position):
+        """Records that the backend has applied the event at position."""
+        with self._lock:
+            if position in self:
+                return
+            self._after.add(position)
+            while self.position in self._after:
+                self._after.remove(self.position)
+                self.position += 1
+            data = json.dumps({'position': self.position,
+                'after': sorted(self._after)})
+            temporary = self.path + '.tmp'
+            with open(temporary, 'wb') as confirmations:
+                confirmations.write(data.encode('utf-8'))
+                confirmations.flush()
+                if self.sync:
+                    os.fsync(confirmations.fileno())
+            os.rename(temporary, self.path)
+
+
+def checkEvent(state, event):
+    """Raises ValueError if a logged event cannot be applied to a
+    TournamentState, e.g. results of a tournament or of players the state
+    does not know because they were created before logging started."""
+    kind = event[0]
+    if kind in (TOURNAMENT, DELETE_PLAYERS):
+        return
+    if kind not in (PLAYERS, MATCHES, DELETE_MATCHES, ARCHIVE_TOURNAMENT):
+        raise ValueError("unknown event %r" % (kind, ))
+    if event[1] not in state.tournaments:
+        raise ValueError("unknown tournament %r" % (event[1], ))
+    if kind == ARCHIVE_TOURNAMENT and event[1] == 1:
+        raise ValueError("the default tournament cannot be archived")
+    if kind == MATCHES:
+        unknown = set(player_id for result in event[2]
+            for player_id in result[:2]) - set(state.players)
+        if unknown:
+            raise ValueError("unknown players %r" % (sorted(unknown), ))
+
+
+def applyEvent(state, event):
+    """Applies a logged event to a TournamentState, keeping the logged ids."""
+    kind = event[0]
+    if kind == TOURNAMENT:
+        state.restoreTournament(event[1], event[2])
+    elif kind == PLAYERS:
+        # Players logged without ids were not registered by the backend yet
+        state.restorePlayers([player for player in event[2]
+            if player[0] is not None], event[1])
+    elif kind == MATCHES:
+        state.reportMatches(event[2], event[1])
+    elif kind == DELETE_MATCHES:
+        state.deleteMatches(event[1])
+    elif kind == DELETE_PLAYERS:
+        state.deletePlayers()
+    elif kind == ARCHIVE_TOURNAMENT:
+        state.archiveTournament(event[1])
+    else:
+        raise ValueError("unknown event %r" % (kind, ))
+
+
+def replay(events, session, player_ids = None, tournament_ids = None,
+           existing = False):
+    """Writes logged events to a session of any backend.
+
+    The backend assigns its own ids to the tournaments and players created,
+    results are translated to them. Consecutive registrations and results of
+    a tournament are written with one registerPlayers() or reportMatches()
+    call each. Events of tournaments and results of players that were not
+    created by the replayed events, or by the earlier replay, are skipped.
+
+    Args:
+      events: iterable of events or (position, event) tuples, such as
+              EventLog.events()
+      session: session of a backend, e.g. TournamentPool.session()
+      player_ids, tournament_ids: dictionaries of logged and backend ids of
+              an earlier replay to continue, updated in place
+      existing: if True, tournaments and players missing from the
+              dictionaries already exist in the backend under their logged
+              ids, as when replaying the events a LoggedBackend's own
+              backend missed. See LoggedBackend.replayPending().
+
+    Returns:
+      A tuple (player_ids, tournament_ids) of the dictionaries of logged ids
+      and backend ids. Tournament 1 is the default tournament of both.
+    """
+    player_ids = {} if player_ids is None else player_ids
+    tournament_ids = {1: 1} if tournament_ids is None else tournament_ids
+    pending = []
+
+    def backendId(ids, logged_id):
+        """Returns the backend id of a logged id, None if it is unknown."""
+        if logged_id in ids:
+            return ids[logged_id]
+        return logged_id if existing else None
+
+    def flush():
+        if not pending:
+            return
+        kind, tournament_id = pending[0][:2]
+        batch = [item for event in pending for item in event[2]]
+        del pending[:]
+        tournament_id = backendId(tournament_ids, tournament_id)
+        if tournament_id is None:
+            return
+        if kind == PLAYERS:
+            assigned = session.registerPlayers([name for (_, name) in batch],
+                tournament_id)
+            for (logged_id, _), backend_id in zip(batch, assigned):
+                if logged_id is not None:
+                    player_ids[logged_id] = backend_id
+        else:
+            results = [(backendId(player_ids, winner),
+                backendId(player_ids, loser), tied)
+                for (winner, loser, tied) in batch]
+            results = [result for result in results
+                if None not in result[:2]]
+            if results:
+                session.reportMatches(results, tournament_id)
+
+    for event in events:
+        if isinstance(event, tuple):
+            event = event[1]
+        kind = event[0]
+        if kind in (PLAYERS, MATCHES):
+            if pending and pending[0][:2] != event[:2]:
+                flush()
+            pending.append(event)
+            continue
+        flush()
+        if kind == TOURNAMENT:
+            tournament_ids[event[1]] = session.createTournament(event[2])
+        elif kind in (DELETE_MATCHES, ARCHIVE_TOURNAMENT) and \
+                backendId(tournament_ids, event[1]) is None:
+            continue
+        elif kind == DELETE_MATCHES:
+            session.deleteMatches(backendId(tournament_ids, event[1]))
+        elif kind == DELETE_PLAYERS:
+            session.deletePlayers()
+        elif kind == ARCHIVE_TOURNAMENT:
+            session.archiveTournament(backendId(tournament_ids, event[1]))
+        else:
+            raise ValueError("unknown event %r" % (kind, ))
+    flush()
+    return player_ids, tournament_ids
+
+
+def _toBytes(values):
+    """Returns the bytes of a list of ints as 32-bit little-endian values."""
+    values = array.array('i', values)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tobytes() if hasattr(values, 'tobytes') else \
+        values.tostring()
+
+
+def _fromBytes(data):
+    """Returns the array of 32-bit little-endian ints stored in data."""
+    values = array.array('i')
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def _encodeNames(names):
+    """Returns the lengths and the joined UTF-8 bytes of names."""
+    encoded = [name.encode('utf-8') if not isinstance(name, bytes) else name
+        for name in names]
+    return [len(name) for name in encoded], b''.join(encoded)
+
+
+def _decodeNames(lengths, data):
+    """Returns the names stored by _encodeNames()."""
+    names = []
+    offset = 0
+    for length in lengths:
+        names.append(data[offset:offset + length].decode('utf-8'))
+        offset += length
+    return names
+
+
+def _packTournament(tournament_id, title, players, matches):
+    """Returns the bytes of a tournament in a snapshot.
+
+    Args:
+      tournament_id, title: id and name of the tournament
+      players: list of (player_id, name, wins, points, byes, matches) tuples
+      matches: list of (winner, loser, tied) tuples
+    """
+    if not isinstance(title, bytes):
+        title = title.encode('utf-8')
+    chunks = [_TOURNAMENT.pack(tournament_id, len(title), len(players),
+        len(matches)), title]
+    for column in (0, 2, 3, 4, 5):
+        chunks.append(_toBytes([player[column] for player in players]))
+    lengths, names = _encodeNames([player[1] for player in players])
+    chunks.append(_toBytes(lengths))
+    chunks.append(struct.pack('<I', len(names)))
+    chunks.append(names)
+    chunks.append(_toBytes([match[0] for match in matches]))
+    chunks.append(_toBytes([match[1] for match in matches]))
+    chunks.append(_toBytes([int(match[2]) for match in matches]))
+    return b''.join(chunks)
+
+
+def _unpackTournament(data, offset, path):
+    """Reads a tournament written by _packTournament() at offset.
+
+    Returns:
+      A tuple (tournament_id, title, players, matches, offset) with the
+      arguments of _packTournament() and the offset after the tournament.
+    """
+    def take(size):
+        chunk = data[offset:offset + size]
+        if len(chunk) != size:
+            raise ValueError("%s is truncated" % (path, ))
+        return chunk
+
+    if len(data) < offset + _TOURNAMENT.size:
+        raise ValueError("%s is truncated" % (path, ))
+    (tournament_id, title_length, count,
+     match_count) = _TOURNAMENT.unpack_from(data, offset)
+    offset += _TOURNAMENT.size
+    title = take(title_length).decode('utf-8')
+    offset += title_length
+    columns = []
+    for _ in range(6):
+        columns.append(_fromBytes(take(4 * count)))
+        offset += 4 * count
+    player_ids, wins, points, byes, played, lengths = columns
+    (names_length, ) = struct.unpack_from('<I', take(4))
+    offset += 4
+    names = _decodeNames(lengths, take(names_length))
+    offset += names_length
+    match_columns = []
+    for _ in range(3):
+        match_columns.append(_fromBytes(take(4 * match_count)))
+        offset += 4 * match_count
+    players = list(zip(player_ids, names, wins, points, byes, played))
+    matches = [(winner, loser, bool(tied))
+        for (winner, loser, tied) in zip(*match_columns)]
+    return tournament_id, title, players, matches, offset
+
+
+def writeSnapshot(state, path, position):
+    """Writes the register state of a TournamentState to a binary file.
+
+    For every tournament the snapshot holds its players with their wins,
+    points, byes and matches played, and its matches. Archived tournaments
+    are saved with their final standings. The file is replaced atomically.
+
+    Args:
+      state: TournamentState to save
+      path: file name of the snapshot
+      position: number of log events the state includes
+    """
+    chunks = [_HEADER.pack(SNAPSHOT_MAGIC, position, len(state.tournaments),
+        state._next_player_id, state._next_tournament_id,
+        len(state.archived))]
+    for tournament_id in sorted(state.tournaments):
+        register = state.register[tournament_id]
+        players = [(player_id, state.players.get(player_id, u''))
+            + tuple(register[player_id][column] for column in
+                (tournament_memory.WINS, tournament_memory.POINTS,
+                 tournament_memory.BYES, tournament_memory.MATCHES))
+            for player_id in sorted(register)]
+        chunks.append(_packTournament(tournament_id,
+            state.tournaments[tournament_id], players,
+            state.matches[tournament_id]))
+    for tournament_id in sorted(state.archived):
+        title, standings, matches = state.archived[tournament_id]
+        # Standings rows are (id, name, wins, matches, byes, points), kept in
+        # ranking order
+        players = [(player_id, name or u'', wins, points, byes, played)
+            for (player_id, name, wins, played, byes, points) in standings]
+        chunks.append(_packTournament(tournament_id, title, players, matches))
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as snapshot:
+        snapshot.write(b''.join(chunks))
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+    os.rename(temporary, path)
+
+
+def readSnapshot(path):
+    """Returns (state, position) of a snapshot written by writeSnapshot()."""
+    with open(path, 'rb') as snapshot:
+        data = snapshot.read()
+    if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC or \
+            len(data) < _HEADER.size:
+        raise ValueError("%s is not a tournament snapshot" % (path, ))
+    (_, position, tournaments, next_player_id, next_tournament_id,
+     archived) = _HEADER.unpack_from(data, 0)
+    offset = _HEADER.size
+
+    state = tournament_memory.TournamentState()
+    for _ in range(tournaments):
+        (tournament_id, title, players, matches,
+         offset) = _unpackTournament(data, offset, path)
+        state.restoreTournament(tournament_id, title)
+        state.restorePlayers([player[:2] for player in players],
+            tournament_id)
+        register = state.register[tournament_id]
+        for (player_id, _, wins, points, byes, played) in players:
+            register[player_id] = [wins, points, byes, played]
+        opponents = state.opponents[tournament_id]
+        state.matches[tournament_id] = matches
+        for winner, loser, tied in matches:
+            opponents.setdefault(winner, set()).add(loser)
+            opponents.setdefault(loser, set()).add(winner)
+    for _ in range(archived):
+        (tournament_id, title, players, matches,
+         offset) = _unpackTournament(data, offset, path)
+        state.archived[tournament_id] = (title, [(player_id, name, wins,
+            played, byes, points) for (player_id, name, wins, points, byes,
+            played) in players], matches)
+    state._next_player_id = max(state._next_player_id, next_player_id)
+    state._next_tournament_id = max(state._next_tournament_id,
+        next_tournament_id)
+    return state, position
+
+
+def recover(log, snapshot_path = None):
+    """Rebuilds the tournaments of a log in memory.
+
+    Args:
+      log: EventLog to recover
+      snapshot_path: snapshot written for this log, if any. Only the events
+                     logged after it are applied.
+
+    Returns:
+      A tuple (state, position) of the TournamentState and the number of log
+      events it includes. Events that checkEvent() rejects, e.g. logged by a
+      LoggedBackend without a snapshot_path, are skipped.
+    """
+    if snapshot_path is not None and os.path.exists(snapshot_path):
+        state, position = readSnapshot(snapshot_path)
+    else:
+        state, position = tournament_memory.TournamentState(), 0
+    for position, event in log.events(position):
+        position += 1
+        try:
+            checkEvent(state, event)
+        except ValueError:
+            continue
+        applyEvent(state, event)
+    return state, position
+
+
+class LoggedBackend(object):
+    """Storage backend logging the writes of another backend.
+
+    Results and deletions are logged before they are written to the backend,
+    so they can be replayed if the write fails. Tournaments and players are
+    logged once the backend has assigned their ids, archived tournaments once
+    the backend has archived them. Players whose registration fails are
+    logged without ids.
+    Every event the backend has applied is recorded in Confirmations, by
+    default in a file next to the log, and replayPending() writes the other
+    events to the backend once it is back. A crash after the backend applied
+    a write but before it was confirmed makes replayPending() apply it twice.
+    The log is only safe against crashes of the machine if it was opened
+    with sync, as EventLog is by default. With a snapshot_path, the backend
+    also keeps the logged state in memory and writes it to a snapshot every
+    snapshot_interval events. Writes are then checked against that state
+    first: ones checkEvent() rejects, such as results of a tournament created
+    before logging started, raise ValueError and are neither logged nor
+    passed on to the backend.
+    """
+
+    def __init__(self, backend, log, snapshot_path = None,
+                 snapshot_interval = SNAPSHOT_INTERVAL, confirmed_path = None):
+        self.backend = backend
+        self.log = log
+        if confirmed_path is None:
+            confirmed_path = log.path + '.confirmed'
+        self.confirmed = Confirmations(confirmed_path, log.sync)
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.lock = threading.RLock()
+        self.state = None
+        self._snapshot_position = 0
+        if snapshot_path is not None:
+            self.state, self._snapshot_position = recover(log, snapshot_path)
+
+    def session(self, timeout = None):
+        """Returns a LoggedSession on a session of the logged backend."""
+        return LoggedSession(self, timeout)
+
+    def closeall(self):
+        self.backend.closeall()
+
+    def check(self, event):
+        """Raises ValueError if the in-memory state, if kept, rejects an
+        event. See checkEvent()."""
+        if self.state is not None:
+            with self.lock:
+                checkEvent(self.state, event)
+
+    def record(self, event, confirmed = False):
+        """Logs an event and applies it to the in-memory state, if kept.
+
+        Arg:
+          event: the event to log
+          confirmed: True if the backend has already applied the event
+        """
+        with self.lock:
+            self.check(event)
+            position = self.log.append(event)
+            if self.state is not None:
+                applyEvent(self.state, event)
+                if position + 1 - self._snapshot_position >= \
+                        self.snapshot_interval:
+                    self.snapshot()
+        if confirmed:
+            self.confirmed.confirm(position)
+        return position
+
+    def pending(self):
+        """Yields (position, event) for the logged events the backend has
+        not confirmed."""
+        for position, event in self.log.events(self.confirmed.position):
+            if position in self.confirmed:
+                continue
+            if event[0] in (TOURNAMENT, ARCHIVE_TOURNAMENT) or \
+                    event[0] == PLAYERS and event[2] and \
+                    event[2][0][0] is not None:
+                # Only logged once the backend had applied them
+                continue
+            yield position, event
+
+    def replayPending(self):
+        """Writes the logged events the backend has not confirmed to it.
+
+        The events are replayed one at a time, in the order they were
+        logged, and each is confirmed once the backend has applied it. The
+        players whose registration failed are logged again with the ids the
+        backend assigns now. If a write fails, the remaining events stay
+        pending and the error is raised.
+
+        Returns:
+          The number of events replayed.
+        """
+        replayed = 0
+        with self.backend.session() as session:
+            for position, event in self.pending():
+                if event[0] == PLAYERS:
+                    names = [name for (_, name) in event[2]]
+                    player_ids = session.registerPlayers(names, event[1])
+                    self.record([PLAYERS, event[1], [[player_id, name]
+                        for (player_id, name) in zip(player_ids, names)]],
+                        True)
+                else:
+                    replay([event], session, existing = True)
+                self.confirmed.confirm(position)
+                replayed += 1
+        return replayed
+
+    def snapshot(self):
+        """Writes a snapshot of the in-memory state now."""
+        with self.lock:
+            writeSnapshot(self.state, self.snapshot_path, len(self.log))
+            self._snapshot_position = len(self.log)
+
+
+class LoggedSession(object):
+    """Session of a LoggedBackend. Writes are logged, everything else is
+    passed on to the session of the logged backend.
+
+    The session of the logged backend, and with it e.g. a database
+    connection, is only opened on first use, after the write that needs it
+    has been logged. A result is thus logged even if no connection can be
+    opened.
+    """
+
+    def __init__(self, backend, timeout = None):
+        self.backend = backend
+        self.timeout = timeout
+        self._session = None
+
+    @property
+    def session(self):
+        """The session of the logged backend, opened on first use."""
+        if self._session is None:
+            self._session = self.backend.backend.session(self.timeout)
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def createTournament(self, name):
+        tournament_id = self.session.createTournament(name)
+        self.backend.record([TOURNAMENT, tournament_id, name], True)
+        return tournament_id
+
+    def registerPlayer(self, name, tournament_id = 1):
+        return self.registerPlayers([name], tournament_id)[0]
+
+    def registerPlayers(self, names, tournament_id = 1):
+        names = list(names)
+        # The ids are logged once assigned, check the tournament before that
+        self.backend.check([PLAYERS, tournament_id, []])
+        try:
+            player_ids = self.session.registerPlayers(names, tournament_id)
+        except Exception:
+            # Log the players without ids, they are registered when the
+            # pending events are replayed
+            self.backend.record([PLAYERS, tournament_id,
+                [[None, name] for name in names]])
+            raise
+        self.backend.record([PLAYERS, tournament_id,
+            [[player_id, name] for (player_id, name) in zip(player_ids, names)]],
+            True)
+        return player_ids
+
+    def reportMatch(self, winner, loser, tied = False, tournament_id = 1):
+        self.reportMatches([(winner, loser, tied)], tournament_id)
+
+    def reportMatches(self, results, tournament_id = 1):
+        results = [[winner, loser, bool(tied)]
+            for (winner, loser, tied) in results]
+        position = self.backend.record([MATCHES, tournament_id, results])
+        self.session.reportMatches(results, tournament_id)
+        self.backend.confirmed.confirm(position)
+
+    def deleteMatches(self, tournament_id = 1):
+        position = self.backend.record([DELETE_MATCHES, tournament_id])
+        self.session.deleteMatches(tournament_id)
+        self.backend.confirmed.confirm(position)
+
+    def deletePlayers(self):
+        position = self.backend.record([DELETE_PLAYERS])
+        self.session.deletePlayers()
+        self.backend.confirmed.confirm(position)
+
+    def archiveTournament(self, tournament_id):
+        self.backend.check([ARCHIVE_TOURNAMENT, tournament_id])
+        self.session.archiveTournament(tournament_id)
+        self.backend.record([ARCHIVE_TOURNAMENT, tournament_id], True)
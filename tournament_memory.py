@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+#
+# tournament_memory.py -- in-memory storage backend for tournament.py
+#
+# Keeps players, registrations and opponents in Python structures instead of
+# PostgreSQL, which is useful to simulate tournaments or to run the tests
+# without a database server:
+#
+#   import tournament, tournament_memory
+#   tournament.setBackend(tournament_memory.MemoryBackend())
+#
+
+# used for guarding the state shared between threads
+import threading
+
+# used for the opponents_table dictionary returned by getOpponents()
+from collections import defaultdict
+
+import tournament
+
+# Columns of a register row: [wins, points, byes, matches]
+WINS, POINTS, BYES, MATCHES = range(4)
+
+
+class TournamentState(object):
+    """All tournament data of the in-memory backend.
+
+    The operations take the same arguments and return the same results as
+    the module level functions in tournament.py of the same name, refer to
+    those for documentation.
+    """
+
+    def __init__(self):
+        # player_id -> name
+        self.players = {}
+        # tournament_id -> name, with the default 'Tournament 1'
+        self.tournaments = {1: 'Tournament 1'}
+        # tournament_id -> {player_id: [wins, points, byes, matches]}
+        self.register = {1: {}}
+        # tournament_id -> {player_id: set of opponent ids}
+        self.opponents = {1: {}}
+        # tournament_id -> list of (winner, loser, tied) matches
+        self.matches = {1: []}
+        # archived tournament_id -> (name, final standings() rows, matches)
+        self.archived = {}
+        self._next_player_id = 1
+        self._next_tournament_id = 2
+
+    def _tournament(self, tournament_id):
+        """Returns the register of a tournament, checking that it exists."""
+        try:
+            return self.register[tournament_id]
+        except KeyError:
+            raise ValueError("unknown tournament %r" % (tournament_id, ))
+
+    def createTournament(self, name):
+        tournament_id = self._next_tournament_id
+        self._next_tournament_id += 1
+        self.tournaments[tournament_id] = name
+        self.register[tournament_id] = {}
+        self.opponents[tournament_id] = {}
+        self.matches[tournament_id] = []
+        return tournament_id
+
+    def restoreTournament(self, tournament_id, name):
+        """Adds a tournament with a given id, e.g. when recovering a log."""
+        self.tournaments[tournament_id] = name
+        self.register.setdefault(tournament_id, {})
+        self.opponents.setdefault(tournament_id, {})
+        self.matches.setdefault(tournament_id, [])
+        self._next_tournament_id = max(self._next_tournament_id,
+            tournament_id + 1)
+
+    def restorePlayers(self, players, tournament_id = 1):
+        """Registers players with given ids, e.g. when recovering a log.
+
+        Arg:
+          players: iterable of (player_id, name) tuples
+          tournament_id: tournament the players are registered in
+        """
+        register = self._tournament(tournament_id)
+        for player_id, name in players:
+            self.players[player_id] = name
+            register[player_id] = [0, 0, 0, 0]
+            self._next_player_id = max(self._next_player_id, player_id + 1)
+
+    def deleteMatches(self, tournament_id = 1):
+        register = self._tournament(tournament_id)
+        self.matches[tournament_id] = []
+        self.opponents[tournament_id] = {}
+        for row in register.values():
+            row[:] = [0, 0, 0, 0]
+
+    def deletePlayers(self):
+        self.players.clear()
+        for tournament_id in self.tournaments:
+            self.register[tournament_id] = {}
+            self.opponents[tournament_id] = {}
+            self.matches[tournament_id] = []
+
+    def archiveTournament(self, tournament_id):
+        if tournament_id == 1:
+            raise ValueError("the default tournament cannot be archived")
+        self._tournament(tournament_id)
+        self.archived[tournament_id] = (self.tournaments.pop(tournament_id),
+            self.standings(tournament_id), self.matches.pop(tournament_id))
+        del self.register[tournament_id]
+        del self.opponents[tournament_id]
+
+    def archivedStandings(self, tournament_id, includeBye = False):
+        columns = 5 if includeBye == True else 4
+        if tournament_id not in self.archived:
+            return []
+        return [row[:columns] for row in self.archived[tournament_id][1]]
+
+    def countPlayers(self, tournament_id = 1):
+        return len(self.register.get(tournament_id, ()))
+
+    def registerPlayer(self, name, tournament_id = 1):
+        return self.registerPlayers([name], tournament_id)[0]
+
+    def registerPlayers(self, names, tournament_id = 1):
+        register = self._tournament(tournament_id)
+        player_ids = []
+        for name in names:
+            player_id = self._next_player_id
+            self._next_player_id += 1
+            self.players[player_id] = name
+            register[player_id] = [0, 0, 0, 0]
+            player_ids.append(player_id)
+        return player_ids
+
+    def standings(self, tournament_id = 1):
+        """Returns (id, name, wins, matches, byes, points) rows in ranking order.
+
+        Players are ordered by points, then by the sum of the points of their
+        opponents, like the standings view in tournament.sql. Players who have
+        not played a match come first among players with equal points.
+        """
+        register = self.register.get(tournament_id, {})
+        opponents = self.opponents.get(tournament_id, {})
+        ranking = []
+        for player_id, row in register.items():
+            played = opponents.get(player_id)
+            if played:
+                opponents_points = sum(register[opponent][POINTS]
+                    for opponent in played if opponent in register)
+                ranking.append(
+                    (-row[POINTS], 1, -opponents_points, player_id))
+            else:
+                ranking.append((-row[POINTS], 0, 0, player_id))
+        ranking.sort()
+        return [(player_id, self.players.get(player_id),
+            register[player_id][WINS], register[player_id][MATCHES],
+            register[player_id][BYES], register[player_id][POINTS])
+            for (_, _, _, player_id) in ranking]
+
+    def playerStandings(self, tournament_id = 1, includeBye = False):
+        columns = 5 if includeBye == True else 4
+        return [row[:columns] for row in self.standings(tournament_id)]
+
+    def iterStandings(self, tournament_id = 1, includeBye = False,
+                      fetch_size = tournament.STANDINGS_FETCH_SIZE):
+        # The rows are computed right away, while the backend's lock is held
+        rows = self.playerStandings(tournament_id, includeBye)
+        return (row for row in rows)
+
+    def standingsPage(self, tournament_id = 1, page = 1,
+                      page_size = tournament.STANDINGS_PAGE_SIZE,
+                      includeBye = False):
+        offset = tournament._pageOffset(page, page_size)
+        return self.playerStandings(tournament_id,
+            includeBye)[offset:offset + page_size]
+
+    def reportMatch(self, winner, loser, tied = False, tournament_id = 1):
+        self.reportMatches([(winner, loser, tied)], tournament_id)
+
+    def reportMatches(self, results, tournament_id = 1):
+        register = self._tournament(tournament_id)
+        opponents = self.opponents[tournament_id]
+        matches, deltas = tournament.tallyResults(results)
+        for (winner, loser, tied) in matches:
+            self.matches[tournament_id].append((winner, loser, tied))
+            opponents.setdefault(winner, set()).add(loser)
+            opponents.setdefault(loser, set()).add(winner)
+            for player_id in (winner, loser):
+                if player_id in register:
+                    register[player_id][MATCHES] += 1
+        for player_id, (points, wins, byes) in deltas.items():
+            if player_id in register:
+                row = register[player_id]
+                row[POINTS] += points
+                row[WINS] += wins
+                row[BYES] += byes
+
+    def getOpponents(self, tournament_id = 1):
+        opponents_table = defaultdict(list)
+        for player_id, opponents in self.opponents.get(tournament_id,
+                {}).items():
+            opponents_table[player_id].extend(opponents)
+        return opponents_table
+
+    def getMatches(self, tournament_id = 1):
+        return list(self.matches.get(tournament_id, ()))
+
+    def getRegister(self, tournament_id = 1):
+        register = self.register.get(tournament_id, {})
+        return [(player_id, register[player_id][POINTS],
+            register[player_id][WINS], register[player_id][BYES])
+            for player_id in sorted(register)]
+
+    def pairAllTournaments(self, tournament_ids, workers = 1,
+                           mode = tournament.GREEDY_PAIRING,
+                           time_budget = tournament.PAIRING_TIME_BUDGET):
+        return tournament.pairTournaments(dict((tournament_id,
+            (self.standings(tournament_id),
+             dict(self.opponents.get(tournament_id, {}))))
+            for tournament_id in tournament_ids), workers, mode, time_budget)
+
+    def swissPairings(self, tournament_id = 1, mode = tournament.GREEDY_PAIRING,
+                      time_budget = tournament.PAIRING_TIME_BUDGET,
+                      byes = None):
+        return tournament.pairStandings(self.standings(tournament_id),
+            self.opponents.get(tournament_id, {}), mode, time_budget, byes)
+
+
+class MemoryBackend(object):
+    """Storage backend keeping a TournamentState in memory.
+
+    Like TournamentPool, it hands out sessions with the tournament operations,
+    see tournament.setBackend(). Operations are serialized with a lock, so a
+    backend can be shared between threads.
+    """
+
+    def __init__(self, state = None):
+        self.state = state if state is not None else TournamentState()
+        self.lock = threading.RLock()
+
+    def session(self, timeout = None):
+        """Returns a MemorySession on the state of this backend."""
+        return MemorySession(self)
+
+    def closeall(self):
+        """Present for compatibility with TournamentPool, does nothing."""
+
+
+class MemorySession(object):
+    """Runs the tournament operations on the state of a MemoryBackend."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def close(self):
+        self.backend = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getattr__(self, name):
+        if self.backend is None:
+            raise ValueError("session is closed")
+        operation = getattr(self.backend.state, name)
+        lock = self.backend.lock
+
+        def locked(*args, **kwargs):
+            with lock:
+                return operation(*args, **kwargs)
+        return locked
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+#
+# tournament_sim.py -- simulation of whole Swiss tournaments in memory
+#
+# Every round of a simulated tournament is paired with the same rules as
+# swissPairings() and its results are drawn from a result model, all on an
+# in-process TournamentState, so thousands of tournaments can be played to
+# tune the pairing rules or forecast the number of rounds an event needs:
+#
+#   result = tournament_sim.simulate(64, 6, 'rated', seed = 1)
+#   summary = tournament_sim.simulateMany(1000, 64, 6, 'rated')
+#
+
+# used for running many simulations in parallel
+import multiprocessing
+import random
+
+import tournament
+import tournament_memory
+
+# Probability of a match between two players ending in a tie
+TIE_RATE = 0.1
+
+# Spread of the playing strength of simulated players, in Elo points
+STRENGTH_DEVIATION = 200.0
+
+
+def randomResults(rng, strengths, player_1, player_2):
+    """Result model where both players are equally likely to win.
+
+    Arg:
+      rng: random.Random instance of the simulation
+      strengths: dictionary of player_id and playing strength
+      player_1, player_2: ids of the paired players
+
+    Returns:
+      A (winner, loser, tied) tuple as taken by reportMatch().
+    """
+    if rng.random() < TIE_RATE:
+        return (player_1, player_2, True)
+    if rng.random() < 0.5:
+        return (player_1, player_2, False)
+    return (player_2, player_1, False)
+
+
+def ratedResults(rng, strengths, player_1, player_2):
+    """Result model where the stronger player is more likely to win.
+
+    The winning chances follow the Elo expectation for the difference of the
+    players' strengths. Arguments and result are those of randomResults().
+    """
+    if rng.random() < TIE_RATE:
+        return (player_1, player_2, True)
+    difference = strengths[player_2] - strengths[player_1]
+    if rng.random() < 1.0 / (1.0 + 10 ** (difference / 400.0)):
+        return (player_1, player_2, False)
+    return (player_2, player_1, False)
+
+
+# Result models simulate() accepts by name
+RESULT_MODELS = {
+    'random': randomResults,
+    'rated': ratedResults,
+}
+
+
+def rankCorrelation(ranking_1, ranking_2):
+    """Returns the Spearman correlation of two rankings of the same players.
+
+    Arg:
+      ranking_1, ranking_2: lists of player ids, best player first
+    """
+    count = len(ranking_1)
+    if count < 2:
+        return 1.0
+    positions = dict((player_id, index)
+        for (index, player_id) in enumerate(ranking_2))
+    squares = sum((index - positions[player_id]) ** 2
+        for (index, player_id) in enumerate(ranking_1))
+    return 1.0 - 6.0 * squares / (count * (count * count - 1))
+
+
+def simulate(players, rounds, result_model = 'random', seed = None,
+             mode = tournament.GREEDY_PAIRING,
+             time_budget = tournament.PAIRING_TIME_BUDGET):
+    """Plays a whole tournament in memory and returns statistics about it.
+
+    Rounds are paired by pairStandings(), with its bye and rematch rules,
+    on a tournament_memory.TournamentState.
+
+    Args:
+      players: number of players
+      rounds: number of rounds played
+      result_model: name in RESULT_MODELS or a function taking the same
+                    arguments as randomResults()
+      seed: seed of the random numbers, the same seed plays the same
+            tournament
+      mode, time_budget: pairing mode, see swissPairings()
+
+    Returns:
+      A dictionary with:
+        rematches: number of pairings of players who had already met
+        byes: dictionary of number of byes and number of players who got
+              that many bye games
+        stability: for each round, the rank correlation of the standings
+                   after that round with the final standings
+        strength_correlation: rank correlation of the final standings with
+                              the ranking by playing strength
+        standings: the final standings, see TournamentState.standings()
+    """
+    if not callable(result_model):
+        result_model = RESULT_MODELS[result_model]
+    rng = random.Random(seed)
+    state = tournament_memory.TournamentState()
+    player_ids = state.registerPlayers(
+        ['Player %d' % number for number in range(players)])
+    strengths = dict((player_id, rng.gauss(0, STRENGTH_DEVIATION))
+        for player_id in player_ids)
+    opponents = state.opponents[1]
+    rematches = 0
+    rankings = []
+    for _ in range(rounds):
+        results = []
+        for (id1, name1, id2, name2) in state.swissPairings(1, mode,
+                time_budget):
+            if id1 == id2:
+                results.append((id1, id1, False))
+                continue
+            if id2 in opponents.get(id1, ()):
+                rematches += 1
+            results.append(result_model(rng, strengths, id1, id2))
+        state.reportMatches(results)
+        rankings.append([row[0] for row in state.standings()])
+    standings = state.standings()
+    byes = {}
+    for row in standings:
+        byes[row[4]] = byes.get(row[4], 0) + 1
+    by_strength = sorted(player_ids,
+        key = lambda player_id: -strengths[player_id])
+    final = rankings[-1] if rankings else player_ids
+    return {
+        'rematches': rematches,
+        'byes': byes,
+        'stability': [rankCorrelation(ranking, final) for ranking in rankings],
+        'strength_correlation': rankCorrelation(final, by_strength),
+        'standings': standings,
+    }
+
+
+def _simulateRun(job):
+    """Plays one tournament of simulateMany() in a worker process."""
+    players, rounds, result_model, seed, mode, time_budget = job
+    result = simulate(players, rounds, result_model, seed, mode, time_budget)
+    # The standings are not aggregated, leave them in the worker
+    del result['standings']
+    return result
+
+
+def simulateMany(runs, players, rounds, result_model = 'random', seed = 0,
+                 workers = None, mode = tournament.GREEDY_PAIRING,
+                 time_budget = tournament.PAIRING_TIME_BUDGET):
+    """Plays many independent tournaments and aggregates their statistics.
+
+    Run number i is simulate() with seed + i, so the summary does not depend
+    on the number of workers.
+
+    Args:
+      runs: number of tournaments to play
+      players, rounds, result_model, mode, time_budget: see simulate()
+      seed: seed of the first run
+      workers: number of processes, None uses one per CPU. A result_model
+               other than a name must be picklable to use more than one.
+
+    Returns:
+      A dictionary with:
+        runs: number of tournaments played
+        rematches: average number of rematches per tournament
+        runs_with_rematches: number of tournaments with any rematch
+        byes: dictionary of number of byes and number of players, over all
+              tournaments, who got that many bye games
+        stability: for each round, the average of simulate()'s stability
+        strength_correlation: average of simulate()'s strength_correlation
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    jobs = [(players, rounds, result_model, seed + run, mode, time_budget)
+        for run in range(runs)]
+    if workers <= 1 or len(jobs) <= 1:
+        results = [_simulateRun(job) for job in jobs]
+    else:
+        processes = multiprocessing.Pool(min(workers, len(jobs)))
+        try:
+            results = processes.map(_simulateRun, jobs,
+                chunksize = max(1, len(jobs) // (4 * workers)))
+        finally:
+            processes.close()
+            processes.join()
+    byes = {}
+    for result in results:
+        for count, players_with_count in result['byes'].items():
+            byes[count] = byes.get(count, 0) + players_with_count
+    runs = max(len(results), 1)
+    return {
+        'runs': len(results),
+        'rematches': sum(result['rematches'] for result in results) /
+            float(runs),
+        'runs_with_rematches': sum(1 for result in results
+            if result['rematches']),
+        'byes': byes,
+        'stability': [sum(result['stability'][index] for result in results) /
+            runs for index in range(rounds if results else 0)],
+        'strength_correlation': sum(result['strength_correlation']
+            for result in results) / runs,
+    }
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+#
+# tournament_stats.py -- timing hooks for the functions in tournament.py
+#
+# When a hook is installed, the public functions of tournament.py, every SQL
+# statement they run and every database connection they open are timed and
+# passed to it. A Stats object collects them into counters and histograms:
+#
+#   stats = tournament_stats.Stats()
+#   tournament_stats.addHook(stats)
+#   tournament.swissPairings()
+#   print stats.snapshot()['query']
+#
+# Without hooks the instrumented functions only check that no hook is
+# installed, so the instrumentation costs next to nothing when unused.
+#
+
+# used for finding the histogram bucket of a timing
+import bisect
+
+# used for keeping the name and docstring of instrumented functions
+import functools
+
+# used for guarding the counters shared between threads
+import threading
+import time
+
+# Kinds of timed events passed to the hooks
+FUNCTION = 'function'
+QUERY = 'query'
+FETCH = 'fetch'
+CONNECT = 'connect'
+
+# Upper bounds in seconds of the histogram buckets, the last bucket holds
+# everything slower
+HISTOGRAM_BOUNDS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0,
+                    5.0)
+
+# Installed hooks. The tuple is replaced rather than changed, so emit() can
+# run without a lock.
+_hooks = ()
+_hooks_lock = threading.Lock()
+
+
+def addHook(hook):
+    """Installs a hook called for every timed event.
+
+    Arg:
+      hook: callable taking (kind, name, seconds, rows):
+        kind: FUNCTION, QUERY, FETCH or CONNECT
+        name: the function name, SQL statement or connection string
+        seconds: time the event took
+        rows: rows returned or written by a statement, otherwise 0
+    """
+    global _hooks
+    with _hooks_lock:
+        _hooks = _hooks + (hook, )
+
+
+def removeHook(hook):
+    """Uninstalls a hook installed with addHook()."""
+    global _hooks
+    with _hooks_lock:
+        hooks = list(_hooks)
+        hooks.remove(hook)
+        _hooks = tuple(hooks)
+
+
+def enabled():
+    """Returns True if any hook is installed."""
+    return bool(_hooks)
+
+
+def emit(kind, name, seconds, rows = 0):
+    """Passes a timed event to every installed hook."""
+    for hook in _hooks:
+        hook(kind, name, seconds, rows)
+
+
+def timed(function):
+    """Decorator passing the time of each call of function to the hooks."""
+    name = function.__name__
+
+    @functools.wraps(function)
+    def instrumented(*args, **kwargs):
+        if not _hooks:
+            return function(*args, **kwargs)
+        start = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            emit(FUNCTION, name, time.time() - start)
+    return instrumented
+
+
+def statementName(sql):
+    """Returns a SQL statement on a single line, used to name its timings."""
+    return ' '.join(sql.split())
+
+
+class Stats(object):
+    """Hook collecting counters and a histogram of timings per event.
+
+    Install it with addHook(). Events are grouped by kind and name.
+    """
+
+    def __init__(self, bounds = HISTOGRAM_BOUNDS):
+        self.bounds = tuple(bounds)
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def __call__(self, kind, name, seconds, rows = 0):
+        with self._lock:
+            entry = self._entries.get((kind, name))
+            if entry is None:
+                # [count, seconds, max_seconds, rows, histogram]
+                entry = [0, 0.0, 0.0, 0, [0] * (len(self.bounds) + 1)]
+                self._entries[(kind, name)] = entry
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            entry[3] += rows
+            entry[4][bisect.bisect_left(self.bounds, seconds)] += 1
+
+    def reset(self):
+        """Forgets all events collected so far."""
+        with self._lock:
+            self._entries = {}
+
+    def snapshot(self):
+        """Returns the collected counters.
+
+        Returns:
+          A dictionary of kind to a dictionary of name to a dictionary with:
+            count: number of events
+            seconds: total time of the events
+            max_seconds: time of the slowest event
+            rows: total rows of the events
+            histogram: list of (bound, count) pairs, the number of events
+                       that took up to bound seconds and more than the
+                       previous bound. The last bound is None.
+        """
+        with self._lock:
+            entries = [(key, list(entry), list(entry[4]))
+                for (key, entry) in self._entries.items()]
+        snapshot = {}
+        for (kind, name), entry, histogram in entries:
+            snapshot.setdefault(kind, {})[name] = {
+                'count': entry[0],
+                'seconds': entry[1],
+                'max_seconds': entry[2],
+                'rows': entry[3],
+                'histogram': list(zip(self.bounds + (None, ), histogram)),
+            }
+        return snapshot
@@ -2,7 +2,20 @@
 #
 # Test cases for tournament.py
 
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
 from tournament import *
+from tournament_memory import MemoryBackend
+from StringIO import StringIO
+import tournament_stats
+import tournament_sim
+import tournament_log
+import tournament_cli
 
 def testDeleteMatches():
     deleteMatches()
@@ -216,7 +229,626 @@ def testNoRematch():
     print "10. No rematch is working properly when pairing players."
 
 
+def testSessionReuse():
+    deleteMatches()
+    deletePlayers()
+    with getBackend().session() as session:
+        p1 = session.registerPlayer("Aragorn")
+        p2 = session.registerPlayer("Boromir")
+        session.reportMatch(p1, p2)
+        standings = session.playerStandings()
+        pairings = session.swissPairings()
+    if standings[0][0] != p1 or standings[0][2] != 1:
+        raise ValueError("Session should see its own reported match.")
+    if len(pairings) != 1:
+        raise ValueError(
+            "For two players, swissPairings should return one pair.")
+    if countPlayers() != 2:
+        raise ValueError("Players registered in a session should be committed.")
+    print "11. A pooled session runs several operations on one connection."
+
+
+def testRegisterPlayers():
+    deleteMatches()
+    deletePlayers()
+    names = ["Ann\tTab", "Bob O'Brien", "Back\\slash", "Dora"]
+    ids = registerPlayers(names)
+    if len(ids) != 4 or countPlayers() != 4:
+        raise ValueError("registerPlayers should register every player.")
+    if ids != sorted(ids):
+        raise ValueError("registerPlayers should return ids in input order.")
+    registered = dict((row[0], row[1]) for row in playerStandings())
+    if [registered[i] for i in ids] != names:
+        raise ValueError("Each returned id should belong to the player "
+                         "registered with that name.")
+    if registerPlayers([]) != []:
+        raise ValueError("Registering no players should return no ids.")
+    print "12. Players can be registered in bulk."
+
+
+def testReportMatchesBatch():
+    names = ["1", "2", "3", "4", "5"]
+    results = [(0, 1, False), (2, 3, True), (4, 4, False), (1, 0, False)]
+    standings_by_name = []
+    for batch in (False, True):
+        deleteMatches()
+        deletePlayers()
+        ids = [registerPlayer(name) for name in names]
+        round_results = [(ids[w], ids[l], t) for (w, l, t) in results]
+        if batch:
+            reportMatches(round_results)
+        else:
+            for (winner, loser, tied) in round_results:
+                reportMatch(winner, loser, tied)
+        standings_by_name.append(
+            sorted(row[1:] for row in playerStandings(1, True)))
+    if standings_by_name[0] != standings_by_name[1]:
+        raise ValueError(
+            "reportMatches should give the same standings as reportMatch.")
+    print "13. A round of results can be reported in one batch."
+
+
+def testOpponentsPointsTiebreak():
+    deleteMatches()
+    deletePlayers()
+    [p1, p2, p3, p4] = registerPlayers(["1", "2", "3", "4"])
+    reportMatches([(p1, p2, False), (p3, p4, False)])
+    reportMatches([(p1, p4, False), (p2, p3, False)])
+    # p2 and p3 both have 3 points, but p2 has played stronger opponents
+    standings = playerStandings()
+    if [row[0] for row in standings] != [p1, p2, p3, p4]:
+        raise ValueError(
+            "Players with equal points should be ranked by opponents points.")
+    for (i, n, w, m) in standings:
+        if m != 2:
+            raise ValueError("Each player should have two matches recorded.")
+    deleteMatches()
+    for (i, n, w, m) in playerStandings():
+        if m != 0:
+            raise ValueError("Deleting matches should reset matches played.")
+    print "14. Standings are kept up to date with the opponents points tie breaker."
+
+
+def testSeparateTournaments():
+    deleteMatches()
+    deletePlayers()
+    other = createTournament("Tournament 2")
+    [p1, p2] = registerPlayers(["1", "2"])
+    [p3, p4] = registerPlayers(["3", "4"], other)
+    reportMatch(p3, p4, False, other)
+    if countPlayers() != 2 or countPlayers(other) != 2:
+        raise ValueError("Players should be counted per tournament.")
+    if set(row[0] for row in playerStandings(other)) != set([p3, p4]):
+        raise ValueError("Standings should only list the tournament's players.")
+    if [row[3] for row in playerStandings()] != [0, 0]:
+        raise ValueError("Matches should only count in their own tournament.")
+    if getOpponents()[p3] or getOpponents(other)[p3] != [p4]:
+        raise ValueError("Opponents should be looked up per tournament.")
+    deleteMatches(other)
+    print "15. Tournaments keep separate standings and opponents."
+
+
+def testOptimalPairing():
+    # Rows are (id, name, wins, matches, byes, points), only 3 and 4 have met
+    standings = [(1, "1", 2, 2, 0, 6), (2, "2", 1, 2, 0, 3),
+                 (3, "3", 1, 2, 0, 3), (4, "4", 0, 2, 0, 0)]
+    opponents = {3: [4], 4: [3]}
+    greedy = pairStandings(standings, opponents)
+    if (3, "3", 4, "4") not in greedy:
+        raise ValueError("Greedy pairing should have paired the rematch.")
+    pairings = pairStandings(standings, opponents, OPTIMAL_PAIRING)
+    if pairings != [(1, "1", 3, "3"), (2, "2", 4, "4")]:
+        raise ValueError("Optimal pairing should avoid the rematch while "
+                         "keeping point differences smallest.")
+    deleteMatches()
+    deletePlayers()
+    [p1, p2, p3, p4] = registerPlayers(["1", "2", "3", "4"])
+    reportMatches([(p1, p2, False), (p3, p4, False)])
+    for (pid1, name1, pid2, name2) in swissPairings(1, OPTIMAL_PAIRING):
+        if set([pid1, pid2]) in (set([p1, p2]), set([p3, p4])):
+            raise ValueError("Optimal swissPairings should avoid rematches.")
+    print "16. Optimal pairing avoids rematches the greedy pairing makes."
+
+
+def testOpponentsUpdates():
+    deleteMatches()
+    deletePlayers()
+    [p1, p2, p3, p4] = registerPlayers(["1", "2", "3", "4"])
+    swissPairings()
+    reportMatch(p1, p2)
+    if getOpponents()[p1] != [p2] or getOpponents()[p2] != [p1]:
+        raise ValueError("Opponents should include the match just reported.")
+    reportMatches([(p3, p4, False), (p1, p3, False)])
+    if set(getOpponents()[p1]) != set([p2, p3]):
+        raise ValueError("Opponents should include a reported round.")
+    deleteMatches()
+    if getOpponents()[p1]:
+        raise ValueError("Opponents should be empty after deleting matches.")
+    print "17. Opponents are up to date after matches are reported or deleted."
+
+
+def testTiebreaks():
+    # Needs NumPy, which only tournament_tiebreaks depends on
+    try:
+        import tournament_tiebreaks
+    except ImportError:
+        print "18. Tie breakers skipped, NumPy is not installed."
+        return
+    deleteMatches()
+    deletePlayers()
+    [p1, p2, p3, p4] = registerPlayers(["1", "2", "3", "4"])
+    reportMatches([(p1, p2, False), (p3, p4, True)])
+    reportMatches([(p1, p3, False), (p2, p4, False)])
+    reportMatches([(p1, p4, False), (p2, p3, True)])
+    results = tournament_tiebreaks.loadResults()
+    order = list(tournament_tiebreaks.standingsOrder(results))
+    if order != [row[0] for row in playerStandings()]:
+        raise ValueError("Tie breakers should give the order of the standings.")
+    tiebreaks = tournament_tiebreaks.computeTiebreaks(results)
+    # p2 played p1 (9 points), p4 (1 point) and p3 (2 points), beating p4
+    # and tying with p3
+    p2_index = list(results.player_ids).index(p2)
+    if tiebreaks['buchholz'][p2_index] != 12:
+        raise ValueError("Buchholz should sum the points of all opponents.")
+    if tiebreaks['median_buchholz'][p2_index] != 2:
+        raise ValueError("Median Buchholz should drop best and worst opponent.")
+    if tiebreaks['sonneborn_berger'][p2_index] != 2:
+        raise ValueError("Sonneborn-Berger should count beaten opponents and "
+                         "half of tied opponents.")
+    print "18. Tie breakers are computed for all players at once."
+
+
+def testPairAllTournaments():
+    deleteMatches()
+    deletePlayers()
+    other = createTournament("Tournament 2")
+    [p1, p2, p3, p4] = registerPlayers(["1", "2", "3", "4"])
+    [p5, p6, p7] = registerPlayers(["5", "6", "7"], other)
+    reportMatches([(p1, p2, False), (p3, p4, True)])
+    reportMatches([(p5, p6, False), (p7, p7, False)], other)
+    expected = {1: swissPairings(), other: swissPairings(other)}
+    for workers in (1, 2):
+        if pairAllTournaments([1, other], workers) != expected:
+            raise ValueError("pairAllTournaments should pair each tournament "
+                             "like swissPairings.")
+    print "19. Many tournaments can be paired at once."
+
+
+def testStreamingStandings():
+    deleteMatches()
+    deletePlayers()
+    ids = registerPlayers(["Player %d" % number for number in range(7)])
+    reportMatches([(ids[0], ids[1], False), (ids[2], ids[3], True),
+                   (ids[4], ids[5], False), (ids[6], ids[6], False)])
+    standings = playerStandings(includeBye=True)
+    if list(iterStandings(includeBye=True, fetch_size=2)) != standings:
+        raise ValueError("iterStandings should yield the playerStandings rows.")
+    pages = [standingsPage(page=page, page_size=3) for page in (1, 2, 3, 4)]
+    if [len(rows) for rows in pages] != [3, 3, 1, 0]:
+        raise ValueError("standingsPage should return at most page_size rows.")
+    if sum(pages, []) != [row[:4] for row in standings]:
+        raise ValueError("Pages should follow the order of the standings.")
+    output = StringIO()
+    if exportStandings(output) != 7:
+        raise ValueError("exportStandings should write every player.")
+    if len(output.getvalue().splitlines()) != 8:
+        raise ValueError("A CSV export should have a header and a line per "
+                         "player.")
+    print "20. Standings can be streamed and read a page at a time."
+
+
+def testInstrumentation():
+    deleteMatches()
+    deletePlayers()
+    registerPlayers(["Player %d" % number for number in range(6)])
+    stats = tournament_stats.Stats()
+    tournament_stats.addHook(stats)
+    try:
+        swissPairings()
+        swissPairings()
+    finally:
+        tournament_stats.removeHook(stats)
+    swissPairings()
+    functions = stats.snapshot()[tournament_stats.FUNCTION]
+    if functions['swissPairings']['count'] != 2:
+        raise ValueError("Each swissPairings() call should be timed once.")
+    if functions['pairStandings']['count'] != 2:
+        raise ValueError("The pairing itself should be timed separately.")
+    if sum(count for (bound, count) in
+           functions['swissPairings']['histogram']) != 2:
+        raise ValueError("The histogram should count every call.")
+    print "21. Functions are timed while a stats hook is installed."
+
+
+def testSimulation():
+    result = tournament_sim.simulate(9, 4, 'rated', seed=5)
+    if result != tournament_sim.simulate(9, 4, 'rated', seed=5):
+        raise ValueError("A simulation should be repeatable with its seed.")
+    if sum(result['byes'].values()) != 9:
+        raise ValueError("Every player should be counted in the byes.")
+    if sum(byes * count for (byes, count) in result['byes'].items()) != 4:
+        raise ValueError("An odd field should have one bye per round.")
+    if max(result['byes']) != 1:
+        raise ValueError("No player should get a second bye before every "
+                         "player had one.")
+    if len(result['stability']) != 4 or result['stability'][-1] != 1.0:
+        raise ValueError("Stability should be given for every round.")
+    summary = tournament_sim.simulateMany(4, 9, 4, seed=5, workers=1)
+    if summary['runs'] != 4 or sum(summary['byes'].values()) != 36:
+        raise ValueError("simulateMany should aggregate every run.")
+    print "22. Whole tournaments can be simulated in memory."
+
+
+def testMultipleByes():
+    deleteMatches()
+    deletePlayers()
+    [p1, p2, p3] = registerPlayers(["1", "2", "3"])
+    # Everybody has had a bye, the next one still goes to a single player
+    reportMatches([(p1, p1, False), (p2, p2, False), (p3, p3, False)])
+    pairings = swissPairings()
+    paired = sorted([pid1 for (pid1, name1, pid2, name2) in pairings] +
+                    [pid2 for (pid1, name1, pid2, name2) in pairings
+                     if pid1 != pid2])
+    if paired != sorted([p1, p2, p3]):
+        raise ValueError("The player given a bye should not be paired again.")
+    [p4, p5, p6] = registerPlayers(["4", "5", "6"])
+    reportMatches([(p1, p2, False), (p3, p4, False), (p5, p6, False)])
+    pairings = swissPairings(byes=2)
+    byes = [pid1 for (pid1, name1, pid2, name2) in pairings if pid1 == pid2]
+    if len(pairings) != 4 or set(byes) != set([p4, p6]):
+        raise ValueError("Two byes should go to the players without byes at "
+                         "the bottom of the standings.")
+    try:
+        swissPairings(byes=1)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("A bye count leaving an odd number of players "
+                         "should be refused.")
+    print "23. Several bye games can be handed out in a round."
+
+
+class UnreachableBackend(object):
+    """Backend whose sessions cannot be opened, like a database that is
+    down."""
+
+    def session(self, timeout=None):
+        raise IOError("the backend cannot be reached")
+
+
+class FlakyBackend(object):
+    """Backend whose sessions cannot be opened while it is down."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.down = False
+
+    def session(self, timeout=None):
+        if self.down:
+            raise IOError("the backend cannot be reached")
+        return self.backend.session(timeout)
+
+
+def testEventLog():
+    deleteMatches()
+    deletePlayers()
+    directory = tempfile.mkdtemp()
+    try:
+        log = tournament_log.EventLog(os.path.join(directory, "events.log"))
+        snapshot = os.path.join(directory, "register.snapshot")
+        backend = tournament_log.LoggedBackend(getBackend(), log, snapshot,
+                                               snapshot_interval=3)
+        with backend.session() as session:
+            other = session.createTournament("Tournament 2")
+            ids = session.registerPlayers(["1", "2", "3", "4", "5"], other)
+            session.reportMatches([(ids[0], ids[1], False),
+                                   (ids[2], ids[3], True),
+                                   (ids[4], ids[4], False)], other)
+            session.reportMatch(ids[0], ids[2], tournament_id=other)
+            standings = session.playerStandings(other, includeBye=True)
+        if not os.path.exists(snapshot):
+            raise ValueError("A snapshot should be written every few events.")
+        for path in (None, snapshot):
+            state, position = tournament_log.recover(log, path)
+            if position != len(log):
+                raise ValueError("Recovery should apply every logged event.")
+            recovered = state.playerStandings(other, includeBye=True)
+            if [row[0] for row in recovered] != [row[0] for row in standings] \
+                    or [row[2:] for row in recovered] != \
+                    [row[2:] for row in standings]:
+                raise ValueError("The recovered standings should be those of "
+                                 "the logged backend.")
+        unreachable = tournament_log.LoggedBackend(UnreachableBackend(), log)
+        with unreachable.session() as session:
+            try:
+                session.reportMatch(ids[1], ids[3], tournament_id=other)
+            except IOError:
+                pass
+        if list(log.events())[-1][1] != \
+                [tournament_log.MATCHES, other, [[ids[1], ids[3], False]]]:
+            raise ValueError("A result should be logged even if the backend "
+                             "cannot be reached.")
+        length = len(log)
+        with backend.session() as session:
+            try:
+                session.reportMatch(ids[0], ids[1], tournament_id=other + 1)
+            except ValueError:
+                pass
+            else:
+                raise ValueError("Results of an unknown tournament should be "
+                                 "refused.")
+        if len(log) != length:
+            raise ValueError("Refused results should not be logged.")
+        # Without a snapshot_path, events are logged unchecked
+        with unreachable.session() as session:
+            try:
+                session.reportMatch(ids[0], 0, tournament_id=other)
+            except IOError:
+                pass
+        state, position = tournament_log.recover(log)
+        if position != len(log) or state.playerStandings(other) != \
+                tournament_log.recover(log, snapshot)[0].playerStandings(other):
+            raise ValueError("Recovery should skip results of unknown "
+                             "players.")
+        with MemoryBackend().session() as session:
+            tournament_log.replay(log.events(), session)
+        log.close()
+        # A crash while appending leaves a torn last line behind
+        with open(log.path, 'ab') as torn:
+            torn.write(b'["matches",')
+        log = tournament_log.EventLog(log.path)
+        log.append([tournament_log.DELETE_MATCHES, other])
+        if len(log) != len(list(log.events())) or \
+                list(log.events())[-1][1] != \
+                [tournament_log.DELETE_MATCHES, other]:
+            raise ValueError("Events appended after a torn write should be "
+                             "read back.")
+        log.close()
+    finally:
+        shutil.rmtree(directory)
+    print "24. Tournaments can be recovered from the event log."
+
+
+def testStandingsCache():
+    cache = StandingsCache(max_rows=5)
+    version = cache.version(1)
+    cache.put(1, False, [(1, "A", 0, 0), (2, "B", 0, 0)], version)
+    if cache.get(1, False) != [(1, "A", 0, 0), (2, "B", 0, 0)]:
+        raise ValueError("Cached standings should be returned.")
+    if cache.get(1, True) is not None:
+        raise ValueError("Standings with byes should be cached separately.")
+    stale = cache.version(2)
+    cache.invalidate(2)
+    cache.put(2, False, [(3, "C", 0, 0)], stale)
+    if cache.get(2, False) is not None:
+        raise ValueError("Standings read before a write should not be cached.")
+    cache.put(3, False, [(4, "D", 0, 0)] * 4, cache.version(3))
+    if cache.get(1, False) is not None or cache.stats()['rows'] != 4:
+        raise ValueError("The least recently used standings should be "
+                         "evicted.")
+    if cache.stats()['hits'] != 1 or cache.stats()['misses'] != 3:
+        raise ValueError("Hits and misses should be counted.")
+    disabled = StandingsCache(max_rows=0)
+    disabled.put(1, False, [(1, "A", 0, 0)], disabled.version(1))
+    if disabled.get(1, False) is not None or \
+            disabled.stats()['misses'] != 0:
+        raise ValueError("A disabled cache should neither cache nor count "
+                         "misses.")
+    deleteMatches()
+    deletePlayers()
+    [p1, p2] = registerPlayers(["1", "2"])
+    playerStandings()
+    p3 = registerPlayer("3")
+    if len(playerStandings()) != 3:
+        raise ValueError("Registering should invalidate the standings.")
+    reportMatch(p3, p1)
+    if playerStandings()[0][0] != p3:
+        raise ValueError("Reporting should invalidate the standings.")
+    deleteMatches()
+    if playerStandings()[0][3] != 0:
+        raise ValueError("Deleting matches should invalidate the standings.")
+    print "25. Standings are cached until the tournament changes."
+
+
+def testArchiveTournament():
+    deleteMatches()
+    deletePlayers()
+    [p1, p2, p3] = registerPlayers(["1", "2", "3"])
+    reportMatches([(p1, p2, False), (p3, p3, False)])
+    deleteMatches()
+    if [row[2:] for row in playerStandings(includeBye=True)] != \
+            [(0, 0, 0)] * 3:
+        raise ValueError("Deleting matches should reset wins, byes and "
+                         "matches played.")
+    if any(row[1:] != (0, 0, 0) for row in getRegister()):
+        raise ValueError("Deleting matches should reset points.")
+    other = createTournament("Tournament 2")
+    ids = registerPlayers(["4", "5", "6"], other)
+    reportMatches([(ids[0], ids[1], False), (ids[2], ids[2], False)], other)
+    standings = playerStandings(other, includeBye=True)
+    archiveTournament(other)
+    if playerStandings(other) or getMatches(other):
+        raise ValueError("An archived tournament should leave the live "
+                         "tables.")
+    deletePlayers()
+    if archivedStandings(other, includeBye=True) != standings:
+        raise ValueError("The final standings should be archived with the "
+                         "names of the players.")
+    try:
+        archiveTournament(1)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("The default tournament should not be archived.")
+    directory = tempfile.mkdtemp()
+    try:
+        log = tournament_log.EventLog(os.path.join(directory, "events.log"))
+        snapshot = os.path.join(directory, "register.snapshot")
+        backend = tournament_log.LoggedBackend(getBackend(), log, snapshot)
+        with backend.session() as session:
+            third = session.createTournament("Tournament 3")
+            ids = session.registerPlayers(["7", "8"], third)
+            session.reportMatch(ids[1], ids[0], tournament_id=third)
+            session.archiveTournament(third)
+        backend.snapshot()
+        state, position = tournament_log.recover(log, snapshot)
+        if state.archivedStandings(third) != archivedStandings(third):
+            raise ValueError("Snapshots should keep archived tournaments.")
+        log.close()
+    finally:
+        shutil.rmtree(directory)
+    print "26. Finished tournaments can be archived."
+
+
+def testCommandLine():
+    code = "import sys, tournament; sys.exit('psycopg2' in sys.modules)"
+    directory = os.path.dirname(os.path.abspath(tournament_cli.__file__))
+    if subprocess.call([sys.executable, "-c", code], cwd=directory) != 0:
+        raise ValueError("Importing tournament should not load the driver.")
+    if tournament_cli.parseResult("3 4 tied") != (3, 4, True) or \
+            tournament_cli.parseResult("4 3") != (4, 3, False):
+        raise ValueError("Result lines should be parsed as reportMatch() "
+                         "arguments.")
+    try:
+        tournament_cli.parseResult("3")
+    except ValueError:
+        pass
+    else:
+        raise ValueError("A result line needs a winner and a loser.")
+    print "27. The driver is only imported when connecting."
+
+
+def testConcurrentReports():
+    deleteMatches()
+    deletePlayers()
+    registerPlayers(["Player %d" % number for number in range(40)])
+    rounds = []
+    for round_number in range(4):
+        results = [(pid1, pid2, (pid1 + round_number) % 5 == 0)
+                   for (pid1, name1, pid2, name2) in swissPairings()]
+        rounds.append(results)
+        # Every table reports its own result at the same time
+        errors = []
+        def report(result):
+            try:
+                reportMatches([result])
+            except Exception as error:
+                errors.append(error)
+        threads = [threading.Thread(target=report, args=(result, ))
+                   for result in results]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise ValueError("Concurrent reports should not fail: %r" %
+                             (errors[0], ))
+    standings = playerStandings(includeBye=True)
+    deleteMatches()
+    for results in rounds:
+        reportMatches(results)
+    if playerStandings(includeBye=True) != standings:
+        raise ValueError("Concurrent reports should give the standings of "
+                         "reporting the rounds one after the other.")
+    print "28. Results of a round can be reported concurrently."
+
+
+def testRegisterTriggers():
+    deleteMatches()
+    deletePlayers()
+    ids = registerPlayers(["Player %d" % number for number in range(15)])
+    # Rounds reported in batches and one by one, with ties, byes and
+    # rematches within a batch and across batches, as the triggers see them
+    for round_number in range(4):
+        results = [(pid1, pid2, (pid1 + pid2 + round_number) % 3 == 0)
+                   for (pid1, name1, pid2, name2) in swissPairings()]
+        if round_number % 2:
+            for (winner, loser, tied) in results:
+                reportMatch(winner, loser, tied)
+        else:
+            reportMatches(results + [(loser, winner, False)
+                          for (winner, loser, tied) in results[:2]])
+    reportMatches([(ids[0], ids[1], True), (ids[1], ids[0], False)])
+    points = dict((row[0], row[1]) for row in getRegister())
+    played = dict((player_id, 0) for player_id in ids)
+    opponents = dict((player_id, set()) for player_id in ids)
+    for (winner, loser, tied) in getMatches():
+        played[winner] += 1
+        played[loser] += 1
+        opponents[winner].add(loser)
+        opponents[loser].add(winner)
+    # Ranked like the standings view: players without matches have no
+    # opponents points, which come first among equal points
+    expected = sorted(ids, key=lambda player_id: (-points[player_id],
+        bool(opponents[player_id]),
+        -sum(points[opponent] for opponent in opponents[player_id]),
+        player_id))
+    standings = playerStandings()
+    if [row[0] for row in standings] != expected:
+        raise ValueError("Opponents points kept by the triggers should be "
+                         "those of the recorded matches.")
+    if any(row[3] != played[row[0]] for row in standings):
+        raise ValueError("Matches played kept by the triggers should count "
+                         "the recorded matches.")
+    print "29. Matches played and opponents points follow the matches."
+
+
+def testReplayPending():
+    deleteMatches()
+    deletePlayers()
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "events.log")
+        snapshot = os.path.join(directory, "register.snapshot")
+        flaky = FlakyBackend(getBackend())
+        backend = tournament_log.LoggedBackend(flaky,
+            tournament_log.EventLog(path), snapshot)
+        with backend.session() as session:
+            ids = session.registerPlayers(["1", "2", "3", "4"])
+            session.reportMatches([(ids[0], ids[1], False)])
+        flaky.down = True
+        with backend.session() as session:
+            for write in (lambda: session.reportMatches(
+                              [(ids[2], ids[3], False)]),
+                          lambda: session.reportMatch(ids[0], ids[2], True),
+                          lambda: session.registerPlayers(["5", "6"])):
+                try:
+                    write()
+                except IOError:
+                    pass
+                else:
+                    raise ValueError("Writes should fail while the backend "
+                                     "is down.")
+        if len(list(backend.pending())) != 3:
+            raise ValueError("Only the failed writes should be pending.")
+        backend.log.close()
+        # Restarted once the backend is back
+        flaky.down = False
+        backend = tournament_log.LoggedBackend(flaky,
+            tournament_log.EventLog(path), snapshot)
+        if backend.replayPending() != 3 or backend.replayPending() != 0:
+            raise ValueError("Every failed write should be replayed once.")
+        if countPlayers() != 6 or len(getMatches()) != 3:
+            raise ValueError("The replayed writes should reach the backend.")
+        points = dict((row[0], row[1]) for row in getRegister())
+        if [points[player_id] for player_id in ids] != [4, 0, 4, 0]:
+            raise ValueError("The replayed results should be those reported.")
+        new_ids = sorted(set(points) - set(ids))
+        with backend.session() as session:
+            session.reportMatch(new_ids[0], new_ids[1])
+        if len(getMatches()) != 4 or list(backend.pending()):
+            raise ValueError("Players registered by the replay should be "
+                             "logged with their ids.")
+        backend.log.close()
+    finally:
+        shutil.rmtree(directory)
+    print "30. Writes made while the backend is down are replayed once."
+
+
 if __name__ == '__main__':
+    if '--memory' in sys.argv:
+        # Run the tests without a database server
+        setBackend(MemoryBackend())
     testDeleteMatches()
     testDelete()
     testCount()
@@ -227,6 +859,26 @@ if __name__ == '__main__':
     testPairings()
     testByeGame()
     testNoRematch()
+    testSessionReuse()
+    testRegisterPlayers()
+    testReportMatchesBatch()
+    testOpponentsPointsTiebreak()
+    testSeparateTournaments()
+    testOptimalPairing()
+    testOpponentsUpdates()
+    testTiebreaks()
+    testPairAllTournaments()
+    testStreamingStandings()
+    testInstrumentation()
+    testSimulation()
+    testMultipleByes()
+    testEventLog()
+    testStandingsCache()
+    testArchiveTournament()
+    testCommandLine()
+    testConcurrentReports()
+    testRegisterTriggers()
+    testReplayPending()
     print "Success!  All tests pass!"
 
 
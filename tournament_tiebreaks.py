@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+#
+# tournament_tiebreaks.py -- tie breakers for large tournaments, using NumPy
+#
+# The results of a tournament are loaded into arrays once, then every tie
+# breaker is computed for all players at the same time:
+#
+#   results = tournament_tiebreaks.loadResults(tournament_id)
+#   tiebreaks = tournament_tiebreaks.computeTiebreaks(results)
+#
+
+import numpy
+
+import tournament
+
+# Lowest match-win percentage counted for an opponent, as in most Swiss
+# systems using opponent match-win percentage
+MIN_MATCH_WIN_PERCENTAGE = 1.0 / 3
+
+
+class TournamentResults(object):
+    """Results of a tournament held in NumPy arrays.
+
+    Attributes:
+      player_ids: registered player ids, sorted
+      points, wins, byes: points, wins and byes of each player in player_ids
+      matches: number of matches played by each player in player_ids
+      winners, losers: for each match, the positions in player_ids of the
+                       winner and the loser
+      tied: for each match, True if the match was a tie
+    """
+
+    def __init__(self, register, matches):
+        """Builds the arrays.
+
+        Args:
+          register: list returned from getRegister()
+          matches: list returned from getMatches(). Matches with players who
+                   are not registered are left out.
+        """
+        register = list(register)
+        matches = list(matches)
+        self.player_ids = numpy.array([row[0] for row in register],
+            dtype = numpy.int64)
+        self.points = numpy.array([row[1] for row in register],
+            dtype = numpy.int64)
+        self.wins = numpy.array([row[2] for row in register],
+            dtype = numpy.int64)
+        self.byes = numpy.array([row[3] for row in register],
+            dtype = numpy.int64)
+        winner_ids = numpy.array([row[0] for row in matches],
+            dtype = numpy.int64)
+        loser_ids = numpy.array([row[1] for row in matches],
+            dtype = numpy.int64)
+        tied = numpy.array([bool(row[2]) for row in matches], dtype = bool)
+        winners = self._positions(winner_ids)
+        losers = self._positions(loser_ids)
+        registered = (winners >= 0) & (losers >= 0)
+        self.winners = winners[registered]
+        self.losers = losers[registered]
+        self.tied = tied[registered]
+        self.matches = (
+            numpy.bincount(self.winners, minlength = len(self.player_ids)) +
+            numpy.bincount(self.losers, minlength = len(self.player_ids)))
+
+    def _positions(self, ids):
+        """Returns the positions of ids in player_ids, -1 where missing."""
+        if len(self.player_ids) == 0:
+            return numpy.full(len(ids), -1, dtype = numpy.int64)
+        positions = numpy.searchsorted(self.player_ids, ids)
+        positions = numpy.minimum(positions, len(self.player_ids) - 1)
+        found = self.player_ids[positions] == ids
+        return numpy.where(found, positions, -1)
+
+
+def loadResults(tournament_id = 1):
+    """Returns the TournamentResults of a tournament.
+
+    The results are read on one session of the configured backend, see
+    tournament.setBackend().
+    """
+    with tournament.getBackend().session() as session:
+        return TournamentResults(session.getRegister(tournament_id),
+            session.getMatches(tournament_id))
+
+
+def _sumPerPlayer(results, players, values):
+    """Returns the sum of values for each player, as floats."""
+    return numpy.bincount(players, weights = values,
+        minlength = len(results.player_ids))
+
+
+def opponentsPoints(results):
+    """Returns the sum of the points of each player's distinct opponents.
+
+    This is the tie breaker of the standings view in tournament.sql. Players
+    who have not played a match get NaN, like NULL in the view.
+    """
+    count = len(results.player_ids)
+    first = numpy.minimum(results.winners, results.losers)
+    second = numpy.maximum(results.winners, results.losers)
+    # A rematch counts the opponent once
+    pairs = numpy.unique(first * count + second)
+    first = pairs // count
+    second = pairs % count
+    points = results.points.astype(float)
+    total = (_sumPerPlayer(results, first, points[second]) +
+             _sumPerPlayer(results, second, points[first]))
+    return numpy.where(results.matches > 0, total, numpy.nan)
+
+
+def buchholz(results):
+    """Returns the sum of the points of each player's opponents, per match."""
+    points = results.points.astype(float)
+    return (_sumPerPlayer(results, results.winners, points[results.losers]) +
+            _sumPerPlayer(results, results.losers, points[results.winners]))
+
+
+def medianBuchholz(results):
+    """Returns the Buchholz score without the best and worst opponent.
+
+    Players who have played fewer than three matches keep their Buchholz
+    score.
+    """
+    count = len(results.player_ids)
+    points = results.points.astype(float)
+    players = numpy.concatenate((results.winners, results.losers))
+    opponents_points = numpy.concatenate(
+        (points[results.losers], points[results.winners]))
+    highest = numpy.full(count, -numpy.inf)
+    lowest = numpy.full(count, numpy.inf)
+    numpy.maximum.at(highest, players, opponents_points)
+    numpy.minimum.at(lowest, players, opponents_points)
+    score = buchholz(results)
+    trimmed = results.matches > 2
+    score[trimmed] -= highest[trimmed] + lowest[trimmed]
+    return score
+
+
+def sonnebornBerger(results):
+    """Returns the points of the opponents each player beat, plus half of the
+    points of the opponents each player tied with."""
+    points = results.points.astype(float)
+    won = ~results.tied
+    tied = results.tied
+    return (
+        _sumPerPlayer(results, results.winners[won],
+            points[results.losers[won]]) +
+        0.5 * _sumPerPlayer(results, results.winners[tied],
+            points[results.losers[tied]]) +
+        0.5 * _sumPerPlayer(results, results.losers[tied],
+            points[results.winners[tied]]))
+
+
+def matchWinPercentage(results):
+    """Returns the share of the available points each player has earned.
+
+    Bye games count as played. Percentages are never lower than
+    MIN_MATCH_WIN_PERCENTAGE.
+    """
+    played = results.matches + results.byes
+    available = numpy.maximum(played, 1) * float(tournament.WIN_POINTS)
+    return numpy.maximum(results.points / available, MIN_MATCH_WIN_PERCENTAGE)
+
+
+def opponentsMatchWinPercentage(results):
+    """Returns the average match-win percentage of each player's opponents,
+    per match. Players who have not played a match get 0."""
+    percentage = matchWinPercentage(results)
+    total = (
+        _sumPerPlayer(results, results.winners, percentage[results.losers]) +
+        _sumPerPlayer(results, results.losers, percentage[results.winners]))
+    return total / numpy.maximum(results.matches, 1)
+
+
+def computeTiebreaks(results):
+    """Returns a dictionary of tie breaker name and array of scores.
+
+    The arrays are parallel to results.player_ids.
+    """
+    return {
+        'opponents_points': opponentsPoints(results),
+        'omw': opponentsMatchWinPercentage(results),
+        'sonneborn_berger': sonnebornBerger(results),
+        'buchholz': buchholz(results),
+        'median_buchholz': medianBuchholz(results),
+    }
+
+
+def standingsOrder(results, opponents_points = None):
+    """Returns the player ids in the order of the standings.
+
+    Players are ranked by points, then by opponents points like the standings
+    view, players who have not played a match coming first among players with
+    equal points. Remaining ties are broken by player id.
+
+    Arg:
+      results: TournamentResults of the tournament
+      opponents_points: result of opponentsPoints(), computed if not given
+    """
+    if opponents_points is None:
+        opponents_points = opponentsPoints(results)
+    played = ~numpy.isnan(opponents_points)
+    order = numpy.lexsort((results.player_ids,
+        -numpy.where(played, opponents_points, 0), played, -results.points))
+    return results.player_ids[order]